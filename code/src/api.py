@@ -1,12 +1,43 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Query, Header, Request
+from typing import Optional, AsyncIterator
+from contextlib import asynccontextmanager
+import asyncio
+import os
+from datetime import datetime
+import zlib
 
-from mongo_client import MongoDBClient
-from fastapi.responses import JSONResponse
-import json
-from bson import json_util
+from mongo_client import get_async_emails_collection, get_async_mongo_client, stop_async_mongo
+from email_queries import (
+    DESCENDING_SORT, EMAIL_INDEXES, build_email_filter, build_projection, decode_cursor, encode_cursor,
+    summarize_email, strip_heavy_fields
+)
+from email_change_feed import EmailChangeFeed, is_valid_event_id
+from response_cache import PageCache, make_etag, etag_matches
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from bson import json_util, ObjectId
 from fastapi.middleware.cors import CORSMiddleware
 
-app = FastAPI()
+# Serialized /fetch_emails/ pages, dropped whenever the change feed reports new data
+change_feed = EmailChangeFeed()
+page_cache = PageCache()
+change_feed.add_listener(page_cache.invalidate)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled async MongoDB client, created on the app's event loop and shared by every request
+    get_async_mongo_client()
+    try:
+        emails_collection = get_async_emails_collection()
+        for keys in EMAIL_INDEXES:
+            await emails_collection.create_index(keys)
+    except Exception as e:
+        print(f"Failed to create email indexes: {str(e)}")
+    change_feed_task = asyncio.create_task(change_feed.run())
+    yield
+    change_feed_task.cancel()
+    stop_async_mongo()
+
+app = FastAPI(lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -19,37 +50,216 @@ app.add_middleware(
 
 # FastAPI Endpoint to Process Emails
 @app.get("/fetch_emails/")
-def fetch_and_process_emails():
+async def fetch_and_process_emails(
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    main_intent: Optional[str] = None,
+    urgency: Optional[str] = None,
+    assignee: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None)
+):
     """
-    Retrieve all records from MongoDB database.
+    Retrieve one page of records from MongoDB database.
+    Pages are cached until stored emails change. Responses carry an ETag, and a matching
+    If-None-Match gets 304 Not Modified without touching the database.
+    Args:
+        limit: Page size
+        cursor: `next_cursor` from the previous page
+        fields: Comma-separated fields to return; embeddings and attachment content are left out by default
+        main_intent: Only emails with this main intent
+        urgency: Only emails with a request detail of this urgency
+        assignee: Only emails with a request detail suggested for this assignee
+        if_none_match: ETag from a previous response
     Returns:
-        JSON response containing all email records sorted by created_at in descending order
+        JSON response containing email records sorted by created_at in descending order,
+        plus `next_cursor` for the following page (null on the last page)
     """
     try:
-        # Initialize MongoDB client
-        mongo_client = MongoDBClient()
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+
+    # Read the version before querying so a concurrent change can only make the ETag stale, never wrong
+    version = change_feed.version
+    cache_key = "&".join(f"{name}={value}" for name, value in [
+        ("limit", limit), ("cursor", cursor), ("fields", fields),
+        ("main_intent", main_intent), ("urgency", urgency), ("assignee", assignee)
+    ] if value is not None)
+    etag = make_etag(version, cache_key)
+    cache_headers = {"ETag": etag, "Cache-Control": "no-cache"}
+
+    # Without a live change feed the version cannot be trusted, so always go to the database
+    cacheable = change_feed.is_live
+
+    if cacheable and etag_matches(if_none_match, etag):
+        page_cache.record_not_modified()
+        return Response(status_code=304, headers=cache_headers)
+
+    body = page_cache.get(version, cache_key) if cacheable else None
+    if body is not None:
+        return Response(content=body, media_type="application/json", headers=cache_headers)
+
+    try:
+        # Get the collection from the shared pooled client
+        emails_collection = get_async_emails_collection()
         
-        if mongo_client.connect():
-            # Get the database and collection
-            db = mongo_client.get_client().get_database('email-triage')
-            emails_collection = db.emails
-            
-            # Fetch all documents, sort by created_at in descending order
-            cursor = emails_collection.find({}).sort("created_at", -1)
-            all_records = json.loads(json_util.dumps(list(cursor)))
-            
-            return JSONResponse(content={"records": all_records})
-        else:
-            return JSONResponse(
-                status_code=500,
-                content={"error": "Failed to connect to MongoDB"}
-            )
+        query = build_email_filter(main_intent=main_intent, urgency=urgency, assignee=assignee, after=after)
+        # Fetch one extra document to know whether another page follows
+        records = await (
+            emails_collection.find(query, build_projection(fields))
+            .sort(DESCENDING_SORT)
+            .limit(limit + 1)
+            .to_list(length=limit + 1)
+        )
+        next_cursor = encode_cursor(records[limit - 1]) if len(records) > limit else None
+        
+        # Serialize once, straight to the response body
+        body = json_util.dumps({"records": records[:limit], "next_cursor": next_cursor})
+        if not cacheable:
+            return Response(content=body, media_type="application/json")
+        page_cache.put(version, cache_key, body)
+        return Response(content=body, media_type="application/json", headers=cache_headers)
             
     except Exception as e:
         return JSONResponse(
             status_code=500,
             content={"error": f"Error retrieving records: {str(e)}"}
         )
-    finally:
-        if mongo_client:
-            mongo_client.close()
\ No newline at end of file
+
+
+async def _ndjson_chunks(cursor, compress: bool, chunk_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+    """Encode documents from a cursor as NDJSON, optionally gzip-compressed, in ~chunk_size pieces."""
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31 writes a gzip header
+    buffer = bytearray()
+    async for doc in cursor:
+        buffer += json_util.dumps(doc).encode("utf-8") + b"\n"
+        if len(buffer) >= chunk_size:
+            yield compressor.compress(bytes(buffer)) if compressor else bytes(buffer)
+            buffer.clear()
+    if compressor:
+        yield compressor.compress(bytes(buffer)) + compressor.flush()
+    elif buffer:
+        yield bytes(buffer)
+
+
+# Streaming export of the full triage history
+@app.get("/export_emails/")
+async def export_emails(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    resume_after: Optional[str] = None,
+    fields: Optional[str] = None,
+    gzip: bool = False,
+    batch_size: int = Query(500, ge=1, le=5000)
+):
+    """
+    Stream stored emails as NDJSON, one document per line, in `_id` order.
+    Args:
+        start: Only emails created at or after this time
+        end: Only emails created before this time
+        resume_after: `_id` of the last line already received; the export continues after it
+        fields: Comma-separated fields to return; embeddings and attachment content are left out by default
+        gzip: Compress the stream
+        batch_size: Documents fetched from MongoDB per round trip
+    Returns:
+        Streaming NDJSON response; memory use does not grow with the collection
+    """
+    if resume_after and not ObjectId.is_valid(resume_after):
+        return JSONResponse(status_code=400, content={"error": f"Invalid resume_after: {resume_after}"})
+
+    try:
+        query = build_email_filter(created_from=start, created_to=end)
+        if resume_after:
+            query = {"$and": [query, {"_id": {"$gt": ObjectId(resume_after)}}]} if query else {"_id": {"$gt": ObjectId(resume_after)}}
+        cursor = (
+            get_async_emails_collection()
+            .find(query, build_projection(fields))
+            .sort("_id", 1)
+            .batch_size(batch_size)
+        )
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"error": f"Error exporting records: {str(e)}"}
+        )
+
+    filename = "emails.ndjson.gz" if gzip else "emails.ndjson"
+    return StreamingResponse(
+        _ndjson_chunks(cursor, compress=gzip),
+        media_type="application/gzip" if gzip else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+def _sse_event(doc, full: bool, event_id: Optional[str]) -> str:
+    """Format a stored email as a server-sent event whose id is the resume token of its insert."""
+    payload = strip_heavy_fields(doc) if full else summarize_email(doc)
+    # An empty id clears the client's last event id: emails found by polling cannot be resumed from
+    return f"id: {event_id or ''}\nevent: email\ndata: {json_util.dumps(payload)}\n\n"
+
+
+# Live push of newly stored emails
+@app.get("/stream_emails/")
+async def stream_emails(
+    request: Request,
+    full: bool = False,
+    last_event_id: Optional[str] = Header(None)
+):
+    """
+    Push each newly stored email as a server-sent event as soon as it is written.
+    Event ids are change stream resume tokens, which follow commit order. Browsers' EventSource
+    resends the last event id on reconnect, and the emails committed after it are replayed before
+    live events resume. Without change streams, events carry no id and nothing is replayed.
+    Args:
+        full: Send whole documents (minus embeddings and attachment content) instead of summaries
+        last_event_id: Id of the last event received, sent as the Last-Event-ID header
+    Returns:
+        text/event-stream response
+    """
+    if last_event_id and not is_valid_event_id(last_event_id):
+        return JSONResponse(status_code=400, content={"error": f"Invalid Last-Event-ID: {last_event_id}"})
+
+    # Subscribe before replaying so nothing stored in between is missed
+    queue = change_feed.subscribe()
+    keepalive_seconds = float(os.getenv("STREAM_KEEPALIVE_SECONDS", "15"))
+
+    async def events() -> AsyncIterator[str]:
+        # Emails sent during replay may also be waiting in the queue
+        replayed = set()
+        try:
+            yield f"retry: {int(keepalive_seconds * 1000)}\n\n"
+            if last_event_id:
+                replay_limit = int(os.getenv("STREAM_REPLAY_LIMIT", "500"))
+                try:
+                    async for event_id, doc in change_feed.replay_since(last_event_id, replay_limit):
+                        replayed.add(doc["_id"])
+                        yield _sse_event(doc, full, event_id)
+                except Exception as e:
+                    # The token fell off the oplog, or change streams are unavailable
+                    print(f"Cannot replay from Last-Event-ID {last_event_id}: {str(e)}")
+                if len(replayed) >= replay_limit:
+                    # More may follow; the client reconnects and continues from the last replayed event
+                    return
+
+            while not await request.is_disconnected():
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout=keepalive_seconds)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if item is None:
+                    # Fell too far behind; the client reconnects and replays from its last event id
+                    return
+                event_id, doc = item
+                if doc["_id"] in replayed:
+                    continue  # Already sent during replay
+                yield _sse_event(doc, full, event_id)
+        finally:
+            change_feed.unsubscribe(queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,142 @@
+"""
+Content-addressed cache of extracted attachment text.
+
+Extracted text is keyed by the SHA-256 of the attachment bytes plus the extractor version, so the
+same PDF form or scanned image costs one hash computation however often it is re-sent, while a
+new PyMuPDF release or OCR backend starts from a clean slate. Entries live in a size-bounded
+SQLite file on local disk, evicted least recently used first.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Any, Optional
+
+DEFAULT_ATTACHMENT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "attachment_cache.sqlite3")
+
+
+def content_digest(data: bytes) -> str:
+    """Hash attachment bytes into their cache key."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class AttachmentCache:
+    def __init__(self, path: Optional[str] = None, max_bytes: Optional[int] = None):
+        """
+        Initialize the cache.
+
+        Args:
+            path (Optional[str]): SQLite file; defaults to ATTACHMENT_CACHE_PATH
+            max_bytes (Optional[int]): Maximum bytes of stored text; defaults to ATTACHMENT_CACHE_MAX_BYTES
+        """
+        self.path = path or os.getenv("ATTACHMENT_CACHE_PATH", DEFAULT_ATTACHMENT_CACHE_PATH)
+        self.max_bytes = max_bytes or int(os.getenv("ATTACHMENT_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS extractions ("
+            "digest TEXT NOT NULL, extractor TEXT NOT NULL, text TEXT NOT NULL, "
+            "size INTEGER NOT NULL, last_access REAL NOT NULL, PRIMARY KEY (digest, extractor))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_extractions_last_access ON extractions(last_access)")
+        self._conn.commit()
+        self._bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM extractions").fetchone()[0]
+
+    def get(self, digest: str, extractor: str) -> Optional[str]:
+        """
+        Look up the text extracted from an attachment.
+
+        Args:
+            digest (str): content_digest() of the attachment bytes
+            extractor (str): Version of the extractor that would be used
+
+        Returns:
+            Optional[str]: Cached text, or None on a miss
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT text FROM extractions WHERE digest = ? AND extractor = ?", (digest, extractor)
+            ).fetchone()
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+            self._conn.execute(
+                "UPDATE extractions SET last_access = ? WHERE digest = ? AND extractor = ?",
+                (time.time(), digest, extractor)
+            )
+            self._conn.commit()
+            self._stats["hits"] += 1
+            return row[0]
+
+    def put(self, digest: str, extractor: str, text: str):
+        """
+        Store the text extracted from an attachment.
+
+        Args:
+            digest (str): content_digest() of the attachment bytes
+            extractor (str): Version of the extractor that produced the text
+            text (str): Extracted text
+        """
+        size = len(text.encode("utf-8"))
+        with self._lock:
+            previous = self._conn.execute(
+                "SELECT size FROM extractions WHERE digest = ? AND extractor = ?", (digest, extractor)
+            ).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO extractions (digest, extractor, text, size, last_access) VALUES (?, ?, ?, ?, ?)",
+                (digest, extractor, text, size, time.time())
+            )
+            self._bytes += size - (previous[0] if previous else 0)
+            if self._bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hit/miss counters, the hit rate and the stored size."""
+        with self._lock:
+            stats = dict(self._stats)
+            lookups = stats["hits"] + stats["misses"]
+            stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+            stats["bytes"] = self._bytes
+            return stats
+
+    def _evict(self):
+        # Drop least recently used entries until the cache is back under 90% of its budget
+        target = int(self.max_bytes * 0.9)
+        rows = self._conn.execute("SELECT digest, extractor, size FROM extractions ORDER BY last_access ASC")
+        evicted = []
+        for digest, extractor, size in rows:
+            if self._bytes <= target:
+                break
+            evicted.append((digest, extractor))
+            self._bytes -= size
+        rows.close()
+        self._conn.executemany("DELETE FROM extractions WHERE digest = ? AND extractor = ?", evicted)
+        self._stats["evictions"] += len(evicted)
+
+
+_shared_cache: Optional[AttachmentCache] = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_attachment_cache() -> Optional[AttachmentCache]:
+    """
+    Get the process-wide attachment cache.
+
+    Returns:
+        Optional[AttachmentCache]: Shared cache, or None when ATTACHMENT_CACHE_ENABLED is false
+    """
+    global _shared_cache
+    if os.getenv("ATTACHMENT_CACHE_ENABLED", "true").lower() == "false":
+        return None
+    if _shared_cache is None:
+        with _shared_cache_lock:
+            if _shared_cache is None:
+                _shared_cache = AttachmentCache()
+    return _shared_cache
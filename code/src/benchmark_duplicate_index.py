@@ -0,0 +1,103 @@
+"""
+Benchmark duplicate index backends for query latency and recall.
+
+Recall@k is measured against exact brute-force cosine search over the same vectors, so the
+local backend is expected to score 1.0 and the Atlas backend shows what its approximate
+`numCandidates` setting costs.
+
+Usage:
+    python benchmark_duplicate_index.py --size 20000 --queries 200
+    python benchmark_duplicate_index.py --source mongo --atlas --num-candidates 5 100
+"""
+
+import argparse
+import statistics
+import tempfile
+import time
+from typing import List, Dict, Any
+
+import numpy as np
+from duplicate_index import LocalDuplicateIndex, AtlasDuplicateIndex
+from mongo_client import get_emails_collection
+
+
+def load_vectors(source: str, size: int, dim: int, seed: int):
+    """Load stored embeddings from MongoDB or generate clustered synthetic ones."""
+    if source == "mongo":
+        docs = list(get_emails_collection().find({"embedding": {"$ne": None}}, {"embedding": 1}))
+        return [str(doc["_id"]) for doc in docs], np.asarray([doc["embedding"] for doc in docs], dtype=np.float32)
+
+    # Clusters of near-identical vectors mimic re-sent and forwarded emails
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, size // 20), dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), size)] + rng.normal(scale=0.05, size=(size, dim)).astype(np.float32)
+    return [f"{i:024x}" for i in range(size)], vectors
+
+
+def exact_top_k(normalized: np.ndarray, query: np.ndarray, k: int) -> List[int]:
+    cosine = normalized @ (query / np.linalg.norm(query))
+    return list(np.argsort(-cosine)[:k])
+
+
+def run(backend, ids: List[str], vectors: np.ndarray, query_rows: List[int], top_k: int) -> Dict[str, Any]:
+    latencies = []
+    recalls = []
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    for row in query_rows:
+        expected = {ids[i] for i in exact_top_k(normalized, vectors[row], top_k)}
+        start = time.perf_counter()
+        results = backend.search(vectors[row].tolist(), top_k=top_k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        recalls.append(len(expected & {str(r["_id"]) for r in results}) / len(expected))
+    latencies.sort()
+    return {
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] if len(latencies) > 1 else latencies[0],
+        "recall": statistics.mean(recalls)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", choices=["synthetic", "mongo"], default="synthetic")
+    parser.add_argument("--size", type=int, default=10000, help="Synthetic corpus size")
+    parser.add_argument("--dim", type=int, default=384, help="Synthetic embedding dimension")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--atlas", action="store_true", help="Also benchmark the Atlas backend (requires --source mongo)")
+    parser.add_argument("--num-candidates", type=int, nargs="+", default=[5, 50, 200])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    ids, vectors = load_vectors(args.source, args.size, args.dim, args.seed)
+    rng = np.random.default_rng(args.seed)
+    query_rows = list(rng.choice(len(ids), size=min(args.queries, len(ids)), replace=False))
+    print(f"Corpus: {len(ids)} vectors, {len(query_rows)} queries, top_k={args.top_k}")
+
+    with tempfile.TemporaryDirectory() as index_dir:
+        start = time.perf_counter()
+        if args.source == "synthetic":
+            local_index = _empty_local_index(index_dir)
+            local_index.bulk_load(list(zip(ids, vectors)))
+        else:
+            # Bootstraps from the stored embeddings
+            local_index = LocalDuplicateIndex(index_dir=index_dir)
+        print(f"local: load {(time.perf_counter() - start):.2f}s")
+        print(f"local: {run(local_index, ids, vectors, query_rows, args.top_k)}")
+
+    if args.atlas:
+        if args.source != "mongo":
+            raise SystemExit("--atlas needs --source mongo so both backends search the same vectors")
+        for num_candidates in args.num_candidates:
+            atlas_index = AtlasDuplicateIndex(num_candidates=num_candidates)
+            print(f"atlas (numCandidates={num_candidates}): {run(atlas_index, ids, vectors, query_rows, args.top_k)}")
+
+
+def _empty_local_index(index_dir: str) -> LocalDuplicateIndex:
+    # An empty snapshot makes the index skip the MongoDB bootstrap on construction
+    np.savez(f"{index_dir}/snapshot.npz", vectors=np.zeros((0, 0), dtype=np.float32), ids=np.array([], dtype=str))
+    return LocalDuplicateIndex(index_dir=index_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark the PyTorch and int8 ONNX embedding backends on the code/test corpus.
+
+Each backend runs in its own subprocess so peak memory is measured separately. The parent
+then compares the two sets of vectors and checks them against ONNX_COSINE_TOLERANCE.
+
+Usage:
+    python benchmark_embeddings.py --repeat 20 --batch-size 32
+"""
+
+import argparse
+import multiprocessing
+import resource
+import time
+from typing import Dict, Any, List
+
+import numpy as np
+from onnx_embeddings import ONNX_COSINE_TOLERANCE
+from sample_corpus import load_sample_emails
+
+
+def build_texts(repeat: int) -> List[str]:
+    """Build the embedding input for each sample email, repeated to get a stable measurement."""
+    from email_embeddings import EmailEmbeddingGenerator
+
+    emails = load_sample_emails()
+    texts = [
+        EmailEmbeddingGenerator.generate_email_text(
+            subject=e["subject"],
+            sender=e["sender"],
+            recipients=e["recipients"],
+            body=e["body"],
+            attachments=e["attachments"]
+        )
+        for e in emails
+    ]
+    return texts * repeat
+
+
+def measure(backend: str, texts: List[str], batch_size: int) -> Dict[str, Any]:
+    """Load one backend and encode the corpus; runs inside a fresh subprocess."""
+    from email_embeddings import get_embedding_model
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    model = get_embedding_model(backend=backend)
+    load_seconds = time.perf_counter() - start
+
+    # Warm up, then time the corpus
+    model.encode(texts[:batch_size], batch_size=batch_size, convert_to_numpy=True)
+    start = time.perf_counter()
+    embeddings = model.encode(texts, batch_size=batch_size, convert_to_numpy=True)
+    encode_seconds = time.perf_counter() - start
+
+    return {
+        "backend": backend,
+        "load_seconds": load_seconds,
+        "texts_per_second": len(texts) / encode_seconds,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "model_rss_mb": (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024,
+        "embeddings": np.asarray(embeddings, dtype=np.float32)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=10, help="Times to repeat the sample corpus")
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    texts = build_texts(args.repeat)
+    print(f"Corpus: {len(texts)} texts ({len(texts) // args.repeat} unique)")
+
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    for backend in ("torch", "onnx"):
+        with context.Pool(1) as pool:
+            results[backend] = pool.apply(measure, (backend, texts, args.batch_size))
+        report = {key: value for key, value in results[backend].items() if key != "embeddings"}
+        print(f"{backend}: {report}")
+
+    torch_vectors = results["torch"]["embeddings"]
+    onnx_vectors = results["onnx"]["embeddings"]
+    cosine = np.sum(torch_vectors * onnx_vectors, axis=1) / (
+        np.linalg.norm(torch_vectors, axis=1) * np.linalg.norm(onnx_vectors, axis=1)
+    )
+    print(f"cosine(torch, onnx): min={cosine.min():.4f} mean={cosine.mean():.4f}")
+    print(f"speedup: {results['onnx']['texts_per_second'] / results['torch']['texts_per_second']:.2f}x")
+    if cosine.min() < 1 - ONNX_COSINE_TOLERANCE:
+        raise SystemExit(f"ONNX vectors exceed the documented cosine tolerance of {ONNX_COSINE_TOLERANCE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Compare the per-message RFC822 fetch with the batched, structure-aware UID fetch against an
+in-memory IMAP stand-in loaded with the code/test corpus.
+
+Both paths are checked to yield the same body and attachment bytes for every message before
+round trips and bytes transferred are reported.
+
+Usage:
+    python benchmark_imap_fetch.py --copies 20 --batch-size 50
+"""
+
+import argparse
+import email
+import os
+import time
+from email import policy
+from typing import Dict, Any, List, Tuple
+
+from imap_fetch import ATTACHMENT_EXTENSIONS, decode_text, fetch_messages, imap_uid_set
+from imap_standin import StandInIMAP, load_sample_mailbox
+
+Extracted = List[Tuple[str, str, bytes]]
+
+
+def legacy_fetch(mail: StandInIMAP) -> List[Extracted]:
+    """The previous EmailMonitor flow: one FETCH (RFC822) and one STORE per unseen message."""
+    _, messages = mail.search(None, "UNSEEN")
+    results = []
+    for email_id in messages[0].split():
+        _, msg_data = mail.fetch(email_id.decode(), "(RFC822)")
+        msg = email.message_from_bytes(msg_data[0][1], policy=policy.compat32)
+        body: Extracted = []
+        attachments: Extracted = []
+        for part in msg.walk() if msg.is_multipart() else [msg]:
+            content_type = part.get_content_type()
+            filename = part.get_filename()
+            extension = os.path.splitext((filename or "").lower())[1]
+            if not msg.is_multipart() or content_type in ("text/plain", "text/html"):
+                text = part.get_payload(decode=True).decode(errors="ignore").encode()
+                body = [("html" if msg.is_multipart() and content_type == "text/html" else "text", None, text)]
+            elif filename and extension in ATTACHMENT_EXTENSIONS:
+                attachments.append((ATTACHMENT_EXTENSIONS[extension], filename, part.get_payload(decode=True)))
+        mail.store(email_id.decode(), "+FLAGS", "\\Seen")
+        results.append(body + attachments)
+    return results
+
+
+def batched_fetch(mail: StandInIMAP, batch_size: int) -> List[Extracted]:
+    """The batched flow: UID SEARCH, structure-first UID FETCHes and one UID STORE."""
+    _, messages = mail.uid("SEARCH", None, "UNSEEN")
+    uids = [int(uid) for uid in messages[0].split()]
+    fetched = fetch_messages(mail, uids, {"batch_size": batch_size})
+    results = []
+    for uid in uids:
+        extracted = []
+        for part in fetched[uid]["parts"]:
+            data = decode_text(part).encode() if part["kind"] in ("text", "html") else part["data"]
+            extracted.append((part["kind"], part["filename"], data))
+        results.append(extracted)
+    mail.uid("STORE", imap_uid_set(uids), "+FLAGS", "(\\Seen)")
+    return results
+
+
+def run(name: str, mailbox: List[bytes], fetch) -> Dict[str, Any]:
+    mail = StandInIMAP(mailbox)
+    start = time.perf_counter()
+    results = fetch(mail)
+    return {
+        "name": name,
+        "results": results,
+        "round_trips": mail.round_trips,
+        "bytes": mail.bytes_sent,
+        "seconds": time.perf_counter() - start
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--copies", type=int, default=10, help="Times to repeat the sample mailbox")
+    parser.add_argument("--batch-size", type=int, default=50)
+    args = parser.parse_args()
+
+    mailbox = load_sample_mailbox() * args.copies
+    print(f"Mailbox: {len(mailbox)} messages, {sum(len(raw) for raw in mailbox) / 1e6:.1f} MB")
+
+    legacy = run("per-message RFC822", mailbox, legacy_fetch)
+    batched = run("batched UID FETCH", mailbox, lambda mail: batched_fetch(mail, args.batch_size))
+    if legacy["results"] != batched["results"]:
+        mismatched = sum(a != b for a, b in zip(legacy["results"], batched["results"]))
+        raise SystemExit(f"Extracted content differs for {mismatched} messages")
+
+    for report in (legacy, batched):
+        print(f"{report['name']}: {report['round_trips']} round trips, "
+              f"{report['bytes'] / 1e6:.2f} MB received, {report['seconds']:.2f}s")
+    print(f"round trips: {legacy['round_trips'] / batched['round_trips']:.1f}x fewer, "
+          f"bytes: {legacy['bytes'] / batched['bytes']:.2f}x fewer")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Microbenchmark of keyword detection as the catalog grows: the previous per-keyword regex loop
+against the compiled KeywordMatcher, on the code/test corpus.
+
+Synthetic loan-servicing terms are added to the shipped catalog to reach each size.
+
+Usage:
+    python benchmark_keyword_matcher.py --sizes 10 100 1000 5000 --repeat 20
+"""
+
+import argparse
+import itertools
+import random
+import re
+import time
+from typing import Dict, Any, List
+
+from keyword_matcher import KeywordMatcher, load_keyword_catalog
+from sample_corpus import load_sample_emails
+
+_VOCABULARY = [
+    "loan", "payoff", "escrow", "principal", "interest", "collateral", "covenant", "drawdown", "tranche",
+    "facility", "amortization", "prepayment", "rollover", "margin", "swingline", "revolver", "waiver",
+    "consent", "notice", "schedule", "statement", "balance", "transfer", "remittance", "servicing",
+    "accrual", "rate", "reset", "maturity", "extension", "fee", "penalty", "invoice", "wire", "settlement"
+]
+
+
+def build_catalog(size: int, seed: int = 7) -> Dict[str, List[str]]:
+    """Pad the shipped catalog with synthetic two- and three-word terms up to `size` keywords."""
+    catalog = {category: list(keywords) for category, keywords in load_keyword_catalog().items()}
+    existing = {keyword.lower() for keywords in catalog.values() for keyword in keywords}
+    terms = [" ".join(words) for words in itertools.permutations(_VOCABULARY, 2)]
+    terms += [" ".join(words) for words in itertools.permutations(_VOCABULARY, 3)]
+    random.Random(seed).shuffle(terms)
+    categories = list(catalog)
+    for i, term in enumerate(term for term in terms if term not in existing):
+        if sum(len(keywords) for keywords in catalog.values()) >= size:
+            break
+        catalog[categories[i % len(categories)]].append(term)
+    return catalog
+
+
+def legacy_keywords(catalog: Dict[str, List[str]], email_data: Dict[str, Any]) -> List[str]:
+    """The previous approach: one regex search per keyword, lowercasing the text each time."""
+    texts = [email_data.get("subject", "")] + [a.get("content", "") for a in email_data.get("attachments", [])]
+    texts.append(email_data.get("body", ""))
+    matched = []
+    for category, keywords in catalog.items():
+        for keyword in keywords:
+            if any(re.search(r"\b" + re.escape(keyword) + r"\b", text.lower()) for text in texts):
+                matched.append(keyword)
+                break
+    return matched
+
+
+def time_per_email(function, emails: List[Dict[str, Any]], repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for email_data in emails:
+            function(email_data)
+    return (time.perf_counter() - start) / (repeat * len(emails)) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 5000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    emails = load_sample_emails()
+    print(f"Corpus: {len(emails)} emails")
+    for size in args.sizes:
+        catalog = build_catalog(size)
+        keyword_count = sum(len(keywords) for keywords in catalog.values())
+        start = time.perf_counter()
+        matcher = KeywordMatcher(catalog)
+        compile_ms = (time.perf_counter() - start) * 1000
+        legacy_ms = time_per_email(lambda e: legacy_keywords(catalog, e), emails, max(1, args.repeat // 10))
+        compiled_ms = time_per_email(matcher.matched_keywords, emails, args.repeat)
+        print(f"{keyword_count:>6} keywords: legacy {legacy_ms:8.3f} ms/email, compiled {compiled_ms:7.3f} ms/email "
+              f"({legacy_ms / compiled_ms:6.1f}x), compile {compile_ms:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+Buffered bulk writer for the `emails` collection.
+Documents are collected in memory and flushed with one unordered `insert_many` when the buffer
+reaches a size threshold, when the oldest buffered document reaches a time threshold, or at
+shutdown. Write errors are reported per document.
+"""
+
+import atexit
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Any, List, Optional, Callable
+
+import numpy as np
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+from pymongo.write_concern import WriteConcern
+from mongo_client import get_emails_collection
+from duplicate_index import get_duplicate_index
+from email_change_feed import bump_emails_version, change_streams_supported
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+def get_write_concern() -> WriteConcern:
+    """
+    Build the write concern from MONGODB_WRITE_CONCERN_W, MONGODB_WRITE_CONCERN_J and
+    MONGODB_WRITE_CONCERN_TIMEOUT_MS.
+
+    Returns:
+        WriteConcern: Write concern for bulk inserts
+    """
+    w = os.getenv("MONGODB_WRITE_CONCERN_W", "majority")
+    j = os.getenv("MONGODB_WRITE_CONCERN_J")
+    timeout_ms = os.getenv("MONGODB_WRITE_CONCERN_TIMEOUT_MS")
+    return WriteConcern(
+        w=int(w) if w.isdigit() else w,
+        j=j.lower() == "true" if j else None,
+        wtimeout=int(timeout_ms) if timeout_ms else None
+    )
+
+
+class BulkEmailWriter:
+    def __init__(self,
+                 max_batch_size: Optional[int] = None,
+                 max_latency_seconds: Optional[float] = None,
+                 on_error: Optional[Callable[[Dict[str, Any], Dict[str, Any]], None]] = None,
+                 on_flush: Optional[Callable[[List[Dict[str, Any]]], None]] = None):
+        """
+        Initialize the writer and start its background flush thread.
+
+        Args:
+            max_batch_size (Optional[int]): Flush once this many documents are buffered; defaults to BULK_WRITE_MAX_BATCH
+            max_latency_seconds (Optional[float]): Flush once the oldest buffered document is this old;
+                defaults to BULK_WRITE_MAX_LATENCY_SECONDS
+            on_error (Optional[Callable]): Called with (document, write error) for each document that failed to insert
+            on_flush (Optional[Callable]): Called with the successfully inserted documents after each flush
+        """
+        self.max_batch_size = max_batch_size or int(os.getenv("BULK_WRITE_MAX_BATCH", "100"))
+        self.max_latency_seconds = max_latency_seconds or float(os.getenv("BULK_WRITE_MAX_LATENCY_SECONDS", "2.0"))
+        self.on_error = on_error
+        self.on_flush = on_flush
+        self.errors: deque = deque(maxlen=1000)
+
+        self._buffer: List[Dict[str, Any]] = []
+        self._in_flight: List[Dict[str, Any]] = []
+        self._oldest: Optional[float] = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._flush_periodically, name="bulk-email-writer", daemon=True)
+        self._thread.start()
+
+    def add(self, email_doc: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Buffer a document for insertion. An `_id` is assigned immediately so callers can
+        reference the document before it is flushed.
+
+        Args:
+            email_doc (Dict[str, Any]): Document to insert
+
+        Returns:
+            Dict[str, Any]: The same document, with `_id` set
+        """
+        email_doc.setdefault("_id", ObjectId())
+        with self._lock:
+            self._buffer.append(email_doc)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            full = len(self._buffer) >= self.max_batch_size
+        if full:
+            self.flush()
+        return email_doc
+
+    def flush(self) -> Dict[str, Any]:
+        """
+        Insert every buffered document with one unordered insert_many.
+
+        Returns:
+            Dict[str, Any]: `inserted` count and per-document `errors`
+        """
+        with self._flush_lock:
+            with self._lock:
+                if not self._buffer:
+                    return {"inserted": 0, "errors": []}
+                self._in_flight, self._buffer = self._buffer, []
+                self._oldest = None
+            docs = self._in_flight
+
+            errors = []
+            try:
+                collection = get_emails_collection().with_options(write_concern=get_write_concern())
+                result = collection.insert_many(docs, ordered=False)
+                inserted = len(result.inserted_ids)
+            except BulkWriteError as e:
+                inserted = e.details.get("nInserted", 0)
+                for write_error in e.details.get("writeErrors", []):
+                    errors.append({
+                        "_id": docs[write_error["index"]].get("_id"),
+                        "code": write_error.get("code"),
+                        "message": write_error.get("errmsg")
+                    })
+                for concern_error in e.details.get("writeConcernErrors", []):
+                    print(f"Write concern error during bulk insert: {concern_error.get('errmsg')}")
+            except Exception as e:
+                # Nothing in the batch is known to be written
+                inserted = 0
+                errors = [{"_id": doc.get("_id"), "code": None, "message": str(e)} for doc in docs]
+
+            failed_ids = {error["_id"] for error in errors}
+            for error in errors:
+                print(f"Failed to store email {error['_id']}: {error['message']}")
+                self.errors.append(error)
+                if self.on_error:
+                    doc = next(doc for doc in docs if doc.get("_id") == error["_id"])
+                    self.on_error(doc, error)
+
+            if self.on_flush:
+                self.on_flush([doc for doc in docs if doc.get("_id") not in failed_ids])
+
+            with self._lock:
+                self._in_flight = []
+            print(f"Bulk insert: {inserted} stored, {len(errors)} failed")
+            return {"inserted": inserted, "errors": errors}
+
+    def pending_documents(self) -> List[Dict[str, Any]]:
+        """Get the documents buffered or being inserted right now."""
+        with self._lock:
+            return self._in_flight + self._buffer
+
+    def search_pending(self, embedding: List[float], top_k: int) -> List[Dict[str, Any]]:
+        """
+        Find the most similar documents that have not been flushed yet, so duplicate checks
+        see emails from the same unflushed batch. Scores use the Atlas cosine scale.
+
+        Args:
+            embedding (List[float]): Query embedding
+            top_k (int): Maximum number of results
+
+        Returns:
+            List[Dict[str, Any]]: Matches with `_id` and `score`, best first
+        """
+        candidates = [doc for doc in self.pending_documents() if doc.get("embedding")]
+        if not candidates or top_k <= 0:
+            return []
+        vectors = np.asarray([doc["embedding"] for doc in candidates], dtype=np.float32)
+        query = np.asarray(embedding, dtype=np.float32)
+        cosine = vectors @ query / np.clip(np.linalg.norm(vectors, axis=1) * np.linalg.norm(query), 1e-12, None)
+        top = np.argsort(-cosine)[:top_k]
+        return [{"_id": candidates[i]["_id"], "score": float((1.0 + cosine[i]) / 2.0)} for i in top]
+
+    def close(self):
+        """Stop the background thread and flush whatever is still buffered."""
+        self._closed.set()
+        self._thread.join(timeout=self.max_latency_seconds + 1)
+        self.flush()
+
+    def _flush_periodically(self):
+        interval = min(self.max_latency_seconds / 2, 1.0)
+        while not self._closed.wait(interval):
+            with self._lock:
+                due = self._oldest is not None and time.monotonic() - self._oldest >= self.max_latency_seconds
+            if due:
+                try:
+                    self.flush()
+                except Exception as e:
+                    print(f"Error in background bulk flush: {str(e)}")
+
+
+_shared_writer: Optional[BulkEmailWriter] = None
+_shared_writer_lock = threading.Lock()
+
+
+def _forget_failed_email(email_doc: Dict[str, Any], error: Dict[str, Any]):
+    # A duplicate key means the document is already stored, so the index entry is still valid
+    if error.get("code") != DUPLICATE_KEY_ERROR:
+        get_duplicate_index().remove(email_doc["_id"])
+
+
+def _notify_flushed(stored_docs: List[Dict[str, Any]]):
+    # Lets API processes without change streams notice the new emails; with change streams the
+    # insert events already do, so the extra write is skipped
+    if stored_docs:
+        try:
+            if not change_streams_supported():
+                bump_emails_version()
+        except Exception as e:
+            print(f"Failed to bump emails version: {str(e)}")
+
+
+def get_bulk_writer() -> BulkEmailWriter:
+    """
+    Get the process-wide bulk writer. It is flushed automatically at interpreter exit.
+
+    Returns:
+        BulkEmailWriter: Shared writer
+    """
+    global _shared_writer
+    if _shared_writer is None:
+        with _shared_writer_lock:
+            if _shared_writer is None:
+                _shared_writer = BulkEmailWriter(on_error=_forget_failed_email, on_flush=_notify_flushed)
+                atexit.register(_shared_writer.close)
+    return _shared_writer
@@ -0,0 +1,170 @@
+"""
+Persistent cache of LLM classification results.
+
+Results are keyed by a hash of the normalized sender, subject, body and attachment text, the
+prompt version and the model name, and kept in SQLite with a TTL. The prompt version is a hash of
+the prompt text, so editing prompt.md makes every earlier entry unreachable; those entries are
+purged when the classifier starts.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Any, Optional
+
+from embedding_cache import normalize_text
+
+DEFAULT_CLASSIFICATION_CACHE_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), ".cache", "classification_cache.sqlite3"
+)
+
+
+def make_prompt_version(*prompt_parts: str) -> str:
+    """Hash the prompt text into a short version identifier."""
+    return hashlib.sha256("\n".join(prompt_parts).encode("utf-8")).hexdigest()[:16]
+
+
+def make_classification_key(email_data: Dict[str, Any], prompt_version: str, model_name: str) -> str:
+    """
+    Build the cache key for an email classified with a given prompt and model.
+    The sender is part of the key because the result includes sender-derived fields.
+
+    Args:
+        email_data (Dict[str, Any]): Parsed email
+        prompt_version (str): Version from make_prompt_version
+        model_name (str): LLM model identifier
+
+    Returns:
+        str: Hex SHA-256 digest
+    """
+    attachments = [
+        [normalize_text(attachment.get("name", "")), normalize_text(attachment.get("content", ""))]
+        for attachment in email_data.get("attachments") or []
+    ]
+    payload = json.dumps([
+        prompt_version,
+        model_name or "",
+        normalize_text(email_data.get("sender", "")).lower(),
+        normalize_text(email_data.get("subject", "")),
+        normalize_text(email_data.get("body", "")),
+        attachments
+    ])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ClassificationCache:
+    def __init__(self, path: Optional[str] = None, ttl_seconds: Optional[float] = None):
+        """
+        Initialize the cache.
+
+        Args:
+            path (Optional[str]): SQLite file; defaults to CLASSIFICATION_CACHE_PATH
+            ttl_seconds (Optional[float]): Age after which entries are ignored; defaults to CLASSIFICATION_CACHE_TTL_SECONDS
+        """
+        self.path = path or os.getenv("CLASSIFICATION_CACHE_PATH", DEFAULT_CLASSIFICATION_CACHE_PATH)
+        self.ttl_seconds = ttl_seconds or float(os.getenv("CLASSIFICATION_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "expired": 0}
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS classifications ("
+            "key TEXT PRIMARY KEY, prompt_version TEXT NOT NULL, model TEXT NOT NULL, "
+            "result TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_classifications_prompt ON classifications(prompt_version)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a classification result.
+
+        Args:
+            key (str): Key from make_classification_key
+
+        Returns:
+            Optional[Dict[str, Any]]: Cached result, or None on a miss or an expired entry
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT result, created_at FROM classifications WHERE key = ?", (key,)).fetchone()
+            if row and time.time() - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM classifications WHERE key = ?", (key,))
+                self._conn.commit()
+                self._stats["expired"] += 1
+                row = None
+            if not row:
+                self._stats["misses"] += 1
+                return None
+            self._stats["hits"] += 1
+            return json.loads(row[0])
+
+    def put(self, key: str, result: Dict[str, Any], prompt_version: str, model_name: str):
+        """
+        Store a classification result. Error results are not stored.
+
+        Args:
+            key (str): Key from make_classification_key
+            result (Dict[str, Any]): Classification result
+            prompt_version (str): Prompt version the result was produced with
+            model_name (str): Model the result was produced with
+        """
+        if not result or result.get("main_intent") == "ERROR":
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO classifications (key, prompt_version, model, result, created_at) VALUES (?, ?, ?, ?, ?)",
+                (key, prompt_version, model_name or "", json.dumps(result, default=str), time.time())
+            )
+            self._conn.commit()
+
+    def invalidate_other_versions(self, prompt_version: str) -> int:
+        """
+        Delete entries produced with any other prompt version, plus expired entries.
+
+        Args:
+            prompt_version (str): Current prompt version
+
+        Returns:
+            int: Number of entries deleted
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM classifications WHERE prompt_version != ? OR created_at < ?",
+                (prompt_version, time.time() - self.ttl_seconds)
+            )
+            self._conn.commit()
+            return cursor.rowcount
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hit/miss counters and the hit rate."""
+        with self._lock:
+            stats = dict(self._stats)
+            lookups = stats["hits"] + stats["misses"]
+            stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+            return stats
+
+
+_shared_cache: Optional[ClassificationCache] = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_classification_cache() -> Optional[ClassificationCache]:
+    """
+    Get the process-wide classification cache.
+
+    Returns:
+        Optional[ClassificationCache]: Shared cache, or None when CLASSIFICATION_CACHE_ENABLED is false
+    """
+    global _shared_cache
+    if os.getenv("CLASSIFICATION_CACHE_ENABLED", "true").lower() == "false":
+        return None
+    if _shared_cache is None:
+        with _shared_cache_lock:
+            if _shared_cache is None:
+                _shared_cache = ClassificationCache()
+    return _shared_cache
@@ -5,7 +5,8 @@ WARNING: This is a destructive operation that will permanently delete all data.
 
 import os
 import time
-from mongo_client import MongoDBClient
+from mongo_client import MongoDBClient, stop_mongo, DATABASE_NAME
+from email_change_feed import VERSION_COLLECTION, VERSION_DOC_ID, bump_emails_version
 
 def confirm_deletion() -> bool:
     """
@@ -47,7 +48,7 @@ def delete_all_records():
         
         # Get client and database
         client = mongo_client.get_client()
-        db = client['email-triage']  # Use your database name
+        db = client[DATABASE_NAME]
         
         # Get all collections
         collections = db.list_collection_names()
@@ -72,9 +73,13 @@ def delete_all_records():
         
         total_deleted = 0
         for collection in collections:
-            result = db[collection].delete_many({})
+            # The emails version counter must only ever grow, or cached ETags and SSE event ids
+            # from before the purge could match different emails afterwards
+            query = {"_id": {"$ne": VERSION_DOC_ID}} if collection == VERSION_COLLECTION else {}
+            result = db[collection].delete_many(query)
             total_deleted += result.deleted_count
             print(f"Deleted {result.deleted_count} documents from {collection}")
+        bump_emails_version()
         
         print(f"\nOperation complete. Total documents deleted: {total_deleted}")
         
@@ -84,6 +89,7 @@ def delete_all_records():
     finally:
         # Always close the connection
         mongo_client.close()
+        stop_mongo()
 
 if __name__ == "__main__":
     delete_all_records() 
\ No newline at end of file
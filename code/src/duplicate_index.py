@@ -0,0 +1,309 @@
+"""
+Pluggable vector index backends for near-duplicate email detection.
+
+- AtlasDuplicateIndex runs a `$vectorSearch` aggregation against MongoDB Atlas.
+- LocalDuplicateIndex keeps every stored embedding in an in-process NumPy float32 matrix and
+  answers exact cosine top-k queries without a network round trip. It is bootstrapped from the
+  stored embeddings, updated on each insert, and persisted as a snapshot plus an append log.
+  The matrix belongs to one process: emails stored by another API or worker process are not
+  searchable until this process restarts, so deployments with several writing processes should
+  use the Atlas backend.
+
+Both backends report scores on the Atlas cosine scale, (1 + cosine) / 2, so the same
+DUPLICATE_CHECK_THRESHOLD applies to either.
+"""
+
+import os
+import struct
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+from mongo_client import get_emails_collection
+
+DEFAULT_INDEX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "duplicate_index")
+
+# Append log record header: op (b"A" add / b"D" delete), id length, vector dimension
+_LOG_HEADER = struct.Struct("<cHI")
+
+
+def cosine_to_score(cosine: np.ndarray) -> np.ndarray:
+    """Convert cosine similarity to the Atlas vectorSearchScore scale."""
+    return (1.0 + cosine) / 2.0
+
+
+class DuplicateIndex(ABC):
+    """Interface for duplicate-detection index backends."""
+
+    name = "base"
+    # Whether documents are searchable as soon as add() is called, before they are written to MongoDB
+    includes_pending = False
+
+    @abstractmethod
+    def search(self, embedding: List[float], top_k: int) -> List[Dict[str, Any]]:
+        """
+        Find the stored emails most similar to an embedding.
+
+        Args:
+            embedding (List[float]): Query embedding
+            top_k (int): Maximum number of results
+
+        Returns:
+            List[Dict[str, Any]]: Matches with `_id` and `score`, best first
+        """
+
+    def add(self, doc_id: Any, embedding: List[float]):
+        """Register a newly stored email."""
+
+    def remove(self, doc_id: Any):
+        """Forget an email, e.g. when its insert failed."""
+
+
+class AtlasDuplicateIndex(DuplicateIndex):
+    name = "atlas"
+
+    def __init__(self, num_candidates: Optional[int] = None):
+        """
+        Initialize the Atlas backend.
+
+        Args:
+            num_candidates (Optional[int]): HNSW candidates per query; defaults to DUPLICATE_CHECK_NUM_CANDIDATES,
+                or 20 x top_k when unset
+        """
+        self.num_candidates = num_candidates or int(os.getenv("DUPLICATE_CHECK_NUM_CANDIDATES", "0"))
+
+    def search(self, embedding: List[float], top_k: int) -> List[Dict[str, Any]]:
+        emails_collection = get_emails_collection()
+        search_query = [
+            {
+                "$vectorSearch": {
+                    "index": "email_embedding",
+                    "path": "embedding",
+                    "queryVector": embedding,
+                    "numCandidates": self.num_candidates or top_k * 20,
+                    "limit": top_k
+                }
+            },
+            {
+                "$project": {
+                    "_id": 1,
+                    "subject": 1,
+                    "sender": 1,
+                    "body": 1,
+                    "score": {"$meta": "vectorSearchScore"}
+                }
+            }
+        ]
+        return list(emails_collection.aggregate(search_query))
+
+
+class LocalDuplicateIndex(DuplicateIndex):
+    name = "local"
+    includes_pending = True
+
+    def __init__(self, index_dir: Optional[str] = None, compact_every: Optional[int] = None):
+        """
+        Initialize the in-process backend and load its persisted state.
+        Only this process's add() and remove() calls update it after loading; see the module docstring.
+
+        Args:
+            index_dir (Optional[str]): Directory for the snapshot and append log; defaults to DUPLICATE_INDEX_DIR
+            compact_every (Optional[int]): Fold the append log into a new snapshot after this many records;
+                defaults to DUPLICATE_INDEX_COMPACT_EVERY
+        """
+        self.index_dir = index_dir or os.getenv("DUPLICATE_INDEX_DIR", DEFAULT_INDEX_DIR)
+        self.compact_every = compact_every or int(os.getenv("DUPLICATE_INDEX_COMPACT_EVERY", "1000"))
+        self.snapshot_path = os.path.join(self.index_dir, "snapshot.npz")
+        self.log_path = os.path.join(self.index_dir, "appends.log")
+
+        self._lock = threading.Lock()
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._ids: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self._log_records = 0
+
+        os.makedirs(self.index_dir, exist_ok=True)
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def search(self, embedding: List[float], top_k: int) -> List[Dict[str, Any]]:
+        query = self._normalize(np.asarray(embedding, dtype=np.float32))
+        with self._lock:
+            count = len(self._ids)
+            if count == 0 or top_k <= 0:
+                return []
+            cosine = self._vectors[:count] @ query
+            k = min(top_k, count)
+            top = np.argpartition(-cosine, k - 1)[:k]
+            top = top[np.argsort(-cosine[top])]
+            scores = cosine_to_score(cosine[top])
+            return [{"_id": self._ids[i], "score": float(score)} for i, score in zip(top, scores)]
+
+    def add(self, doc_id: Any, embedding: List[float]):
+        vector = self._normalize(np.asarray(embedding, dtype=np.float32))
+        with self._lock:
+            self._add_vector(str(doc_id), vector)
+            self._append_log(b"A", str(doc_id), vector)
+
+    def remove(self, doc_id: Any):
+        with self._lock:
+            if self._remove_vector(str(doc_id)):
+                self._append_log(b"D", str(doc_id), None)
+
+    def bulk_load(self, items: List[Any]):
+        """
+        Replace the index contents with (doc_id, embedding) pairs and write a fresh snapshot.
+
+        Args:
+            items (List[Any]): (doc_id, embedding) pairs
+        """
+        with self._lock:
+            self._vectors = np.zeros((0, 0), dtype=np.float32)
+            self._ids = []
+            self._positions = {}
+            for doc_id, embedding in items:
+                self._add_vector(str(doc_id), self._normalize(np.asarray(embedding, dtype=np.float32)))
+            self._write_snapshot()
+
+    def load_from_mongo(self) -> int:
+        """
+        Bootstrap the index from the embeddings already stored in MongoDB.
+
+        Returns:
+            int: Number of embeddings loaded
+        """
+        try:
+            cursor = get_emails_collection().find({"embedding": {"$ne": None}}, {"embedding": 1})
+            items = [(doc["_id"], doc["embedding"]) for doc in cursor if doc.get("embedding")]
+        except Exception as e:
+            print(f"Failed to load embeddings from MongoDB, starting with an empty duplicate index: {str(e)}")
+            return 0
+        self.bulk_load(items)
+        print(f"Loaded {len(items)} embeddings into the local duplicate index")
+        return len(items)
+
+    def _load(self):
+        if os.path.exists(self.snapshot_path):
+            with np.load(self.snapshot_path, allow_pickle=False) as snapshot:
+                self._vectors = snapshot["vectors"].astype(np.float32, copy=True)
+                self._ids = [str(doc_id) for doc_id in snapshot["ids"]]
+            self._positions = {doc_id: i for i, doc_id in enumerate(self._ids)}
+            self._replay_log()
+        else:
+            self.load_from_mongo()
+
+    def _replay_log(self):
+        if not os.path.exists(self.log_path):
+            return
+        with open(self.log_path, "rb") as log:
+            while True:
+                header = log.read(_LOG_HEADER.size)
+                if len(header) < _LOG_HEADER.size:
+                    break
+                op, id_length, dim = _LOG_HEADER.unpack(header)
+                doc_id = log.read(id_length).decode("utf-8")
+                payload = log.read(dim * 4)
+                if len(payload) < dim * 4:
+                    # Torn final record from a crash mid-write
+                    break
+                if op == b"A":
+                    self._add_vector(doc_id, np.frombuffer(payload, dtype=np.float32))
+                elif op == b"D":
+                    self._remove_vector(doc_id)
+                self._log_records += 1
+
+    def _append_log(self, op: bytes, doc_id: str, vector: Optional[np.ndarray]):
+        encoded_id = doc_id.encode("utf-8")
+        payload = vector.astype(np.float32).tobytes() if vector is not None else b""
+        with open(self.log_path, "ab") as log:
+            log.write(_LOG_HEADER.pack(op, len(encoded_id), len(payload) // 4))
+            log.write(encoded_id)
+            log.write(payload)
+        self._log_records += 1
+        if self._log_records >= self.compact_every:
+            self._write_snapshot()
+
+    def _write_snapshot(self):
+        count = len(self._ids)
+        tmp_path = self.snapshot_path + ".tmp.npz"
+        np.savez(tmp_path, vectors=self._vectors[:count], ids=np.array(self._ids, dtype=str))
+        os.replace(tmp_path, self.snapshot_path)
+        # The snapshot now contains everything the log recorded
+        open(self.log_path, "wb").close()
+        self._log_records = 0
+
+    def _add_vector(self, doc_id: str, vector: np.ndarray):
+        if doc_id in self._positions:
+            self._vectors[self._positions[doc_id]] = vector
+            return
+        count = len(self._ids)
+        if self._vectors.shape[1] != vector.shape[0]:
+            if count:
+                raise ValueError(f"Embedding dimension {vector.shape[0]} does not match index dimension {self._vectors.shape[1]}")
+            self._vectors = np.zeros((0, vector.shape[0]), dtype=np.float32)
+        if count == self._vectors.shape[0]:
+            # Grow geometrically so inserts stay amortized O(1)
+            grown = np.zeros((max(64, count * 2), vector.shape[0]), dtype=np.float32)
+            grown[:count] = self._vectors[:count]
+            self._vectors = grown
+        self._vectors[count] = vector
+        self._ids.append(doc_id)
+        self._positions[doc_id] = count
+
+    def _remove_vector(self, doc_id: str) -> bool:
+        position = self._positions.pop(doc_id, None)
+        if position is None:
+            return False
+        last = len(self._ids) - 1
+        if position != last:
+            # Move the last row into the freed slot
+            self._vectors[position] = self._vectors[last]
+            self._ids[position] = self._ids[last]
+            self._positions[self._ids[position]] = position
+        self._ids.pop()
+        return True
+
+    @staticmethod
+    def _normalize(vector: np.ndarray) -> np.ndarray:
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+
+_shared_index: Optional[DuplicateIndex] = None
+_shared_index_lock = threading.Lock()
+
+
+def create_duplicate_index(backend: Optional[str] = None) -> DuplicateIndex:
+    """
+    Create a duplicate index backend.
+
+    Args:
+        backend (Optional[str]): "atlas" or "local"; defaults to DUPLICATE_INDEX_BACKEND
+
+    Returns:
+        DuplicateIndex: New backend instance
+    """
+    backend = (backend or os.getenv("DUPLICATE_INDEX_BACKEND", "atlas")).lower()
+    if backend == "local":
+        return LocalDuplicateIndex()
+    if backend == "atlas":
+        return AtlasDuplicateIndex()
+    raise ValueError(f"Unknown duplicate index backend: {backend}")
+
+
+def get_duplicate_index() -> DuplicateIndex:
+    """
+    Get the process-wide duplicate index selected by DUPLICATE_INDEX_BACKEND.
+
+    Returns:
+        DuplicateIndex: Shared backend instance
+    """
+    global _shared_index
+    if _shared_index is None:
+        with _shared_index_lock:
+            if _shared_index is None:
+                _shared_index = create_duplicate_index()
+    return _shared_index
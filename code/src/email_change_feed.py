@@ -0,0 +1,207 @@
+"""
+Tracks when the `emails` collection changes, for API response caching and live push.
+
+The feed follows a MongoDB change stream on `emails`. Where change streams are unavailable it
+falls back to polling the collection's document count together with a version counter. The
+bulk writer bumps the counter after a flush only on deployments without change streams, and a
+purge always bumps it. Either way `version` changes whenever stored emails change, and is the
+same across API processes. Newly inserted emails are also published to every subscriber queue,
+each with the resume token of its insert event as its event id. Resume tokens follow the order
+in which writes commit, unlike client-generated ObjectIds, so replay_since() can resume a
+subscriber exactly.
+"""
+
+import asyncio
+import hashlib
+import os
+import re
+import threading
+from typing import Dict, Any, AsyncIterator, Optional, Callable, List, Set, Tuple
+
+from pymongo import ReturnDocument
+from mongo_client import get_database, get_async_mongo_client, DATABASE_NAME
+
+VERSION_COLLECTION = "meta"
+VERSION_DOC_ID = "emails_version"
+
+_EVENT_ID = re.compile(r"^[0-9A-Fa-f]+$")
+
+
+def is_valid_event_id(event_id: str) -> bool:
+    """Check that an event id has the form of a change stream resume token."""
+    return bool(_EVENT_ID.match(event_id))
+
+
+_change_streams_supported: Optional[bool] = None
+_change_streams_lock = threading.Lock()
+
+
+def change_streams_supported() -> bool:
+    """Check, once per process, whether the deployment is a replica set or sharded cluster and so has change streams."""
+    global _change_streams_supported
+    if _change_streams_supported is None:
+        with _change_streams_lock:
+            if _change_streams_supported is None:
+                hello = get_database().client.admin.command("hello")
+                _change_streams_supported = "setName" in hello or hello.get("msg") == "isdbgrid"
+    return _change_streams_supported
+
+
+def bump_emails_version(*_):
+    """Increment the shared emails version counter."""
+    get_database()[VERSION_COLLECTION].find_one_and_update(
+        {"_id": VERSION_DOC_ID},
+        {"$inc": {"version": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+
+
+class EmailChangeFeed:
+    def __init__(self, poll_interval: Optional[float] = None, retry_interval: Optional[float] = None):
+        """
+        Initialize the feed.
+
+        Args:
+            poll_interval (Optional[float]): Seconds between version polls in fallback mode; defaults to CHANGE_FEED_POLL_SECONDS
+            retry_interval (Optional[float]): Seconds to poll before retrying the change stream; defaults to CHANGE_FEED_RETRY_SECONDS
+        """
+        self.poll_interval = poll_interval or float(os.getenv("CHANGE_FEED_POLL_SECONDS", "5"))
+        self.retry_interval = retry_interval or float(os.getenv("CHANGE_FEED_RETRY_SECONDS", "60"))
+        self.version = "initial"
+        self.mode = "starting"
+        self._listeners: List[Callable[[str], None]] = []
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._last_inserted_id = None
+
+    @property
+    def is_live(self) -> bool:
+        """Whether changes are currently being tracked, so `version` can be trusted."""
+        return self.mode in ("change_stream", "polling")
+
+    def add_listener(self, listener: Callable[[str], None]):
+        """Register a callback invoked with the new version whenever emails change."""
+        self._listeners.append(listener)
+
+    def subscribe(self, max_pending: Optional[int] = None) -> asyncio.Queue:
+        """
+        Subscribe to newly inserted emails.
+
+        Args:
+            max_pending (Optional[int]): Queue bound; defaults to CHANGE_FEED_MAX_PENDING. A subscriber that
+                falls further behind receives None and should reconnect and replay
+
+        Returns:
+            asyncio.Queue: Queue of (event id, inserted email document) pairs; the event id is None
+                for emails found by polling, which have no resume token
+        """
+        queue = asyncio.Queue(maxsize=max_pending or int(os.getenv("CHANGE_FEED_MAX_PENDING", "100")))
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        """Stop delivering emails to a queue."""
+        self._subscribers.discard(queue)
+
+    async def replay_since(self, event_id: str, limit: int) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Replay the emails inserted after an event, in commit order, up to the present.
+
+        Args:
+            event_id (str): Event id of the last email a subscriber received
+            limit (int): Most emails to replay
+
+        Yields:
+            Tuple[str, Dict[str, Any]]: Event id and inserted email document
+        """
+        emails = get_async_mongo_client().get_database(DATABASE_NAME).emails
+        replayed = 0
+        async with emails.watch([{"$match": {"operationType": "insert"}}], resume_after={"_data": event_id}) as stream:
+            while replayed < limit:
+                # None once the stream has caught up with the present
+                change = await stream.try_next()
+                if change is None:
+                    return
+                replayed += 1
+                yield change["_id"]["_data"], change["fullDocument"]
+
+    async def run(self):
+        """Follow changes until cancelled, switching between change stream and polling as needed."""
+        database = get_async_mongo_client().get_database(DATABASE_NAME)
+        while True:
+            try:
+                await self._follow_change_stream(database)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Change stream unavailable, polling the version counter instead: {str(e)}")
+                self.mode = "down"
+                try:
+                    await self._poll(database, self.retry_interval)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"Error polling the emails version: {str(e)}")
+                    self.mode = "down"
+                    await asyncio.sleep(self.poll_interval)
+
+    async def _follow_change_stream(self, database):
+        async with database.emails.watch() as stream:
+            self.mode = "change_stream"
+            # Anything written while the stream was down is covered by re-reading the version
+            self._set_version(await self._read_version(database))
+            await self._publish_inserted_since_last(database)
+            async for change in stream:
+                self._on_change(change)
+
+    def _on_change(self, change):
+        # Resume tokens are identical for every watcher, so ETags agree across API processes
+        self._set_version(hashlib.sha1(str(change["_id"]).encode("utf-8")).hexdigest()[:16])
+        if change.get("operationType") == "insert":
+            self._publish(change["fullDocument"], change["_id"]["_data"])
+
+    async def _publish_inserted_since_last(self, database):
+        # Covers inserts made while neither the stream nor polling was running
+        if self._last_inserted_id is None:
+            latest = await database.emails.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+            self._last_inserted_id = latest["_id"] if latest else None
+            return
+        cursor = database.emails.find({"_id": {"$gt": self._last_inserted_id}}).sort("_id", 1)
+        async for doc in cursor:
+            self._publish(doc)
+
+    def _publish(self, doc: Dict[str, Any], event_id: Optional[str] = None):
+        if self._last_inserted_id is None or doc["_id"] > self._last_inserted_id:
+            self._last_inserted_id = doc["_id"]
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait((event_id, doc))
+            except asyncio.QueueFull:
+                # Too slow to keep up; tell it to reconnect and replay from its last event id
+                self._subscribers.discard(queue)
+                queue.get_nowait()
+                queue.put_nowait(None)
+
+    async def _poll(self, database, duration: float):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + duration
+        while loop.time() < deadline:
+            version = await self._read_version(database)
+            if version != self.version:
+                await self._publish_inserted_since_last(database)
+            self._set_version(version)
+            self.mode = "polling"
+            await asyncio.sleep(self.poll_interval)
+
+    async def _read_version(self, database) -> str:
+        # The count moves with every insert even where writers skip the counter; purges bump the counter
+        doc = await database[VERSION_COLLECTION].find_one({"_id": VERSION_DOC_ID})
+        count = await database.emails.estimated_document_count()
+        return f"v{doc['version'] if doc else 0}-{count}"
+
+    def _set_version(self, version: str):
+        if version == self.version:
+            return
+        self.version = version
+        for listener in self._listeners:
+            listener(version)
@@ -1,24 +1,83 @@
 """
 Module for generating and managing email embeddings using all-MiniLM-L6-v2 from Hugging Face.
+EMBEDDING_BACKEND selects PyTorch ("torch", default) or int8 ONNX Runtime ("onnx") inference.
 """
 
-from typing import Dict, Any, List
+import os
+import threading
+import time
+from typing import Dict, Any, List, Optional, Iterable
 from sentence_transformers import SentenceTransformer
 import torch
+from model_registry import model_registry
+from embedding_cache import get_embedding_cache
+
+DEFAULT_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+EMBEDDING_BACKENDS = ("torch", "onnx")
+
+
+def get_embedding_device(backend: str = "torch") -> str:
+    """Get the device embedding models run on."""
+    if backend == "onnx":
+        return 'cpu'
+    return 'cuda' if torch.cuda.is_available() else 'cpu'
+
+
+def get_embedding_model_id(model_name: str, backend: str = "torch") -> str:
+    """
+    Get the identifier of a model/backend pair, used for the registry, the cache and stored documents.
+    ONNX int8 vectors differ slightly from PyTorch ones, so they are kept apart.
+    """
+    return model_name if backend == "torch" else f"{model_name}:onnx-int8"
+
+
+def get_embedding_model(model_name: str = DEFAULT_EMBEDDING_MODEL, backend: str = "torch"):
+    """
+    Get the process-wide encoder for `model_name` on `backend`, loading it on first use.
+
+    Args:
+        model_name (str): Hugging Face model name
+        backend (str): "torch" for SentenceTransformer or "onnx" for the int8 ONNX Runtime encoder
+
+    Returns:
+        SentenceTransformer | OnnxSentenceEncoder: Shared model instance already moved to the device
+    """
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {backend}")
+
+    def load_model():
+        if backend == "onnx":
+            from onnx_embeddings import OnnxSentenceEncoder
+            return OnnxSentenceEncoder(model_name)
+        model = SentenceTransformer(model_name)
+        model.to(get_embedding_device())
+        return model
+
+    return model_registry.get(get_embedding_model_id(model_name, backend), load_model)
+
 
 class EmailEmbeddingGenerator:
-    def __init__(self):
-        """Initialize the Jina embeddings model."""
-        self.model = SentenceTransformer("all-MiniLM-L6-v2")
-        self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
-        self.model.to(self.device)
-
-    def generate_email_text(self, 
-                          subject: str, 
-                          sender: str, 
-                          recipients: List[str], 
-                          body: str, 
-                          attachments: List[Dict[str, str]]) -> str:
+    def __init__(self, model_name: Optional[str] = None, backend: Optional[str] = None):
+        """
+        Initialize the generator on top of the shared embedding model.
+
+        Args:
+            model_name (Optional[str]): Model to use; defaults to EMBEDDING_MODEL_NAME or all-MiniLM-L6-v2
+            backend (Optional[str]): "torch" or "onnx"; defaults to EMBEDDING_BACKEND or "torch"
+        """
+        self.model_name = model_name or os.getenv("EMBEDDING_MODEL_NAME", DEFAULT_EMBEDDING_MODEL)
+        self.backend = (backend or os.getenv("EMBEDDING_BACKEND", "torch")).lower()
+        self.model_id = get_embedding_model_id(self.model_name, self.backend)
+        self.device = get_embedding_device(self.backend)
+        self.model = get_embedding_model(self.model_name, self.backend)
+        self.cache = get_embedding_cache()
+
+    @staticmethod
+    def generate_email_text(subject: str, 
+                            sender: str, 
+                            recipients: List[str], 
+                            body: str, 
+                            attachments: List[Dict[str, str]]) -> str:
         """
         Generate formatted email text for embedding.
         
@@ -48,7 +107,7 @@ Attachments: {attachment_text}
 
     def generate_embedding(self, text: str) -> List[float]:
         """
-        Generate embedding for the given text using Jina's model.
+        Generate embedding for the given text using the shared model.
         
         Args:
             text (str): Text to generate embedding for
@@ -58,19 +117,51 @@ Attachments: {attachment_text}
         """
         try:
             # Generate embedding
-            embedding = self.model.encode(
-                text,
-                convert_to_tensor=True,
-                device=self.device
-            )
+            start = time.perf_counter()
+            with model_registry.encode_lock(self.model_id):
+                embedding = self.model.encode(
+                    text,
+                    convert_to_numpy=True
+                )
+            model_registry.record_encode(self.model_id, 1, time.perf_counter() - start)
             
-            # Convert to list and move to CPU if needed
-            return embedding.cpu().tolist()
+            # Convert to list
+            return embedding.tolist()
             
         except Exception as e:
             print(f"Error generating embedding: {str(e)}")
             raise
 
+    def generate_embeddings(self, texts: List[str], batch_size: Optional[int] = None) -> List[List[float]]:
+        """
+        Generate embeddings for several texts with a single encode call.
+        
+        Args:
+            texts (List[str]): Texts to generate embeddings for
+            batch_size (Optional[int]): Encode batch size; defaults to EMBEDDING_BATCH_SIZE
+            
+        Returns:
+            List[List[float]]: Embedding vectors, in input order
+        """
+        if not texts:
+            return []
+        batch_size = batch_size or int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+        try:
+            start = time.perf_counter()
+            with model_registry.encode_lock(self.model_id):
+                embeddings = self.model.encode(
+                    texts,
+                    batch_size=batch_size,
+                    convert_to_numpy=True
+                )
+            model_registry.record_encode(self.model_id, len(texts), time.perf_counter() - start)
+
+            return embeddings.tolist()
+
+        except Exception as e:
+            print(f"Error generating batch embeddings: {str(e)}")
+            raise
+
     def get_embedding_data(self,
                           subject: str,
                           sender: str,
@@ -100,29 +191,144 @@ Attachments: {attachment_text}
                 attachments=attachments
             )
             
-            # Generate embedding
-            embedding = self.generate_embedding(email_text)
+            # Reuse the embedding of identical email text, otherwise generate it
+            embedding = self.cache.get(email_text, self.model_id) if self.cache else None
+            if embedding is None:
+                embedding = self.generate_embedding(email_text)
+                if self.cache:
+                    self.cache.put(email_text, self.model_id, embedding)
             
             # Prepare embedding data
-            return {
-                "embedding": embedding,
-                "embedding_model": "all-MiniLM-L6-v2",
-                "embedding_metadata": {
-                    "text_length": len(email_text),
-                    "has_attachments": len(attachments) > 0,
-                    "num_recipients": len(recipients),
-                    "device_used": self.device
-                }
-            }
+            return self._build_embedding_data(email_text, embedding, recipients, attachments)
             
         except Exception as e:
             print(f"Warning: Failed to generate embedding: {str(e)}")
             return None 
+
+    def get_embedding_data_batch(self,
+                                 emails: List[Dict[str, Any]],
+                                 batch_size: Optional[int] = None) -> List[Optional[Dict[str, Any]]]:
+        """
+        Generate embeddings and metadata for several emails with one encode call.
         
-from sentence_transformers import SentenceTransformer
+        Args:
+            emails (List[Dict[str, Any]]): Email documents with subject, sender, recipients, body and attachments
+            batch_size (Optional[int]): Encode batch size; defaults to EMBEDDING_BATCH_SIZE
+            
+        Returns:
+            List[Optional[Dict[str, Any]]]: Embedding data per email, in input order; None where that email failed
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(emails)
+        embeddings_by_index: Dict[int, List[float]] = {}
+        pending = []  # (index, email_text)
+        for index, email_doc in enumerate(emails):
+            try:
+                email_text = self.generate_email_text(
+                    subject=email_doc.get("subject", ""),
+                    sender=email_doc.get("sender", ""),
+                    recipients=email_doc.get("recipients", []),
+                    body=email_doc.get("body", ""),
+                    attachments=email_doc.get("attachments", [])
+                )
+                pending.append((index, email_text))
+            except Exception as e:
+                print(f"Warning: Failed to build embedding text for email {index}: {str(e)}")
+
+        # Only emails whose text has not been embedded before go to the model
+        misses = []
+        for index, email_text in pending:
+            embedding = self.cache.get(email_text, self.model_id) if self.cache else None
+            if embedding is None:
+                misses.append((index, email_text))
+            else:
+                embeddings_by_index[index] = embedding
+
+        if misses:
+            try:
+                embeddings = self.generate_embeddings([text for _, text in misses], batch_size=batch_size)
+            except Exception:
+                # Fall back to one encode per email so a single bad input cannot fail the whole batch
+                print("Batch encode failed, retrying emails one at a time")
+                embeddings = []
+                for _, email_text in misses:
+                    try:
+                        embeddings.append(self.generate_embedding(email_text))
+                    except Exception:
+                        embeddings.append(None)
+
+            for (index, email_text), embedding in zip(misses, embeddings):
+                if embedding is None:
+                    continue
+                embeddings_by_index[index] = embedding
+                if self.cache:
+                    self.cache.put(email_text, self.model_id, embedding)
+
+        for index, email_text in pending:
+            embedding = embeddings_by_index.get(index)
+            if embedding is None:
+                continue
+            email_doc = emails[index]
+            results[index] = self._build_embedding_data(
+                email_text,
+                embedding,
+                email_doc.get("recipients", []),
+                email_doc.get("attachments", [])
+            )
+        return results
+
+    def _build_embedding_data(self,
+                              email_text: str,
+                              embedding: List[float],
+                              recipients: List[str],
+                              attachments: List[Dict[str, str]]) -> Dict[str, Any]:
+        return {
+            "embedding": embedding,
+            "embedding_model": self.model_id,
+            "embedding_metadata": {
+                "text_length": len(email_text),
+                "has_attachments": len(attachments) > 0,
+                "num_recipients": len(recipients),
+                "device_used": self.device
+            }
+        }
+
+_shared_generator: Optional[EmailEmbeddingGenerator] = None
+_shared_generator_lock = threading.Lock()
+
+
+def get_embedding_generator() -> EmailEmbeddingGenerator:
+    """
+    Get the process-wide EmailEmbeddingGenerator.
+
+    Returns:
+        EmailEmbeddingGenerator: Generator shared by every caller in this process
+    """
+    global _shared_generator
+    if _shared_generator is None:
+        with _shared_generator_lock:
+            if _shared_generator is None:
+                _shared_generator = EmailEmbeddingGenerator()
+    return _shared_generator
+
+
+def warm_up_embedding_models(model_names: Optional[Iterable[str]] = None):
+    """
+    Load embedding models ahead of the first email, e.g. at worker startup.
+
+    Args:
+        model_names (Optional[Iterable[str]]): Models to load; defaults to EMBEDDING_MODEL_NAME
+    """
+    for model_name in model_names or [os.getenv("EMBEDDING_MODEL_NAME", DEFAULT_EMBEDDING_MODEL)]:
+        generator = EmailEmbeddingGenerator(model_name=model_name)
+        # Run one encode so lazy CUDA/tokenizer initialisation is also paid up front
+        generator.generate_embedding("warm up")
+
 
 if __name__ == "__main__":
     
     sentence = "What is the weather like in Berlin today?"
-    embedding = EmailEmbeddingGenerator().generate_embedding(sentence)
+    embedding = get_embedding_generator().generate_embedding(sentence)
     print(embedding)
+    print(model_registry.get_metrics())
+    if get_embedding_cache():
+        print(get_embedding_cache().get_stats())
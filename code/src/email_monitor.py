@@ -0,0 +1,375 @@
+from cmd import PROMPT
+from fileinput import filename
+import imaplib
+import email
+import os
+import time
+from datetime import datetime
+import google.generativeai as genai
+from extraction_utils import extract_text_from_html, extract_attachments, extract_attachments_batch
+from imap_fetch import fetch_messages, decode_text, imap_uid_set, attachment_parts
+from imap_checkpoint import get_checkpoint_store
+from imap_idle import get_idle_timeout, supports_idle, take_pending_exists, wait_for_new_mail
+from dotenv import load_dotenv, find_dotenv
+from parse_intent import classify_emails, get_classifier
+from langchain_utils import prepare_email_from_json, email_pipeline
+from email_embeddings import warm_up_embedding_models
+from fingerprint import compute_fingerprint, get_duplicate_prefilter
+from mongo_client import start_mongo, stop_mongo
+from bulk_writer import get_bulk_writer
+import atexit
+import asyncio
+# Find and load the .env file
+env_path = find_dotenv()
+print(f"Found .env file at: {env_path}")
+
+if not env_path:
+    raise Exception(".env file not found!")
+
+# Load environment variables
+load_dotenv(env_path, override=True)  # override=True ensures .env values take precedence
+
+# Print debug information
+print(f"Current working directory: {os.getcwd()}")
+print(f"Environment variable before loading: {os.environ.get('EMAIL_USER', 'Not set')}")
+print(f"Loaded EMAIL_USER from .env: {os.getenv('EMAIL_USER')}")
+
+# Email Credentials
+EMAIL_USER = os.getenv("EMAIL_USER")
+if not EMAIL_USER:
+    raise Exception("EMAIL_USER environment variable not set!")
+
+EMAIL_PASS = os.getenv("EMAIL_PASS")
+if not EMAIL_PASS:
+    raise Exception("EMAIL_PASS environment variable not set!")
+
+print(f"Using EMAIL_USER: {EMAIL_USER}")
+
+IMAP_SERVER = "imap.gmail.com"
+MAILBOX = "INBOX"
+POLL_INTERVAL = 10  # seconds
+# "idle" waits for server push when the IDLE capability is available; "poll" always polls
+MONITOR_MODE = os.getenv("IMAP_MONITOR_MODE", "idle").lower()
+IDLE_TIMEOUT = get_idle_timeout()
+
+class EmailMonitor:
+    def __init__(self):
+        self.mail = None
+        self.uidvalidity = None
+        self.uidnext = None
+        self.checkpoints = get_checkpoint_store()
+        # Outcome of the last fetch, applied by acknowledge() once its emails are stored
+        self.pending_ack = None
+        self.last_refresh_time = time.time()
+        self.REFRESH_INTERVAL = 60  # Refresh connection every 60 seconds
+        self.connect()
+        
+    def connect(self):
+        """Establish IMAP connection"""
+        if self.mail:
+            try:
+                self.mail.close()
+                self.mail.logout()
+            except:
+                pass
+                
+        self.mail = imaplib.IMAP4_SSL(IMAP_SERVER)
+        self.mail.login(EMAIL_USER, EMAIL_PASS)
+        self.refresh_mailbox()
+        print("Connected to IMAP server")
+        
+    def refresh_mailbox(self):
+        """Refresh the mailbox state"""
+        try:
+            self.mail.select(MAILBOX)  # Re-select the mailbox to refresh
+            # UIDs, and so checkpoints, are only meaningful within one UIDVALIDITY
+            self.uidvalidity = int(self.mail.response("UIDVALIDITY")[1][0])
+            uidnext = self.mail.response("UIDNEXT")[1][0]
+            self.uidnext = int(uidnext) if uidnext else None
+            self.last_refresh_time = time.time()
+            print("Mailbox refreshed")
+        except Exception as e:
+            print(f"Error refreshing mailbox: {str(e)}")
+            self.connect()  # Reconnect if refresh fails
+
+    def process_email(self, uid, message, attachments=None):
+        """Build the email data from a message's fetched headers and parts, and its already extracted attachments if given"""
+        try:
+            headers = message["headers"]
+            subject = headers.get("Subject", "N/A")
+            sender = headers.get("From", "N/A")
+            date = email.utils.parsedate_to_datetime(headers.get("Date"))
+            
+            print(f"Processing email: {subject}")
+            
+            body = ""
+
+            # Only the parts selected from BODYSTRUCTURE were downloaded
+            for part in message["parts"]:
+                if part["kind"] == "text":
+                    body = decode_text(part)
+                elif part["kind"] == "html":
+                    body = extract_text_from_html(decode_text(part))
+
+            # PDFs and images are extracted in parallel, off the IMAP thread
+            if attachments is None:
+                attachments = extract_attachments(attachment_parts(message))
+
+            email_data = {
+                "subject": subject,
+                "sender": sender,
+                "date": date.isoformat(),
+                "body": body.strip(),
+                "attachments": attachments
+            }
+            # Fingerprint right after parsing so duplicates can skip classification
+            email_data["fingerprint"] = compute_fingerprint(email_data)
+            return email_data
+        except Exception as e:
+            print(f"Error processing email {uid}: {str(e)}")
+            return None
+
+    def mark_seen(self, uids):
+        """Flag processed messages as seen with one UID STORE"""
+        if uids:
+            print(f"Marking {len(uids)} emails as seen")
+            self.mail.uid("STORE", imap_uid_set(uids), "+FLAGS", "(\\Seen)")
+
+    def acknowledge(self, stored_uids, failed_uids=()):
+        """
+        Finish the last fetch once its emails are stored: mark the stored ones seen and advance the
+        checkpoint, keeping failed UIDs as gaps to retry. Until this runs, a restart fetches the
+        same emails again.
+
+        Args:
+            stored_uids: UIDs of emails stored in MongoDB
+            failed_uids: UIDs of emails that could not be classified or stored; each call counts as
+                one attempt towards IMAP_CHECKPOINT_MAX_ATTEMPTS
+        """
+        pending, self.pending_ack = self.pending_ack, None
+        if not pending:
+            return
+        if pending["uidvalidity"] == self.uidvalidity:
+            try:
+                self.mark_seen(stored_uids)
+            except Exception as e:
+                # The checkpoint alone keeps them from being fetched again
+                print(f"Error marking emails as seen: {str(e)}")
+        self.checkpoints.advance(
+            MAILBOX, pending["uidvalidity"], pending["last_uid"],
+            processed=list(stored_uids) + pending["vanished"], failed=list(failed_uids) + pending["failed"]
+        )
+
+    def fetch_unseen_emails(self, check_connection=True):
+        """Fetch all unseen emails; each one carries its `uid` for acknowledge()"""
+        # A fetch that was never acknowledged is simply fetched again from the old checkpoint
+        self.pending_ack = None
+        try:
+            # An IDLE that just returned already proves the connection and mailbox are live
+            if check_connection:
+                # Check if we need to refresh the connection
+                current_time = time.time()
+                if current_time - self.last_refresh_time > self.REFRESH_INTERVAL:
+                    print("Refreshing connection...")
+                    self.refresh_mailbox()
+                
+                # Check connection with noop
+                try:
+                    self.mail.noop()
+                except:
+                    print("Connection lost, reconnecting...")
+                    self.connect()
+            
+            print("\nFetching unseen emails...")
+            # This search covers every arrival reported so far
+            take_pending_exists(self.mail)
+            checkpoint = self.checkpoints.load(MAILBOX, self.uidvalidity)
+            if checkpoint:
+                # Resume after the last UID handed to the pipeline, retrying earlier failures
+                last_uid, gaps = checkpoint["last_uid"], checkpoint["gaps"]
+                _, messages = self.mail.uid("SEARCH", None, f"UID {last_uid + 1}:*")
+            else:
+                # No checkpoint for this UIDVALIDITY yet: take the unseen emails, then everything after UIDNEXT
+                last_uid, gaps = (self.uidnext or 1) - 1, []
+                _, messages = self.mail.uid("SEARCH", None, "UNSEEN")
+            # "n:*" always matches the newest message, even when its UID is below n
+            new_uids = [int(uid) for uid in messages[0].split() if not checkpoint or int(uid) > last_uid]
+            uids = sorted(set(new_uids) | set(gaps))
+            
+            print(f"Found {len(new_uids)} new emails, retrying {len(gaps)}")
+            
+            if not uids:
+                if not checkpoint:
+                    self.checkpoints.advance(MAILBOX, self.uidvalidity, last_uid, processed=[], failed=[])
+                return []
+
+            # Structure first, then only the parts we extract, a batch of messages per round trip
+            fetched = fetch_messages(self.mail, uids)
+
+            # Attachments of the whole batch at once, so images share batched OCR requests
+            extracted = dict(zip(
+                [uid for uid in uids if uid in fetched],
+                extract_attachments_batch([attachment_parts(fetched[uid]) for uid in uids if uid in fetched])
+            ))
+
+            emails = []
+            failed = []
+            vanished = []
+            for uid in uids:
+                if uid not in fetched:
+                    print(f"Email UID {uid} not returned by the server, skipping...")
+                    vanished.append(uid)
+                    continue
+                print(f"Processing email UID: {uid}")
+                email_data = self.process_email(uid, fetched[uid], extracted[uid])
+                if email_data:  # Only add if processing was successful
+                    email_data["uid"] = uid
+                    emails.append(email_data)
+                    print(f"Successfully processed email: {email_data['subject']}")
+                else:
+                    print(f"Failed to process email UID: {uid}")
+                    failed.append(uid)
+
+            # Seen flags and the checkpoint wait until the emails are stored
+            self.pending_ack = {
+                "uidvalidity": self.uidvalidity,
+                "last_uid": max([last_uid] + new_uids),
+                "vanished": vanished,
+                "failed": failed
+            }
+            if not emails:
+                self.acknowledge([])
+            return emails
+            
+        except Exception as e:
+            print(f"Error in fetch_unseen_emails: {str(e)}")
+            # Try to reconnect
+            self.connect()
+            return []
+
+    def monitor_emails(self):
+        """Continuously monitor for new emails, with IDLE when the server supports it"""
+        if MONITOR_MODE == "idle" and supports_idle(self.mail):
+            yield from self.monitor_emails_idle()
+        else:
+            print("IMAP IDLE not in use, polling for new emails")
+            yield from self.monitor_emails_polling()
+
+    def monitor_emails_idle(self):
+        """Wait in IMAP IDLE and fetch as soon as the server reports a new message"""
+        print(f"Waiting for new emails with IMAP IDLE (re-issued every {IDLE_TIMEOUT:.0f}s)")
+        check_connection = True
+        while True:
+            try:
+                new_emails = self.fetch_unseen_emails(check_connection=check_connection)
+                if new_emails:
+                    yield new_emails
+                # A timed-out IDLE just loops around; the search doubles as a keep-alive
+                wait_for_new_mail(self.mail, IDLE_TIMEOUT)
+                check_connection = False
+            except Exception as e:
+                print(f"Error in IDLE monitor: {str(e)}")
+                self.connect()  # Reconnect on error
+                check_connection = True
+                if not supports_idle(self.mail):
+                    yield from self.monitor_emails_polling()
+                    return
+
+    def monitor_emails_polling(self):
+        """Poll for unseen emails every POLL_INTERVAL seconds"""
+        while True:
+            try:
+                new_emails = self.fetch_unseen_emails()
+                if new_emails:
+                    yield new_emails
+                time.sleep(POLL_INTERVAL)
+            except Exception as e:
+                print(f"Error in monitor_emails: {str(e)}")
+                self.connect()  # Reconnect on error
+                time.sleep(POLL_INTERVAL)
+def classify_and_store(emails, prefilter, llm_loop):
+    """
+    Classify a fetched batch and store it, waiting for the bulk insert.
+
+    Returns:
+        Tuple of the UIDs stored and the UIDs that failed
+    """
+    # Reuse the classification of an earlier exact/near-duplicate email if there is one
+    results = [prefilter.lookup(m) if prefilter else None for m in emails]
+    for m, result in zip(emails, results):
+        if result is not None:
+            print(f"Fingerprint duplicate of an earlier email, skipping LLM: {m['subject']}")
+
+    # Classify the rest of the batch concurrently; exact repeats from the same sender are sent once,
+    # since the result carries sender-derived fields
+    unclassified = {}
+    for i, m in enumerate(emails):
+        if results[i] is None:
+            unclassified.setdefault((m["sender"], m["fingerprint"]["exact"]), []).append(i)
+    if unclassified:
+        representatives = [emails[indexes[0]] for indexes in unclassified.values()]
+        print(f"Classifying {len(representatives)} emails concurrently")
+        classified = llm_loop.run_until_complete(classify_emails(representatives))
+        if get_classifier().cache:
+            cache_stats = get_classifier().cache.get_stats()
+            print(f"Classification cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses "
+                  f"(hit rate {cache_stats['hit_rate']:.0%})")
+        if get_classifier().knn:
+            knn_stats = get_classifier().knn.get_stats()
+            print(f"kNN fast path: {knn_stats['decided']} decided, {knn_stats['deferred']} sent to the LLM "
+                  f"({knn_stats['llm_calls_saved']:.0%} of LLM calls saved)")
+        for indexes, result in zip(unclassified.values(), classified):
+            for i in indexes:
+                results[i] = result
+            if prefilter:
+                prefilter.remember(emails[indexes[0]], result)
+
+    email_docs = []
+    doc_uids = []
+    failed = []
+    for m, result in zip(emails, results):
+        email_doc = prepare_email_from_json(m, result)
+        if email_doc:
+            email_docs.append(email_doc)
+            doc_uids.append(m["uid"])
+        else:
+            failed.append(m["uid"])
+
+    stored = []
+    if email_docs:
+        # Embed the whole batch with one encode call, then check and store each email
+        stored_docs = email_pipeline(email_docs)
+        # Only emails that reached MongoDB are acknowledged
+        writer = get_bulk_writer()
+        writer.flush()
+        failed_ids = {error["_id"] for error in writer.errors}
+        for uid, doc in zip(doc_uids, stored_docs):
+            if doc is None or doc.get("_id") in failed_ids:
+                failed.append(uid)
+            else:
+                stored.append(uid)
+    return stored, failed
+
+
+def main():
+    """Monitor the mailbox and classify and store new emails until interrupted."""
+    # Load the embedding model once before the first email arrives
+    warm_up_embedding_models()
+    # Build the prompt, parser and LLM client once for the whole run
+    get_classifier()
+    start_mongo()
+    atexit.register(stop_mongo)
+    monitor = EmailMonitor()
+    print(f"Starting email monitoring for {EMAIL_USER}...")
+    
+    prefilter = get_duplicate_prefilter()
+    # One loop for every batch, so the LLM client's async connections are reused
+    llm_loop = asyncio.new_event_loop()
+    for emails in monitor.monitor_emails():
+        try:
+            stored, failed = classify_and_store(emails, prefilter, llm_loop)
+        except Exception as e:
+            # Left unacknowledged, so the whole batch is fetched again without using up retry attempts
+            print(f"Error classifying and storing emails: {str(e)}")
+            continue
+        monitor.acknowledge(stored, failed)
@@ -0,0 +1,171 @@
+"""
+Query helpers for reading stored emails: filters, projections and keyset pagination on
+(created_at, _id).
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+from bson import ObjectId
+
+# Left out of responses unless explicitly requested with `fields=`
+HEAVY_FIELDS = ["embedding", "attachments.content"]
+# Always returned so the next page's cursor can be built
+CURSOR_FIELDS = ["_id", "created_at"]
+DESCENDING_SORT = [("created_at", -1), ("_id", -1)]
+
+EMAIL_INDEXES = [
+    [("created_at", -1), ("_id", -1)],
+    [("main_intent", 1), ("created_at", -1), ("_id", -1)],
+    [("request_details.urgency", 1), ("created_at", -1), ("_id", -1)],
+    [("request_details.suggested_assignee", 1), ("created_at", -1), ("_id", -1)],
+]
+
+
+def encode_cursor(doc: Dict[str, Any]) -> str:
+    """
+    Build an opaque cursor pointing just past a document.
+
+    Args:
+        doc (Dict[str, Any]): Last document of a page
+
+    Returns:
+        str: URL-safe cursor token
+    """
+    payload = {"created_at": doc["created_at"].isoformat(), "_id": str(doc["_id"])}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    """
+    Decode a cursor built by encode_cursor.
+
+    Args:
+        cursor (str): Cursor token
+
+    Returns:
+        Dict[str, Any]: `created_at` (datetime) and `_id` (ObjectId)
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return {"created_at": datetime.fromisoformat(payload["created_at"]), "_id": ObjectId(payload["_id"])}
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def keyset_condition(position: Dict[str, Any], descending: bool = True) -> Dict[str, Any]:
+    """
+    Build the filter that selects documents after `position` in (created_at, _id) order.
+
+    Args:
+        position (Dict[str, Any]): `created_at` and `_id` of the last document already returned
+        descending (bool): Whether pages run newest first
+
+    Returns:
+        Dict[str, Any]: MongoDB filter
+    """
+    op = "$lt" if descending else "$gt"
+    return {"$or": [
+        {"created_at": {op: position["created_at"]}},
+        {"created_at": position["created_at"], "_id": {op: position["_id"]}}
+    ]}
+
+
+def build_email_filter(main_intent: Optional[str] = None,
+                       urgency: Optional[str] = None,
+                       assignee: Optional[str] = None,
+                       created_from: Optional[datetime] = None,
+                       created_to: Optional[datetime] = None,
+                       after: Optional[Dict[str, Any]] = None,
+                       descending: bool = True) -> Dict[str, Any]:
+    """
+    Build the MongoDB filter for an email listing.
+
+    Args:
+        main_intent (Optional[str]): Exact main intent
+        urgency (Optional[str]): Urgency of any request detail
+        assignee (Optional[str]): Suggested assignee of any request detail
+        created_from (Optional[datetime]): Inclusive lower bound on created_at
+        created_to (Optional[datetime]): Exclusive upper bound on created_at
+        after (Optional[Dict[str, Any]]): Keyset position to continue from
+        descending (bool): Whether results are sorted newest first
+
+    Returns:
+        Dict[str, Any]: MongoDB filter
+    """
+    conditions: List[Dict[str, Any]] = []
+    if main_intent:
+        conditions.append({"main_intent": main_intent})
+    if urgency:
+        conditions.append({"request_details.urgency": urgency})
+    if assignee:
+        conditions.append({"request_details.suggested_assignee": assignee})
+    if created_from or created_to:
+        date_range = {}
+        if created_from:
+            date_range["$gte"] = created_from
+        if created_to:
+            date_range["$lt"] = created_to
+        conditions.append({"created_at": date_range})
+    if after:
+        conditions.append(keyset_condition(after, descending))
+
+    if not conditions:
+        return {}
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+def build_projection(fields: Optional[str] = None) -> Dict[str, int]:
+    """
+    Build the projection for an email listing.
+
+    Args:
+        fields (Optional[str]): Comma-separated fields to return; all but the heavy fields when omitted
+
+    Returns:
+        Dict[str, int]: MongoDB projection
+    """
+    if not fields:
+        return {field: 0 for field in HEAVY_FIELDS}
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    return {field: 1 for field in requested + CURSOR_FIELDS}
+
+
+def summarize_email(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build the compact form of a stored email pushed to live subscribers.
+
+    Args:
+        doc (Dict[str, Any]): Stored email document
+
+    Returns:
+        Dict[str, Any]: Identity, routing and duplicate fields of the email
+    """
+    request_detail = (doc.get("request_details") or [{}])[0]
+    return {
+        "_id": doc["_id"],
+        "subject": doc.get("subject"),
+        "sender": doc.get("sender"),
+        "main_intent": doc.get("main_intent"),
+        "request_type": request_detail.get("request_type"),
+        "sub_request_type": request_detail.get("sub_request_type"),
+        "suggested_assignee": request_detail.get("suggested_assignee"),
+        "urgency": request_detail.get("urgency"),
+        "duplicate": doc.get("duplicate", False),
+        "duplicate_score": doc.get("duplicate_score"),
+        "created_at": doc.get("created_at")
+    }
+
+
+def strip_heavy_fields(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Remove the fields build_projection leaves out by default from an already-fetched document."""
+    doc = {key: value for key, value in doc.items() if key != "embedding"}
+    if doc.get("attachments"):
+        doc["attachments"] = [
+            {key: value for key, value in attachment.items() if key != "content"}
+            for attachment in doc["attachments"]
+        ]
+    return doc
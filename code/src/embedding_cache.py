@@ -0,0 +1,198 @@
+"""
+Content-addressed cache for email embeddings.
+Embeddings are keyed by a hash of the normalized email text plus the model name, and kept in
+an in-memory LRU tier backed by a size-bounded SQLite tier on local disk.
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "embedding_cache.sqlite3")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalize text so that re-sent and replayed emails produce the same cache key.
+
+    Args:
+        text (str): Raw text
+
+    Returns:
+        str: NFC-normalized text with whitespace runs collapsed
+    """
+    text = unicodedata.normalize("NFC", text or "")
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def make_cache_key(text: str, model_name: str) -> str:
+    """
+    Build the cache key for a text embedded with a given model.
+
+    Args:
+        text (str): Text that will be embedded
+        model_name (str): Embedding model identifier
+
+    Returns:
+        str: Hex SHA-256 digest
+    """
+    return hashlib.sha256(f"{model_name}\n{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self,
+                 path: Optional[str] = None,
+                 memory_items: Optional[int] = None,
+                 max_disk_bytes: Optional[int] = None):
+        """
+        Initialize the cache tiers.
+
+        Args:
+            path (Optional[str]): SQLite file for the disk tier; defaults to EMBEDDING_CACHE_PATH
+            memory_items (Optional[int]): Maximum entries in the LRU tier; defaults to EMBEDDING_CACHE_MEMORY_ITEMS
+            max_disk_bytes (Optional[int]): Maximum vector bytes on disk; defaults to EMBEDDING_CACHE_MAX_BYTES
+        """
+        self.path = path or os.getenv("EMBEDDING_CACHE_PATH", DEFAULT_CACHE_PATH)
+        self.memory_items = memory_items or int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", "2048"))
+        self.max_disk_bytes = max_disk_bytes or int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, model TEXT NOT NULL, vector BLOB NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)")
+        self._conn.commit()
+        self._disk_bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+        ).fetchone()[0]
+
+    def get(self, text: str, model_name: str) -> Optional[List[float]]:
+        """
+        Look up the embedding for a text.
+
+        Args:
+            text (str): Text that would be embedded
+            model_name (str): Embedding model identifier
+
+        Returns:
+            Optional[List[float]]: Cached embedding, or None on a miss
+        """
+        key = make_cache_key(text, model_name)
+        with self._lock:
+            embedding = self._memory.get(key)
+            if embedding is not None:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return embedding
+
+            row = self._conn.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+
+            self._conn.execute("UPDATE embeddings SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            vector = array("f")
+            vector.frombytes(row[0])
+            embedding = vector.tolist()
+            self._remember(key, embedding)
+            self._stats["disk_hits"] += 1
+            return embedding
+
+    def put(self, text: str, model_name: str, embedding: List[float]):
+        """
+        Store the embedding for a text in both tiers.
+
+        Args:
+            text (str): Embedded text
+            model_name (str): Embedding model identifier
+            embedding (List[float]): Embedding vector
+        """
+        key = make_cache_key(text, model_name)
+        blob = array("f", embedding).tobytes()
+        with self._lock:
+            self._remember(key, list(embedding))
+            previous = self._conn.execute("SELECT LENGTH(vector) FROM embeddings WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector, last_access) VALUES (?, ?, ?, ?)",
+                (key, model_name, blob, time.time())
+            )
+            self._disk_bytes += len(blob) - (previous[0] if previous else 0)
+            if self._disk_bytes > self.max_disk_bytes:
+                self._evict_disk()
+            self._conn.commit()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get hit/miss counters and tier sizes.
+
+        Returns:
+            Dict[str, Any]: Cache statistics, including the overall hit rate
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+            stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+            stats["memory_items"] = len(self._memory)
+            stats["disk_bytes"] = self._disk_bytes
+            return stats
+
+    def close(self):
+        """Close the disk tier."""
+        with self._lock:
+            self._conn.close()
+
+    def _remember(self, key: str, embedding: List[float]):
+        self._memory[key] = embedding
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self):
+        # Drop least recently used rows until the tier is back under 90% of its budget
+        target = int(self.max_disk_bytes * 0.9)
+        rows = self._conn.execute("SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_access ASC")
+        evicted = []
+        for key, size in rows:
+            if self._disk_bytes <= target:
+                break
+            evicted.append((key,))
+            self._disk_bytes -= size
+        rows.close()
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", evicted)
+        self._stats["evictions"] += len(evicted)
+
+
+_shared_cache: Optional[EmbeddingCache] = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """
+    Get the process-wide embedding cache.
+
+    Returns:
+        Optional[EmbeddingCache]: Shared cache, or None when EMBEDDING_CACHE_ENABLED is false
+    """
+    global _shared_cache
+    if os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "false":
+        return None
+    if _shared_cache is None:
+        with _shared_cache_lock:
+            if _shared_cache is None:
+                _shared_cache = EmbeddingCache()
+    return _shared_cache
@@ -0,0 +1,104 @@
+"""
+Offline evaluation of the kNN fast path against the LLM labels already stored in MongoDB.
+
+Every labelled email is classified leave-one-out from the other stored emails, with the same vote
+as KnnClassifier, for each margin in --margins. For each margin the report gives the share of
+emails the fast path would have decided (the LLM calls saved) and how often its label agrees with
+the stored LLM label. Neighbours at --duplicate-cosine or above are skipped, since the fingerprint
+prefilter already reuses the classification of such near-copies before the fast path runs.
+
+Usage:
+    python evaluate_knn_classifier.py --k 10 --min-similarity 0.9 --min-neighbors 5 --margins 0.5 0.6 0.7 0.8 0.9
+"""
+
+import argparse
+import time
+from typing import Dict, Any, List
+
+import numpy as np
+from knn_classifier import get_label, vote
+from mongo_client import get_emails_collection
+
+
+def load_labelled_emails(limit: int):
+    """Load embeddings and labels of emails classified by the LLM."""
+    cursor = get_emails_collection().find(
+        {"embedding": {"$ne": None}},
+        {"embedding": 1, "main_intent": 1, "request_details": 1, "classification_source": 1}
+    )
+    if limit:
+        cursor = cursor.limit(limit)
+    labels, vectors = [], []
+    for doc in cursor:
+        label = get_label(doc)
+        if label is not None and doc.get("embedding"):
+            labels.append(label)
+            vectors.append(doc["embedding"])
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if len(matrix):
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    return labels, matrix
+
+
+def leave_one_out_neighbors(matrix: np.ndarray, k: int, duplicate_cosine: float) -> List[List[tuple]]:
+    """
+    Find each email's nearest neighbours among the others.
+
+    Returns:
+        List[List[tuple]]: Per email, (row, Atlas-scale score) pairs, most similar first
+    """
+    neighbors = []
+    for row in range(len(matrix)):
+        cosine = matrix @ matrix[row]
+        cosine[row] = -np.inf
+        cosine[cosine >= duplicate_cosine] = -np.inf
+        top = np.argpartition(-cosine, min(k, len(cosine) - 1))[:k]
+        top = top[np.argsort(-cosine[top])]
+        neighbors.append([(int(i), float((1 + cosine[i]) / 2)) for i in top if np.isfinite(cosine[i])])
+    return neighbors
+
+
+def evaluate(labels: List[tuple], neighbors: List[List[tuple]], min_similarity: float,
+             margin: float, min_neighbors: int) -> Dict[str, Any]:
+    """Score one margin: coverage (LLM calls saved) and agreement with the stored labels."""
+    decided = agreed = 0
+    for row, row_neighbors in enumerate(neighbors):
+        decision = vote([(score, labels[i]) for i, score in row_neighbors], min_similarity, margin, min_neighbors)
+        if decision:
+            decided += 1
+            agreed += decision["label"] == labels[row]
+    return {
+        "margin": margin,
+        "decided": decided,
+        "llm_calls_saved": decided / len(labels) if labels else 0.0,
+        "agreement": agreed / decided if decided else 0.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--min-similarity", type=float, default=0.9)
+    parser.add_argument("--min-neighbors", type=int, default=5)
+    parser.add_argument("--margins", type=float, nargs="+", default=[0.5, 0.6, 0.7, 0.8, 0.9])
+    parser.add_argument("--duplicate-cosine", type=float, default=0.999)
+    parser.add_argument("--limit", type=int, default=0, help="Evaluate at most this many stored emails (0 for all)")
+    args = parser.parse_args()
+
+    labels, matrix = load_labelled_emails(args.limit)
+    print(f"Labelled emails: {len(labels)} across {len(set(labels))} (main_intent, request_type) labels")
+    if len(labels) < 2:
+        return
+
+    start = time.perf_counter()
+    neighbors = leave_one_out_neighbors(matrix, args.k, args.duplicate_cosine)
+    print(f"Neighbour search: {time.perf_counter() - start:.1f}s "
+          f"(k={args.k}, min similarity {args.min_similarity}, min neighbours {args.min_neighbors})")
+    for margin in args.margins:
+        result = evaluate(labels, neighbors, args.min_similarity, margin, args.min_neighbors)
+        print(f"margin {margin:.2f}: {result['decided']:>6} decided, "
+              f"{result['llm_calls_saved']:6.1%} LLM calls saved, {result['agreement']:6.1%} agreement")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,53 +1,261 @@
 from bs4 import BeautifulSoup
 import fitz  # PyMuPDF
-from google.cloud import vision
-import json
 import os
-import io
+import multiprocessing
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, List, Optional
+from attachment_cache import get_attachment_cache, content_digest
+from ocr_service import get_ocr_service
+from pdf_worker import parse_pdf_text, report_pid
 
-def perform_ocr(image_bytes_io):
-    try:
-        credentials_path = os.getenv("CREDENTIALS_PATH")
-        if not os.path.exists(credentials_path):
-            raise FileNotFoundError("cloud-vision-api-key.json not found in project directory.")
+# Bump when a change to the PDF extraction would give different text for the same file
+PDF_EXTRACTOR_VERSION = f"pymupdf-{fitz.VersionBind}-1"
 
-        # Check if file content is valid JSON
-        with open(credentials_path, "r") as f:
-            try:
-                json.load(f)
-            except json.JSONDecodeError as e:
-                raise ValueError(f"Invalid JSON in credentials file: {e}")
 
-        client = vision.ImageAnnotatorClient.from_service_account_file(credentials_path)
+# Extractor of images whose OCR backend could not be created; never looked up or stored
+OCR_UNAVAILABLE = "ocr-unavailable"
 
-        image_bytes_io.seek(0)
-        content = image_bytes_io.read()
-        image = vision.Image(content=content)
 
-        response = client.text_detection(image=image)
+def ocr_extractor_version() -> str:
+    """Get the cache version of the configured OCR backend, or OCR_UNAVAILABLE if it cannot be created."""
+    try:
+        return f"ocr-{get_ocr_service().backend.version}"
+    except Exception as e:
+        print(f"OCR Error: {e}")
+        return OCR_UNAVAILABLE
 
-        if response.error.message:
-            raise Exception(f"Vision API Error: {response.error.message}")
 
-        if response.text_annotations:
-            return response.text_annotations[0].description
-        else:
-            return "No text found in image."
+def _is_cacheable(kind: str, text: str) -> bool:
+    # Failed OCR is retried next time rather than remembered
+    return kind == "pdf" or not text.startswith("OCR failed: ")
+
 
+def perform_ocr(image_bytes_io):
+    """OCR one image through the shared OCR service, reusing the text of an identical earlier image."""
+    try:
+        image_bytes_io.seek(0)
+        content = image_bytes_io.read()
+        cache = get_attachment_cache()
+        digest, extractor = content_digest(content), ocr_extractor_version()
+        text = cache.get(digest, extractor) if cache and extractor != OCR_UNAVAILABLE else None
+        if text is None:
+            text = get_ocr_service().ocr([content])[0]
+            if cache and extractor != OCR_UNAVAILABLE and _is_cacheable("image", text):
+                cache.put(digest, extractor, text)
+        return text
     except Exception as e:
         print(f"OCR Error: {e}")
         return f"OCR failed: {e}"
 
 def extract_text_from_pdf(file_data):
+    """Extract the text of a PDF, reusing the text of an identical earlier file."""
+    cache = get_attachment_cache()
+    digest = content_digest(file_data)
+    extracted_text = cache.get(digest, PDF_EXTRACTOR_VERSION) if cache else None
+    if extracted_text is not None:
+        return extracted_text
     extracted_text = ""
     try:
-        with io.BytesIO(file_data) as pdf_buffer:
-            doc = fitz.open(stream=pdf_buffer, filetype="pdf")
-            extracted_text = "\n".join([page.get_text("text") for page in doc])
+        extracted_text = parse_pdf_text(file_data)
+        if cache:
+            cache.put(digest, PDF_EXTRACTOR_VERSION, extracted_text)
     except Exception as e:
         print(f"PDF Parsing Error: {e}")
-    return extracted_text.strip()
+    return extracted_text
 
 def extract_text_from_html(html_content):
     soup = BeautifulSoup(html_content, "html.parser")
-    return soup.get_text(separator="\n").strip()
\ No newline at end of file
+    return soup.get_text(separator="\n").strip()
+
+
+_pdf_executor: Optional[ProcessPoolExecutor] = None
+# Process ids reported by each PDF pool's workers as they start
+_pdf_worker_pids: Dict[ProcessPoolExecutor, Any] = {}
+_ocr_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_pdf_executor() -> ProcessPoolExecutor:
+    """
+    Get the process pool for PDF parsing, sized by ATTACHMENT_PDF_WORKERS.
+    PyMuPDF is CPU-bound and holds the GIL, so PDFs are parsed in separate processes.
+
+    Returns:
+        ProcessPoolExecutor: Shared PDF pool
+    """
+    global _pdf_executor
+    with _executor_lock:
+        if _pdf_executor is None:
+            # Fork workers from a clean server process, not from the parent with its client threads and sockets.
+            # The server preloads only pdf_worker, so each worker starts with PyMuPDF already imported
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload(["pdf_worker"])
+            pids = context.SimpleQueue()
+            _pdf_executor = ProcessPoolExecutor(
+                max_workers=int(os.getenv("ATTACHMENT_PDF_WORKERS", str(min(4, os.cpu_count() or 1)))),
+                mp_context=context,
+                initializer=report_pid,
+                initargs=(pids,)
+            )
+            _pdf_worker_pids[_pdf_executor] = pids
+        return _pdf_executor
+
+
+def get_ocr_executor() -> ThreadPoolExecutor:
+    """
+    Get the thread pool for OCR requests, sized by ATTACHMENT_OCR_WORKERS.
+
+    Returns:
+        ThreadPoolExecutor: Shared OCR pool
+    """
+    global _ocr_executor
+    with _executor_lock:
+        if _ocr_executor is None:
+            _ocr_executor = ThreadPoolExecutor(
+                max_workers=int(os.getenv("ATTACHMENT_OCR_WORKERS", "8")),
+                thread_name_prefix="attachment-ocr"
+            )
+        return _ocr_executor
+
+
+def _reset_pdf_executor(broken: ProcessPoolExecutor):
+    global _pdf_executor
+    with _executor_lock:
+        if _pdf_executor is broken:
+            _pdf_executor = None
+
+
+def _recycle_pdf_executor(stuck: ProcessPoolExecutor):
+    # A running task cannot be cancelled, so a hung parse would hold its worker forever;
+    # kill the pool's workers and let the next email start a fresh pool
+    _reset_pdf_executor(stuck)
+    pids = _pdf_worker_pids.pop(stuck, None)
+    while pids is not None and not pids.empty():
+        try:
+            os.kill(pids.get(), signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    stuck.shutdown(wait=False, cancel_futures=True)
+
+
+def extract_attachments_batch(emails_attachments: List[List[Dict[str, Any]]], timeout: Optional[float] = None) -> List[List[Dict[str, str]]]:
+    """
+    Extract text from the attachments of several emails concurrently: PDFs on the process pool,
+    and the images of all the emails through the OCR service in as few batched calls as its
+    backend allows, on the thread pool. Attachments already in the attachment cache are not
+    extracted again, and identical attachments within the batch are extracted once.
+
+    Args:
+        emails_attachments (List[List[Dict[str, Any]]]): Per email, attachments with `filename`,
+            `kind` ("pdf" or "image") and raw `data`
+        timeout (Optional[float]): Seconds each attachment may take from submission; defaults to
+            ATTACHMENT_EXTRACTION_TIMEOUT. A PDF or image that times out yields no text
+
+    Returns:
+        List[List[Dict[str, str]]]: Per email, `name` and `content` per attachment, in the original order.
+            Images whose OCR found no text are left out
+    """
+    timeout = timeout or float(os.getenv("ATTACHMENT_EXTRACTION_TIMEOUT", "60"))
+    cache = get_attachment_cache()
+    keys = {}
+    cached = {}
+    submitted = {}
+    images = {}
+    ocr_version = None
+    for e, attachments in enumerate(emails_attachments):
+        for a, attachment in enumerate(attachments):
+            if attachment["kind"] == "pdf":
+                extractor = PDF_EXTRACTOR_VERSION
+            else:
+                # Resolved once, and only for batches with images
+                ocr_version = ocr_version or ocr_extractor_version()
+                extractor = ocr_version
+            key = keys[(e, a)] = (content_digest(attachment["data"]), extractor)
+            if key in cached or key in submitted or key in images:
+                continue
+            text = cache.get(*key) if cache and extractor != OCR_UNAVAILABLE else None
+            if text is not None:
+                cached[key] = text
+            elif attachment["kind"] == "pdf":
+                print(f"Processing PDF attachment: {attachment['filename']}")
+                executor = get_pdf_executor()
+                future = executor.submit(parse_pdf_text, attachment["data"])
+                submitted[key] = (executor, future, None, time.monotonic() + timeout)
+            else:
+                images[key] = attachment["data"]
+
+    if images:
+        try:
+            ocr_service = get_ocr_service()
+        except Exception as ex:
+            # A broken OCR setup (credentials, missing package) fails the images, not the whole batch
+            print(f"OCR Error: {ex}")
+            for key in images:
+                cached[key] = f"OCR failed: {ex}"
+        else:
+            executor = get_ocr_executor()
+            image_keys = list(images)
+            contents = list(images.values())
+            for batch in ocr_service.batches(contents):
+                future = executor.submit(ocr_service.annotate_batch, [contents[i] for i in batch])
+                for position, i in enumerate(batch):
+                    submitted[image_keys[i]] = (executor, future, position, time.monotonic() + timeout)
+
+    results = []
+    stuck_pools = set()
+    for e, attachments in enumerate(emails_attachments):
+        email_results = []
+        for a, attachment in enumerate(attachments):
+            key = keys[(e, a)]
+            if key in cached:
+                content = cached[key]
+            else:
+                executor, future, position, deadline = submitted[key]
+                try:
+                    content = future.result(timeout=max(deadline - time.monotonic(), 0))
+                    if position is not None:
+                        content = content[position]
+                    if cache and key[1] != OCR_UNAVAILABLE and _is_cacheable(attachment["kind"], content):
+                        cache.put(*key, content)
+                    cached[key] = content
+                except TimeoutError:
+                    if not future.cancel() and isinstance(executor, ProcessPoolExecutor):
+                        stuck_pools.add(executor)
+                    print(f"Extraction of {attachment['filename']} timed out after {timeout:.0f}s")
+                    content = ""
+                except BrokenProcessPool as ex:
+                    # A worker died (e.g. a crash inside PyMuPDF); start a fresh pool for the next email
+                    _reset_pdf_executor(executor)
+                    print(f"Extraction of {attachment['filename']} failed: {str(ex)}")
+                    content = ""
+                except Exception as ex:
+                    print(f"Extraction of {attachment['filename']} failed: {str(ex)}")
+                    content = ""
+            if attachment["kind"] == "pdf" or content.strip():
+                email_results.append({"name": attachment["filename"], "content": content})
+        results.append(email_results)
+    # Only once every result of the batch is collected, so other PDFs on the pool are not killed early
+    for executor in stuck_pools:
+        _recycle_pdf_executor(executor)
+    if cache and keys:
+        stats = cache.get_stats()
+        print(f"Attachment cache: {stats['hits']} hits, {stats['misses']} misses (hit rate {stats['hit_rate']:.0%})")
+    return results
+
+
+def extract_attachments(attachments: List[Dict[str, Any]], timeout: Optional[float] = None) -> List[Dict[str, str]]:
+    """
+    Extract text from one email's attachments; see extract_attachments_batch.
+
+    Args:
+        attachments (List[Dict[str, Any]]): Attachments with `filename`, `kind` ("pdf" or "image") and raw `data`
+        timeout (Optional[float]): Seconds each attachment may take from submission
+
+    Returns:
+        List[Dict[str, str]]: `name` and `content` per attachment, in the original order
+    """
+    return extract_attachments_batch([attachments], timeout)[0]
@@ -0,0 +1,225 @@
+"""
+Cheap exact and near-duplicate fingerprinting for incoming emails.
+Each email gets a SHA-256 hash of its normalized sender, subject, body and attachment text plus a
+64-bit SimHash over word shingles of the content. Fingerprints of classified emails are kept in
+SQLite with their classification result, so a confident duplicate from the same sender can reuse
+that result and skip the LLM. Duplicates are only matched per sender because the result carries
+sender-derived fields such as the customer name and email address.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from email.utils import parseaddr
+from typing import Dict, Any, List, Optional
+
+DEFAULT_PREFILTER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "fingerprints.sqlite3")
+
+SIMHASH_BITS = 64
+SHINGLE_SIZE = 4
+# Four 16-bit bands: two SimHashes within 3 bits of each other share at least one band
+SIMHASH_BANDS = 4
+BAND_BITS = SIMHASH_BITS // SIMHASH_BANDS
+
+_REPLY_PREFIX = re.compile(r"^\s*((re|fw|fwd)\s*:\s*)+", re.IGNORECASE)
+
+
+def normalize_subject(subject: str) -> str:
+    """Lowercase a subject and strip Re:/Fwd: prefixes."""
+    return re.sub(r"\s+", " ", _REPLY_PREFIX.sub("", subject or "")).strip().lower()
+
+
+def normalize_body(text: str) -> str:
+    """Lowercase text, drop quoted reply lines and collapse whitespace."""
+    lines = [line for line in (text or "").splitlines() if not line.lstrip().startswith(">")]
+    return re.sub(r"\s+", " ", " ".join(lines)).strip().lower()
+
+
+def normalize_sender(sender: str) -> str:
+    """Reduce a From header to its lowercased address, so display-name changes do not matter."""
+    address = parseaddr(sender or "")[1]
+    return (address or sender or "").strip().lower()
+
+
+def _attachment_text(attachments: List[Dict[str, str]]) -> str:
+    return " ".join(normalize_body(att.get("content", "")) for att in attachments or [])
+
+
+def _hash64(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def simhash(text: str) -> int:
+    """
+    Compute a 64-bit SimHash over word shingles.
+
+    Args:
+        text (str): Normalized text
+
+    Returns:
+        int: Unsigned 64-bit fingerprint
+    """
+    words = text.split()
+    if len(words) < SHINGLE_SIZE:
+        shingles = [" ".join(words)] if words else []
+    else:
+        shingles = [" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)]
+
+    weights = [0] * SIMHASH_BITS
+    for shingle in shingles:
+        value = _hash64(shingle)
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def compute_fingerprint(email_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Fingerprint a parsed email.
+
+    Args:
+        email_data (Dict[str, Any]): Email with subject, body and attachments
+
+    Returns:
+        Dict[str, Any]: `sender` (normalized), `exact` (hex SHA-256 including the sender) and
+            `simhash` (unsigned 64-bit int over the content only)
+    """
+    sender = normalize_sender(email_data.get("sender", ""))
+    subject = normalize_subject(email_data.get("subject", ""))
+    body = normalize_body(email_data.get("body", ""))
+    attachments = _attachment_text(email_data.get("attachments", []))
+    exact = hashlib.sha256("\x1f".join([sender, subject, body, attachments]).encode("utf-8")).hexdigest()
+    return {"sender": sender, "exact": exact, "simhash": simhash(" ".join([subject, body, attachments]))}
+
+
+def _to_signed(value: int) -> int:
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _bands(value: int) -> List[int]:
+    mask = (1 << BAND_BITS) - 1
+    return [(value >> (i * BAND_BITS)) & mask for i in range(SIMHASH_BANDS)]
+
+
+class DuplicatePrefilter:
+    def __init__(self, path: Optional[str] = None, max_distance: Optional[int] = None):
+        """
+        Initialize the fingerprint store.
+
+        Args:
+            path (Optional[str]): SQLite file; defaults to PREFILTER_PATH
+            max_distance (Optional[int]): Largest SimHash Hamming distance treated as a confident duplicate;
+                defaults to PREFILTER_MAX_HAMMING
+        """
+        self.path = path or os.getenv("PREFILTER_PATH", DEFAULT_PREFILTER_PATH)
+        self.max_distance = max_distance if max_distance is not None else int(os.getenv("PREFILTER_MAX_HAMMING", "3"))
+        if self.max_distance >= SIMHASH_BANDS:
+            raise ValueError(f"PREFILTER_MAX_HAMMING must be below {SIMHASH_BANDS} for banded lookup")
+
+        self._lock = threading.Lock()
+        self._stats = {"exact_hits": 0, "near_hits": 0, "misses": 0}
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS fingerprints ("
+            "exact TEXT PRIMARY KEY, simhash INTEGER NOT NULL, "
+            "band0 INTEGER, band1 INTEGER, band2 INTEGER, band3 INTEGER, "
+            "result TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        # Stores created before fingerprints were per sender get the column; their rows never match again
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(fingerprints)")]
+        if "sender" not in columns:
+            self._conn.execute("ALTER TABLE fingerprints ADD COLUMN sender TEXT")
+        for band in range(SIMHASH_BANDS):
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_fingerprints_band{band} ON fingerprints(band{band})")
+        self._conn.commit()
+
+    def lookup(self, email_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Find the classification of an earlier exact or near-duplicate email from the same sender.
+
+        Args:
+            email_data (Dict[str, Any]): Parsed email, optionally carrying a precomputed `fingerprint`
+
+        Returns:
+            Optional[Dict[str, Any]]: Earlier classification result, or None if no confident duplicate exists
+        """
+        fingerprint = email_data.get("fingerprint") or compute_fingerprint(email_data)
+        with self._lock:
+            row = self._conn.execute("SELECT result FROM fingerprints WHERE exact = ?", (fingerprint["exact"],)).fetchone()
+            if row:
+                self._stats["exact_hits"] += 1
+                return json.loads(row[0])
+
+            bands = _bands(fingerprint["simhash"])
+            where = " OR ".join(f"band{i} = ?" for i in range(SIMHASH_BANDS))
+            candidates = self._conn.execute(
+                f"SELECT simhash, result FROM fingerprints WHERE sender = ? AND ({where})",
+                [fingerprint["sender"], *bands]
+            ).fetchall()
+            best = None
+            for candidate_hash, result in candidates:
+                distance = bin((candidate_hash & ((1 << 64) - 1)) ^ fingerprint["simhash"]).count("1")
+                if distance <= self.max_distance and (best is None or distance < best[0]):
+                    best = (distance, result)
+            if best:
+                self._stats["near_hits"] += 1
+                return json.loads(best[1])
+
+            self._stats["misses"] += 1
+            return None
+
+    def remember(self, email_data: Dict[str, Any], result: Dict[str, Any]):
+        """
+        Record the classification of an email so later duplicates can reuse it.
+        Error results are not recorded.
+
+        Args:
+            email_data (Dict[str, Any]): Parsed email, optionally carrying a precomputed `fingerprint`
+            result (Dict[str, Any]): Classification result for the email
+        """
+        if not result or result.get("main_intent") == "ERROR":
+            return
+        fingerprint = email_data.get("fingerprint") or compute_fingerprint(email_data)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO fingerprints "
+                "(exact, sender, simhash, band0, band1, band2, band3, result, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (fingerprint["exact"], fingerprint["sender"], _to_signed(fingerprint["simhash"]),
+                 *_bands(fingerprint["simhash"]), json.dumps(result, default=str), time.time())
+            )
+            self._conn.commit()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get exact/near hit and miss counters."""
+        with self._lock:
+            stats = dict(self._stats)
+            lookups = sum(stats.values())
+            stats["hit_rate"] = (stats["exact_hits"] + stats["near_hits"]) / lookups if lookups else 0.0
+            return stats
+
+
+_shared_prefilter: Optional[DuplicatePrefilter] = None
+_shared_prefilter_lock = threading.Lock()
+
+
+def get_duplicate_prefilter() -> Optional[DuplicatePrefilter]:
+    """
+    Get the process-wide duplicate prefilter.
+
+    Returns:
+        Optional[DuplicatePrefilter]: Shared prefilter, or None when PREFILTER_ENABLED is false
+    """
+    global _shared_prefilter
+    if os.getenv("PREFILTER_ENABLED", "true").lower() == "false":
+        return None
+    if _shared_prefilter is None:
+        with _shared_prefilter_lock:
+            if _shared_prefilter is None:
+                _shared_prefilter = DuplicatePrefilter()
+    return _shared_prefilter
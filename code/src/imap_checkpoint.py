@@ -0,0 +1,137 @@
+"""
+Durable IMAP progress checkpoints.
+
+For each (mailbox, UIDVALIDITY) the store keeps the highest UID handed to the pipeline plus the
+UIDs at or below it that failed and should be retried (the gaps), with how often each has failed.
+A UID that keeps failing is given up after IMAP_CHECKPOINT_MAX_ATTEMPTS tries. UIDs are stable for as long as
+UIDVALIDITY is unchanged, so a restarted worker resumes with `UID SEARCH UID n+1:*` instead of
+rescanning the mailbox. A new UIDVALIDITY starts a fresh checkpoint.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Any, List, Optional
+
+DEFAULT_CHECKPOINT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "imap_checkpoints.sqlite3")
+
+
+def _decode_gaps(text: str) -> Dict[int, int]:
+    # Stored as {uid: failed attempts}; older checkpoints hold a plain list of UIDs
+    gaps = json.loads(text)
+    if isinstance(gaps, list):
+        return {uid: 1 for uid in gaps}
+    return {int(uid): count for uid, count in gaps.items()}
+
+
+class ImapCheckpointStore:
+    def __init__(self, path: Optional[str] = None, max_gaps: Optional[int] = None, max_attempts: Optional[int] = None):
+        """
+        Initialize the checkpoint store.
+
+        Args:
+            path (Optional[str]): SQLite file; defaults to IMAP_CHECKPOINT_PATH
+            max_gaps (Optional[int]): Most failed UIDs kept for retry per mailbox, oldest dropped first;
+                defaults to IMAP_CHECKPOINT_MAX_GAPS
+            max_attempts (Optional[int]): Failed attempts after which a UID is no longer retried;
+                defaults to IMAP_CHECKPOINT_MAX_ATTEMPTS
+        """
+        self.path = path or os.getenv("IMAP_CHECKPOINT_PATH", DEFAULT_CHECKPOINT_PATH)
+        self.max_gaps = max_gaps or int(os.getenv("IMAP_CHECKPOINT_MAX_GAPS", "1000"))
+        self.max_attempts = max_attempts or int(os.getenv("IMAP_CHECKPOINT_MAX_ATTEMPTS", "5"))
+
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            "mailbox TEXT NOT NULL, uidvalidity INTEGER NOT NULL, "
+            "last_uid INTEGER NOT NULL, gaps TEXT NOT NULL, updated_at REAL NOT NULL, "
+            "PRIMARY KEY (mailbox, uidvalidity))"
+        )
+        self._conn.commit()
+
+    def load(self, mailbox: str, uidvalidity: int) -> Optional[Dict[str, Any]]:
+        """
+        Get the checkpoint of a mailbox.
+
+        Args:
+            mailbox (str): Mailbox name
+            uidvalidity (int): Current UIDVALIDITY of the mailbox
+
+        Returns:
+            Optional[Dict[str, Any]]: `last_uid`, `gaps` (sorted UIDs to retry) and `attempts` (failures per gap),
+                or None if this UIDVALIDITY has no checkpoint yet
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT last_uid, gaps FROM checkpoints WHERE mailbox = ? AND uidvalidity = ?",
+                (mailbox, uidvalidity)
+            ).fetchone()
+        if not row:
+            return None
+        attempts = _decode_gaps(row[1])
+        return {"last_uid": row[0], "gaps": sorted(attempts), "attempts": attempts}
+
+    def advance(self, mailbox: str, uidvalidity: int, last_uid: int, processed: List[int], failed: List[int]) -> Dict[str, Any]:
+        """
+        Record the outcome of one fetch cycle.
+
+        Args:
+            mailbox (str): Mailbox name
+            uidvalidity (int): UIDVALIDITY the UIDs belong to
+            last_uid (int): Highest UID covered by the cycle, whether or not it was processed
+            processed (List[int]): UIDs handed to the pipeline, or found to no longer exist
+            failed (List[int]): UIDs that failed this cycle, retried on the next one until they run out of attempts
+
+        Returns:
+            Dict[str, Any]: The new checkpoint
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT last_uid, gaps FROM checkpoints WHERE mailbox = ? AND uidvalidity = ?",
+                (mailbox, uidvalidity)
+            ).fetchone()
+            previous_last, attempts = (row[0], _decode_gaps(row[1])) if row else (0, {})
+            for uid in processed:
+                attempts.pop(uid, None)
+            for uid in set(failed):
+                attempts[uid] = attempts.get(uid, 0) + 1
+            exhausted = sorted(uid for uid, count in attempts.items() if count >= self.max_attempts)
+            if exhausted:
+                print(f"Giving up on emails {exhausted} in {mailbox} after {self.max_attempts} failed attempts")
+                for uid in exhausted:
+                    del attempts[uid]
+            if len(attempts) > self.max_gaps:
+                dropped = sorted(attempts)[:len(attempts) - self.max_gaps]
+                print(f"Giving up on {len(dropped)} failed emails in {mailbox} (IMAP_CHECKPOINT_MAX_GAPS={self.max_gaps})")
+                for uid in dropped:
+                    del attempts[uid]
+            checkpoint = {"last_uid": max(previous_last, last_uid), "gaps": sorted(attempts), "attempts": attempts}
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (mailbox, uidvalidity, last_uid, gaps, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (mailbox, uidvalidity, checkpoint["last_uid"], json.dumps({str(uid): count for uid, count in attempts.items()}), time.time())
+            )
+            self._conn.commit()
+        return checkpoint
+
+
+_shared_store: Optional[ImapCheckpointStore] = None
+_shared_store_lock = threading.Lock()
+
+
+def get_checkpoint_store() -> ImapCheckpointStore:
+    """
+    Get the process-wide checkpoint store.
+
+    Returns:
+        ImapCheckpointStore: Shared store
+    """
+    global _shared_store
+    if _shared_store is None:
+        with _shared_store_lock:
+            if _shared_store is None:
+                _shared_store = ImapCheckpointStore()
+    return _shared_store
@@ -0,0 +1,346 @@
+"""
+Batched, structure-aware IMAP fetching.
+
+Instead of one `FETCH (RFC822)` per message, unseen messages are read in batches by UID:
+1. One `UID FETCH` per batch for BODYSTRUCTURE and the Subject/From/Date headers.
+2. The MIME parts EmailMonitor actually extracts (the body text, PDFs and images) are picked
+   from the structure. Parts over the size caps are skipped without being downloaded.
+3. One `UID FETCH` per group of messages that need the same part sections.
+
+Every fetch uses BODY.PEEK, so messages stay unseen until they have been processed.
+"""
+
+import base64
+import binascii
+import email
+import os
+import quopri
+import re
+from email.utils import collapse_rfc2231_value, decode_rfc2231
+from typing import Dict, Any, List, Optional, Tuple
+
+ATTACHMENT_EXTENSIONS = {
+    ".pdf": "pdf",
+    ".png": "image",
+    ".jpg": "image",
+    ".jpeg": "image"
+}
+HEADER_FIELDS = "BODY.PEEK[HEADER.FIELDS (SUBJECT FROM DATE)]"
+
+_TOKEN = re.compile(rb'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|([^\s()"\[]+(?:\[[^\]]*\][^\s()"]*)?))')
+_LITERAL = re.compile(rb"\{(\d+)\}$")
+
+
+def get_fetch_limits() -> Dict[str, int]:
+    """
+    Get the batch size and part size caps from IMAP_FETCH_BATCH_SIZE, IMAP_MAX_TEXT_BYTES and
+    IMAP_MAX_ATTACHMENT_BYTES.
+
+    Returns:
+        Dict[str, int]: `batch_size`, `max_text_bytes` and `max_attachment_bytes`
+    """
+    return {
+        "batch_size": int(os.getenv("IMAP_FETCH_BATCH_SIZE", "50")),
+        "max_text_bytes": int(os.getenv("IMAP_MAX_TEXT_BYTES", str(1024 * 1024))),
+        "max_attachment_bytes": int(os.getenv("IMAP_MAX_ATTACHMENT_BYTES", str(20 * 1024 * 1024)))
+    }
+
+
+def imap_uid_set(uids: List[int]) -> str:
+    """
+    Build a compact IMAP sequence set, e.g. [1, 2, 3, 7] -> "1:3,7".
+
+    Args:
+        uids (List[int]): Message UIDs
+
+    Returns:
+        str: Sequence set for UID commands
+    """
+    ranges = []
+    for uid in sorted(set(uids)):
+        if ranges and uid == ranges[-1][1] + 1:
+            ranges[-1][1] = uid
+        else:
+            ranges.append([uid, uid])
+    return ",".join(str(start) if start == end else f"{start}:{end}" for start, end in ranges)
+
+
+def _tokenize(response: List[Any]) -> List[Any]:
+    # imaplib returns (line ending in {n}, literal) tuples and bytes for the rest of each line
+    tokens: List[Any] = []
+    for item in response:
+        if isinstance(item, tuple):
+            text, literal = item
+            match = _LITERAL.search(text)
+            tokens.extend(_tokenize_text(text[:match.start()] if match else text))
+            tokens.append(literal)
+        elif isinstance(item, bytes):
+            tokens.extend(_tokenize_text(item))
+    return tokens
+
+
+def _tokenize_text(text: bytes) -> List[Any]:
+    tokens: List[Any] = []
+    position = 0
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if not match or match.end() == position:
+            break
+        position = match.end()
+        if match.group(1):
+            tokens.append("(")
+        elif match.group(2):
+            tokens.append(")")
+        elif match.group(3) is not None:
+            tokens.append(re.sub(rb"\\(.)", rb"\1", match.group(3)))
+        else:
+            atom = match.group(4).decode("ascii", errors="replace")
+            tokens.append(None if atom.upper() == "NIL" else atom)
+    return tokens
+
+
+def _parse_lists(tokens: List[Any]) -> List[Any]:
+    # Nest parentheses; quoted strings and literals stay bytes, atoms become str
+    stack: List[List[Any]] = [[]]
+    for token in tokens:
+        if token == "(":
+            stack.append([])
+        elif token == ")":
+            if len(stack) > 1:
+                done = stack.pop()
+                stack[-1].append(done)
+        else:
+            stack[-1].append(token)
+    while len(stack) > 1:
+        done = stack.pop()
+        stack[-1].append(done)
+    return stack[0]
+
+
+def parse_fetch_response(response: List[Any]) -> Dict[int, Dict[str, Any]]:
+    """
+    Parse the data returned by `imaplib.IMAP4.uid("FETCH", ...)`.
+
+    Args:
+        response (List[Any]): Response data from imaplib
+
+    Returns:
+        Dict[int, Dict[str, Any]]: Fetched items per UID, keyed by upper-case item name,
+            e.g. {"UID": "7", "BODYSTRUCTURE": [...], "BODY[1]": b"..."}
+    """
+    parsed = _parse_lists(_tokenize(response))
+    messages: Dict[int, Dict[str, Any]] = {}
+    for element in parsed:
+        if not isinstance(element, list):
+            continue  # Sequence number or trailing FETCH keyword
+        items = {}
+        for i in range(0, len(element) - 1, 2):
+            key = element[i]
+            if isinstance(key, str):
+                # Servers answer BODY.PEEK[...] as BODY[...] and may add a <origin> suffix
+                items[re.sub(r"<\d+>$", "", key.upper())] = element[i + 1]
+        if "UID" in items:
+            messages[int(items["UID"])] = items
+    return messages
+
+
+def _text(value: Any) -> str:
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    return value or ""
+
+
+def _params(value: Any) -> Dict[str, str]:
+    params = {}
+    if isinstance(value, list):
+        for i in range(0, len(value) - 1, 2):
+            params[_text(value[i]).lower()] = _text(value[i + 1])
+    return params
+
+
+def _filename(params: Dict[str, str]) -> Optional[str]:
+    for key in ("filename", "name"):
+        if key in params:
+            return params[key]
+        if key + "*" in params:
+            # RFC 2231 form: charset'language'percent-encoded
+            return collapse_rfc2231_value(decode_rfc2231(params[key + "*"]))
+    return None
+
+
+def list_parts(structure: List[Any], section: str = "") -> List[Dict[str, Any]]:
+    """
+    Flatten a parsed BODYSTRUCTURE into its leaf parts, in the order `Message.walk` visits them.
+
+    Args:
+        structure (List[Any]): Parsed BODYSTRUCTURE list
+        section (str): Section number of `structure`; empty for the whole message
+
+    Returns:
+        List[Dict[str, Any]]: Parts with `section`, `content_type`, `filename`, `encoding`,
+            `charset` and `size` (encoded bytes)
+    """
+    if structure and isinstance(structure[0], list):
+        parts = []
+        # Child parts come first; the subtype and extension data follow
+        for i, child in enumerate(structure):
+            if not isinstance(child, list):
+                break
+            parts.extend(list_parts(child, f"{section}.{i + 1}" if section else str(i + 1)))
+        return parts
+
+    content_type = f"{_text(structure[0])}/{_text(structure[1])}".lower()
+    part_section = section or "1"
+    if content_type == "message/rfc822" and len(structure) > 8 and isinstance(structure[8], list):
+        # Encapsulated message: its body is numbered under this part
+        inner = structure[8]
+        return list_parts(inner, part_section) if isinstance(inner[0], list) else list_parts(inner, f"{part_section}.1")
+
+    params = _params(structure[2])
+    # Text parts carry a line count before the extension data (MD5, then disposition)
+    disposition_index = 9 if content_type.startswith("text/") else 8
+    disposition = structure[disposition_index] if len(structure) > disposition_index else None
+    disposition_params = _params(disposition[1]) if isinstance(disposition, list) and len(disposition) > 1 else {}
+    return [{
+        "section": part_section,
+        "content_type": content_type,
+        "filename": _filename(disposition_params) or _filename(params),
+        "encoding": _text(structure[5]).lower(),
+        "charset": params.get("charset"),
+        "size": int(structure[6]) if isinstance(structure[6], str) and structure[6].isdigit() else 0
+    }]
+
+
+def select_parts(parts: List[Dict[str, Any]],
+                 multipart: bool,
+                 max_text_bytes: int,
+                 max_attachment_bytes: int) -> List[Dict[str, Any]]:
+    """
+    Pick the parts EmailMonitor extracts: the last text/plain or text/html part as the body,
+    plus every PDF and image attachment. Oversized parts are dropped.
+
+    Args:
+        parts (List[Dict[str, Any]]): Parts from list_parts
+        multipart (bool): Whether the message is multipart; a single-part message's body is always read
+        max_text_bytes (int): Largest body part to download
+        max_attachment_bytes (int): Largest attachment to download
+
+    Returns:
+        List[Dict[str, Any]]: Selected parts with a `kind` of "text", "html", "pdf" or "image"
+    """
+    if not multipart:
+        body_parts = [dict(parts[0], kind="text")] if parts else []
+        attachments = []
+    else:
+        body_parts = [
+            dict(part, kind="text" if part["content_type"] == "text/plain" else "html")
+            for part in parts if part["content_type"] in ("text/plain", "text/html")
+        ][-1:]  # The last one wins, as in the full-message walk
+        attachments = []
+        for part in parts:
+            extension = os.path.splitext((part["filename"] or "").lower())[1]
+            if part["content_type"] not in ("text/plain", "text/html") and extension in ATTACHMENT_EXTENSIONS:
+                attachments.append(dict(part, kind=ATTACHMENT_EXTENSIONS[extension]))
+
+    selected = []
+    for part in body_parts:
+        if part["size"] > max_text_bytes:
+            print(f"Skipping {part['size']}-byte body part {part['section']} (IMAP_MAX_TEXT_BYTES={max_text_bytes})")
+        else:
+            selected.append(part)
+    for part in attachments:
+        if part["size"] > max_attachment_bytes:
+            print(f"Skipping {part['size']}-byte attachment {part['filename']} (IMAP_MAX_ATTACHMENT_BYTES={max_attachment_bytes})")
+        else:
+            selected.append(part)
+    return selected
+
+
+def decode_part(data: Optional[bytes], encoding: str) -> bytes:
+    """
+    Undo a part's Content-Transfer-Encoding.
+
+    Args:
+        data (Optional[bytes]): Part body as fetched
+        encoding (str): Transfer encoding from BODYSTRUCTURE
+
+    Returns:
+        bytes: Decoded part content
+    """
+    if not data:
+        return b""
+    if encoding == "base64":
+        try:
+            return base64.b64decode(data, validate=False)
+        except binascii.Error:
+            return base64.b64decode(data + b"=" * (-len(data) % 4))
+    if encoding == "quoted-printable":
+        return quopri.decodestring(data)
+    return data
+
+
+def decode_text(part: Dict[str, Any]) -> str:
+    """Decode a fetched text part using its declared charset, falling back to UTF-8."""
+    try:
+        return part["data"].decode(part.get("charset") or "utf-8", errors="ignore")
+    except LookupError:
+        return part["data"].decode("utf-8", errors="ignore")
+
+
+def attachment_parts(message: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Get the PDF and image parts of a message returned by fetch_messages."""
+    return [part for part in message["parts"] if part["kind"] in ("pdf", "image")]
+
+
+def _fetch(mail, uids: List[int], items: str) -> Dict[int, Dict[str, Any]]:
+    status, response = mail.uid("FETCH", imap_uid_set(uids), f"(UID {items})")
+    if status != "OK":
+        raise Exception(f"UID FETCH failed: {response}")
+    return parse_fetch_response(response)
+
+
+def fetch_messages(mail, uids: List[int], limits: Optional[Dict[str, int]] = None) -> Dict[int, Dict[str, Any]]:
+    """
+    Fetch the headers and extractable parts of messages in batches.
+
+    Args:
+        mail: Logged-in imaplib connection with the mailbox selected
+        uids (List[int]): UIDs to fetch
+        limits (Optional[Dict[str, int]]): Overrides for get_fetch_limits()
+
+    Returns:
+        Dict[int, Dict[str, Any]]: Per UID, the parsed `headers` (email.message.Message) and the
+            selected `parts`, each with its decoded `data`
+    """
+    limits = {**get_fetch_limits(), **(limits or {})}
+    messages: Dict[int, Dict[str, Any]] = {}
+    for start in range(0, len(uids), limits["batch_size"]):
+        batch = uids[start:start + limits["batch_size"]]
+        structures = _fetch(mail, batch, f"BODYSTRUCTURE {HEADER_FIELDS}")
+
+        # Group messages that need the same sections so each group is one round trip
+        groups: Dict[Tuple[str, ...], List[int]] = {}
+        for uid, items in structures.items():
+            header_key = next((key for key in items if key.startswith("BODY[HEADER")), None)
+            structure = items.get("BODYSTRUCTURE") or []
+            parts = select_parts(
+                list_parts(structure),
+                multipart=bool(structure) and isinstance(structure[0], list),
+                max_text_bytes=limits["max_text_bytes"],
+                max_attachment_bytes=limits["max_attachment_bytes"]
+            )
+            messages[uid] = {
+                "headers": email.message_from_bytes(items.get(header_key) or b""),
+                "parts": parts
+            }
+            sections = tuple(part["section"] for part in parts)
+            if sections:
+                groups.setdefault(sections, []).append(uid)
+
+        for sections, group_uids in groups.items():
+            bodies = _fetch(mail, group_uids, " ".join(f"BODY.PEEK[{section}]" for section in sections))
+            for uid in group_uids:
+                items = bodies.get(uid, {})
+                for part in messages[uid]["parts"]:
+                    part["data"] = decode_part(items.get(f"BODY[{part['section']}]"), part["encoding"])
+    return messages
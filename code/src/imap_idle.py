@@ -0,0 +1,122 @@
+"""
+IMAP IDLE (RFC 2177) support for imaplib connections, which have no IDLE command of their own.
+
+`wait_for_new_mail` holds an IDLE open until the server reports a new message with an untagged
+EXISTS response, or until the timeout. Servers drop an IDLE after a while (RFC 2177 allows 30
+minutes; Gmail closes sooner), so callers wait with IMAP_IDLE_TIMEOUT below that and re-issue.
+"""
+
+import os
+import re
+import select
+import ssl
+import time
+
+_EXISTS = re.compile(rb"^\* \d+ EXISTS", re.IGNORECASE)
+
+
+def get_idle_timeout() -> float:
+    """
+    Get the seconds to hold one IDLE before re-issuing it, from IMAP_IDLE_TIMEOUT.
+
+    Returns:
+        float: IDLE timeout in seconds
+    """
+    return float(os.getenv("IMAP_IDLE_TIMEOUT", "540"))
+
+
+def supports_idle(mail) -> bool:
+    """Check whether the server advertised the IDLE capability."""
+    return "IDLE" in getattr(mail, "capabilities", ())
+
+
+def take_pending_exists(mail) -> bool:
+    """
+    Consume EXISTS responses imaplib collected during earlier commands, e.g. a message that
+    arrived while the last batch was being stored.
+
+    Returns:
+        bool: True if the mailbox grew since the responses were last taken
+    """
+    return bool(mail.untagged_responses.pop("EXISTS", None))
+
+
+def _buffered(mail) -> bool:
+    # Peek without blocking: a read on the raw socket is only attempted when the buffer is empty
+    timeout = mail.sock.gettimeout()
+    mail.sock.settimeout(0)
+    try:
+        return bool(mail.file.peek(1))
+    except (BlockingIOError, ssl.SSLWantReadError):
+        return False
+    finally:
+        mail.sock.settimeout(timeout)
+
+
+def _readable(mail, timeout: float) -> bool:
+    # imaplib's buffered file may already hold a response that arrived with the last line read,
+    # and TLS may hold decrypted bytes; select() on the socket sees neither
+    if _buffered(mail):
+        return True
+    if hasattr(mail.sock, "pending") and mail.sock.pending():
+        return True
+    readable, _, _ = select.select([mail.sock], [], [], max(timeout, 0))
+    return bool(readable)
+
+
+def _idle_once(mail, timeout: float) -> bool:
+    tag = mail._new_tag()
+    mail.send(tag + b" IDLE\r\n")
+    while True:
+        line = mail.readline()
+        if not line:
+            raise ConnectionError("IMAP connection closed while starting IDLE")
+        if line.startswith(b"+"):
+            break
+        if line.startswith(tag):
+            raise Exception(f"IDLE rejected: {line.decode(errors='ignore').strip()}")
+        if _EXISTS.match(line):
+            timeout = 0  # Already have news; end the IDLE straight away
+
+    new_mail = False
+    deadline = time.monotonic() + timeout
+    # Leave at the first untagged response; DONE below drains whatever else is buffered
+    if _readable(mail, deadline - time.monotonic()):
+        line = mail.readline()
+        if not line:
+            raise ConnectionError("IMAP connection closed during IDLE")
+        new_mail = bool(_EXISTS.match(line))
+
+    mail.send(b"DONE\r\n")
+    while True:
+        line = mail.readline()
+        if not line:
+            raise ConnectionError("IMAP connection closed while ending IDLE")
+        if line.startswith(tag):
+            if b" OK" not in line.upper():
+                raise Exception(f"IDLE failed: {line.decode(errors='ignore').strip()}")
+            return new_mail
+        new_mail = new_mail or bool(_EXISTS.match(line))
+
+
+def wait_for_new_mail(mail, timeout: float) -> bool:
+    """
+    Block in IDLE until a new message arrives or the timeout passes.
+
+    Args:
+        mail: Logged-in imaplib connection with the mailbox selected
+        timeout (float): Seconds to wait at most; IDLE is re-issued on other untagged
+            responses such as flag changes
+
+    Returns:
+        bool: True if a new message arrived, False on timeout
+    """
+    if take_pending_exists(mail):
+        return True
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        if _idle_once(mail, remaining):
+            return True
@@ -0,0 +1,214 @@
+"""
+In-memory stand-in for an imaplib IMAP4 connection, used by the IMAP benchmark scripts.
+
+It serves raw RFC 822 messages and answers the commands EmailMonitor issues, in the same
+response shape imaplib returns, while counting round trips and bytes sent to the client.
+"""
+
+import email
+import os
+import re
+from email import policy
+from email.message import Message
+from typing import Any, List, Optional, Tuple
+
+from imap_fetch import ATTACHMENT_EXTENSIONS
+from sample_corpus import SAMPLE_DIR
+
+
+def _quote(value: Optional[str]) -> str:
+    if value is None:
+        return "NIL"
+    return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _param_list(params: List[Tuple[str, str]]) -> str:
+    if not params:
+        return "NIL"
+    return "(" + " ".join(f"{_quote(key.upper())} {_quote(value)}" for key, value in params) + ")"
+
+
+def bodystructure(msg: Message) -> str:
+    """
+    Build the IMAP BODYSTRUCTURE of a parsed message (RFC 3501 section 7.4.2).
+
+    Args:
+        msg (Message): Parsed message or MIME part
+
+    Returns:
+        str: BODYSTRUCTURE value
+    """
+    if msg.is_multipart():
+        children = "".join(bodystructure(part) for part in msg.get_payload())
+        boundary = [("boundary", msg.get_boundary())] if msg.get_boundary() else []
+        return f"({children} {_quote(msg.get_content_subtype().upper())} {_param_list(boundary)} NIL NIL)"
+
+    encoded = msg.get_payload().encode("utf-8", errors="surrogateescape")
+    params = [(key, value) for key, value in msg.get_params(header="content-type")[1:]] if msg.get_params() else []
+    fields = [
+        _quote(msg.get_content_maintype().upper()),
+        _quote(msg.get_content_subtype().upper()),
+        _param_list(params),
+        "NIL",
+        "NIL",
+        _quote((msg.get("Content-Transfer-Encoding") or "7BIT").upper()),
+        str(len(encoded))
+    ]
+    if msg.get_content_maintype() == "text":
+        fields.append(str(encoded.count(b"\n")))
+    disposition = msg.get_content_disposition()
+    disposition_params = [("filename", msg.get_filename())] if msg.get_filename() else []
+    fields += ["NIL", f"({_quote(disposition.upper())} {_param_list(disposition_params)})" if disposition else "NIL", "NIL"]
+    return "(" + " ".join(fields) + ")"
+
+
+def get_section(msg: Message, section: str) -> bytes:
+    """Get the still-encoded body of a part by IMAP section number, e.g. "2.1"."""
+    part = msg
+    for number in section.split("."):
+        if part.is_multipart():
+            part = part.get_payload()[int(number) - 1]
+        elif number != "1":
+            return b""
+    return part.get_payload().encode("utf-8", errors="surrogateescape")
+
+
+class StandInIMAP:
+    def __init__(self, raw_messages: List[bytes]):
+        """
+        Initialize the stand-in with a selected mailbox.
+
+        Args:
+            raw_messages (List[bytes]): Messages in the mailbox; UIDs are assigned from 1
+        """
+        self.messages = {uid: raw for uid, raw in enumerate(raw_messages, start=1)}
+        self.parsed = {uid: email.message_from_bytes(raw, policy=policy.compat32) for uid, raw in self.messages.items()}
+        self.seen = set()
+        self.round_trips = 0
+        self.bytes_sent = 0
+
+    def reset_counters(self):
+        """Forget the round trips and bytes counted so far."""
+        self.round_trips = 0
+        self.bytes_sent = 0
+
+    def _respond(self, data: List[Any]) -> Tuple[str, List[Any]]:
+        self.round_trips += 1
+        for item in data:
+            for chunk in item if isinstance(item, tuple) else (item,):
+                self.bytes_sent += len(chunk)
+        return "OK", data
+
+    def _sequence_numbers(self, message_set: str) -> List[int]:
+        uids = sorted(self.messages)
+        return [uids.index(uid) + 1 for uid in self._uids(message_set)]
+
+    def _uids(self, message_set: str) -> List[int]:
+        selected = []
+        for item in message_set.split(","):
+            start, _, end = item.partition(":")
+            high = max(self.messages) if end == "*" else int(end or start)
+            selected += [uid for uid in sorted(self.messages) if int(start) <= uid <= high]
+        return selected
+
+    def noop(self):
+        return self._respond([b""])
+
+    def select(self, mailbox: str = "INBOX"):
+        return self._respond([str(len(self.messages)).encode()])
+
+    def search(self, charset, criterion: str):
+        numbers = [str(i) for i, uid in enumerate(sorted(self.messages), start=1) if uid not in self.seen]
+        return self._respond([" ".join(numbers).encode()])
+
+    def fetch(self, message_set: str, items: str):
+        uids = sorted(self.messages)
+        data = []
+        for number in message_set.split(","):
+            raw = self.messages[uids[int(number) - 1]]
+            data += [(f"{number} (RFC822 {{{len(raw)}}}".encode(), raw), b")"]
+        return self._respond(data)
+
+    def store(self, message_set: str, command: str, flags: str):
+        uids = sorted(self.messages)
+        self.seen.update(uids[int(number) - 1] for number in message_set.split(","))
+        return self._respond([b""])
+
+    def uid(self, command: str, *args):
+        command = command.upper()
+        if command == "SEARCH":
+            unseen = [str(uid) for uid in sorted(self.messages) if uid not in self.seen]
+            return self._respond([" ".join(unseen).encode()])
+        if command == "STORE":
+            self.seen.update(self._uids(args[0]))
+            return self._respond([b""])
+        if command == "FETCH":
+            return self._respond(self._uid_fetch(args[0], args[1]))
+        raise ValueError(f"Unsupported UID command: {command}")
+
+    def _uid_fetch(self, message_set: str, items: str) -> List[Any]:
+        sections = re.findall(r"BODY\.PEEK\[([^\]]*)\]", items)
+        data: List[Any] = []
+        for number, uid in zip(self._sequence_numbers(message_set), self._uids(message_set)):
+            msg = self.parsed[uid]
+            prefix = f"{number} (UID {uid}"
+            if "BODYSTRUCTURE" in items:
+                prefix += f" BODYSTRUCTURE {bodystructure(msg)}"
+            for section in sections:
+                if section.startswith("HEADER.FIELDS"):
+                    names = re.findall(r"[A-Z-]+", section[len("HEADER.FIELDS"):].upper())
+                    literal = "".join(f"{name}: {msg[name]}\r\n" for name in msg.keys() if name.upper() in names)
+                    literal = (literal + "\r\n").encode("utf-8", errors="surrogateescape")
+                else:
+                    literal = get_section(msg, section)
+                data.append((f"{prefix} BODY[{section}] {{{len(literal)}}}".encode(), literal))
+                prefix = ""
+            data.append(f"{prefix})".encode())
+        return data
+
+
+def _attach(path: str) -> Message:
+    from email.mime.application import MIMEApplication
+    from email.mime.image import MIMEImage
+
+    with open(path, "rb") as f:
+        data = f.read()
+    filename = os.path.basename(path)
+    if ATTACHMENT_EXTENSIONS.get(os.path.splitext(filename.lower())[1]) == "image":
+        part = MIMEImage(data, _subtype="jpeg")
+    else:
+        part = MIMEApplication(data, _subtype="pdf" if filename.lower().endswith(".pdf") else "octet-stream")
+    part.add_header("Content-Disposition", "attachment", filename=filename)
+    return part
+
+
+def load_sample_mailbox(sample_dir: Optional[str] = None) -> List[bytes]:
+    """
+    Build a mailbox from the sample corpus: every .eml file, plus one forwarded message per
+    standalone attachment file (PDF, image or other) so unextracted attachments are represented.
+
+    Args:
+        sample_dir (Optional[str]): Directory to read; defaults to code/test
+
+    Returns:
+        List[bytes]: Raw messages
+    """
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+
+    sample_dir = sample_dir or SAMPLE_DIR
+    messages = []
+    for filename in sorted(os.listdir(sample_dir)):
+        path = os.path.join(sample_dir, filename)
+        if filename.lower().endswith(".eml"):
+            with open(path, "rb") as f:
+                messages.append(f.read())
+        elif not filename.startswith("."):
+            msg = MIMEMultipart()
+            msg["Subject"] = f"Fwd: {filename}"
+            msg["From"] = "sender@example.com"
+            msg["Date"] = "Thu, 27 Mar 2025 10:00:00 +0000"
+            msg.attach(MIMEText(f"Please see the attached {filename}.", "plain"))
+            msg.attach(_attach(path))
+            messages.append(msg.as_bytes())
+    return messages
@@ -0,0 +1,153 @@
+"""
+Multi-pattern keyword matching against an external keyword catalog.
+
+The catalog (keyword_catalog.json by default) maps each request category to its keywords. All
+keywords are compiled into one case-insensitive regex built from a character trie, so the text is
+scanned once and the engine never retries keywords that share a prefix. The cost of a scan grows
+with the text length and barely with the catalog size.
+"""
+
+import json
+import os
+import re
+import threading
+from typing import Dict, Any, List, Optional
+
+DEFAULT_CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "keyword_catalog.json")
+
+
+def load_keyword_catalog(path: Optional[str] = None) -> Dict[str, List[str]]:
+    """
+    Load a keyword catalog.
+
+    Args:
+        path (Optional[str]): JSON file mapping category to keywords; defaults to KEYWORD_CATALOG_PATH
+
+    Returns:
+        Dict[str, List[str]]: Keywords per category
+    """
+    with open(path or os.getenv("KEYWORD_CATALOG_PATH", DEFAULT_CATALOG_PATH), "r") as f:
+        return json.load(f)
+
+
+def _normalize_keyword(keyword: str) -> str:
+    return " ".join(keyword.lower().split())
+
+
+def _trie_pattern(keywords: List[str]) -> str:
+    # Nested dicts per character; "" marks the end of a keyword
+    trie: Dict[str, Any] = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def emit(node: Dict[str, Any]) -> str:
+        branches = []
+        for char in sorted(key for key in node if key):
+            atom = r"\s+" if char == " " else re.escape(char)
+            branches.append(atom + emit(node[char]))
+        if not branches:
+            return ""
+        # Where a keyword ends inside the trie its continuations are optional and greedy,
+        # so the longest keyword wins at each position
+        pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{pattern})?" if "" in node else pattern
+
+    return emit(trie)
+
+
+class KeywordMatcher:
+    def __init__(self, catalog: Optional[Dict[str, List[str]]] = None):
+        """
+        Compile a catalog into a single matcher.
+
+        Args:
+            catalog (Optional[Dict[str, List[str]]]): Keywords per category; defaults to load_keyword_catalog()
+        """
+        self.catalog = catalog if catalog is not None else load_keyword_catalog()
+        self.categories: Dict[str, str] = {}
+        self.spellings: Dict[str, str] = {}
+        for category, keywords in self.catalog.items():
+            for keyword in keywords:
+                # The first category listing a keyword owns it
+                if _normalize_keyword(keyword) not in self.categories:
+                    self.categories[_normalize_keyword(keyword)] = category
+                    self.spellings[_normalize_keyword(keyword)] = keyword
+        pattern = _trie_pattern(list(self.categories)) if self.categories else r"(?!)"
+        self.pattern = re.compile(r"\b" + pattern + r"\b", re.IGNORECASE)
+
+    def scan(self, text: str, field: str = "body") -> List[Dict[str, Any]]:
+        """
+        Find every keyword occurrence in a text.
+
+        Args:
+            text (str): Text to scan
+            field (str): Where the text came from, copied into each match
+
+        Returns:
+            List[Dict[str, Any]]: Matches with `keyword` (as spelled in the catalog), `category`, `field`,
+                `start` and `end`, in text order
+        """
+        matches = []
+        for match in self.pattern.finditer(text or ""):
+            keyword = _normalize_keyword(match.group(0))
+            matches.append({
+                "keyword": self.spellings[keyword],
+                "category": self.categories[keyword],
+                "field": field,
+                "start": match.start(),
+                "end": match.end()
+            })
+        return matches
+
+    def match_email(self, email_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Scan an email's subject, attachments and body, in the priority order the prompt uses.
+
+        Args:
+            email_data (Dict[str, Any]): Parsed email
+
+        Returns:
+            List[Dict[str, Any]]: Matches from scan(); attachment matches have field "attachment:<name>"
+        """
+        matches = self.scan(email_data.get("subject", ""), "subject")
+        for attachment in email_data.get("attachments") or []:
+            matches += self.scan(attachment.get("content", ""), f"attachment:{attachment.get('name', 'N/A')}")
+        matches += self.scan(email_data.get("body", ""), "body")
+        return matches
+
+    def matched_keywords(self, email_data: Dict[str, Any]) -> List[str]:
+        """
+        Get the first keyword found for each matched category, in catalog category order.
+
+        Args:
+            email_data (Dict[str, Any]): Parsed email
+
+        Returns:
+            List[str]: One keyword per matched category
+        """
+        first: Dict[str, str] = {}
+        for match in self.match_email(email_data):
+            first.setdefault(match["category"], match["keyword"])
+        return [first[category] for category in self.catalog if category in first]
+
+
+_shared_matcher: Optional[KeywordMatcher] = None
+_shared_matcher_lock = threading.Lock()
+
+
+def get_keyword_matcher() -> KeywordMatcher:
+    """
+    Get the process-wide matcher for the configured catalog.
+
+    Returns:
+        KeywordMatcher: Shared matcher
+    """
+    global _shared_matcher
+    if _shared_matcher is None:
+        with _shared_matcher_lock:
+            if _shared_matcher is None:
+                _shared_matcher = KeywordMatcher()
+    return _shared_matcher
@@ -0,0 +1,213 @@
+"""
+Embedding k-nearest-neighbour fast path in front of the LLM classifier.
+
+An incoming email's embedding is matched against stored, LLM-classified emails. Neighbours above
+KNN_MIN_SIMILARITY vote for their (main_intent, request_type) label, weighted by similarity. When
+the winning label leads the runner-up by at least KNN_MIN_MARGIN of the total vote, the email is
+classified from its neighbours and marked `classification_source: "knn"`; otherwise the LLM is
+called as usual. evaluate_knn_classifier.py measures the trade-off on stored emails.
+"""
+
+import os
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+from bson import ObjectId
+from duplicate_index import get_duplicate_index
+from email_embeddings import get_embedding_generator
+from keyword_matcher import get_keyword_matcher
+from mongo_client import get_emails_collection
+
+Label = Tuple[str, str]
+
+
+def get_label(doc: Dict[str, Any]) -> Optional[Label]:
+    """
+    Get the (main_intent, request_type) label of a stored email.
+
+    Returns:
+        Optional[Label]: Label, or None for unclassified, failed or kNN-classified emails
+    """
+    if doc.get("classification_source") == "knn" or doc.get("main_intent") in (None, "", "ERROR"):
+        return None
+    details = doc.get("request_details") or [{}]
+    return doc["main_intent"], details[0].get("request_type", "N/A")
+
+
+def vote(neighbors: List[Tuple[float, Label]],
+         min_similarity: float,
+         min_margin: float,
+         min_neighbors: int) -> Optional[Dict[str, Any]]:
+    """
+    Decide a label from scored neighbours.
+
+    Args:
+        neighbors (List[Tuple[float, Label]]): (score, label) pairs, scores on the Atlas cosine scale
+        min_similarity (float): Neighbours below this score do not vote
+        min_margin (float): Required lead of the winner over the runner-up, as a share of the total vote
+        min_neighbors (int): Fewest voting neighbours needed for a decision
+
+    Returns:
+        Optional[Dict[str, Any]]: `label`, `confidence`, `margin` and `voters`, or None if the vote is not decisive
+    """
+    weights: Dict[Label, float] = {}
+    voters = 0
+    for score, label in neighbors:
+        if score >= min_similarity and label is not None:
+            weights[label] = weights.get(label, 0.0) + score
+            voters += 1
+    if voters < min_neighbors:
+        return None
+    ranked = sorted(weights.items(), key=lambda item: item[1], reverse=True)
+    total = sum(weights.values())
+    runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+    margin = (ranked[0][1] - runner_up) / total
+    if margin < min_margin:
+        return None
+    return {"label": ranked[0][0], "confidence": ranked[0][1] / total, "margin": margin, "voters": voters}
+
+
+def _as_object_id(doc_id: Any) -> Any:
+    if isinstance(doc_id, str) and ObjectId.is_valid(doc_id):
+        return ObjectId(doc_id)
+    return doc_id
+
+
+class KnnClassifier:
+    def __init__(self,
+                 k: Optional[int] = None,
+                 min_similarity: Optional[float] = None,
+                 min_margin: Optional[float] = None,
+                 min_neighbors: Optional[int] = None):
+        """
+        Initialize the fast path.
+
+        Args:
+            k (Optional[int]): Neighbours to retrieve; defaults to KNN_K
+            min_similarity (Optional[float]): Defaults to KNN_MIN_SIMILARITY
+            min_margin (Optional[float]): Defaults to KNN_MIN_MARGIN
+            min_neighbors (Optional[int]): Defaults to KNN_MIN_NEIGHBORS
+        """
+        self.k = k if k is not None else int(os.getenv("KNN_K", "10"))
+        self.min_similarity = min_similarity if min_similarity is not None else float(os.getenv("KNN_MIN_SIMILARITY", "0.9"))
+        self.min_margin = min_margin if min_margin is not None else float(os.getenv("KNN_MIN_MARGIN", "0.8"))
+        self.min_neighbors = min_neighbors if min_neighbors is not None else int(os.getenv("KNN_MIN_NEIGHBORS", "5"))
+        self._lock = threading.Lock()
+        self._stats = {"decided": 0, "deferred": 0}
+
+    def predict(self, email_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Classify an email from its nearest stored neighbours if the vote is decisive.
+
+        Args:
+            email_data (Dict[str, Any]): Parsed email
+
+        Returns:
+            Optional[Dict[str, Any]]: Result in the LLM's output shape with `classification_source: "knn"`,
+                or None to fall through to the LLM
+        """
+        try:
+            embedding_data = get_embedding_generator().get_embedding_data(
+                subject=email_data.get("subject", ""),
+                sender=email_data.get("sender", ""),
+                recipients=email_data.get("recipients", []),
+                body=email_data.get("body", ""),
+                attachments=email_data.get("attachments", [])
+            )
+            if not embedding_data:
+                return self._defer()
+            matches = get_duplicate_index().search(embedding_data["embedding"], top_k=self.k)
+            scores = {_as_object_id(match["_id"]): match["score"] for match in matches}
+            if len(scores) < self.min_neighbors:
+                return self._defer()
+            docs = list(get_emails_collection().find(
+                {"_id": {"$in": list(scores)}},
+                {"main_intent": 1, "request_details": 1, "classification_source": 1}
+            ))
+        except Exception as e:
+            print(f"kNN lookup failed, using the LLM: {str(e)}")
+            return self._defer()
+
+        decision = vote([(scores[doc["_id"]], get_label(doc)) for doc in docs],
+                        self.min_similarity, self.min_margin, self.min_neighbors)
+        if not decision:
+            return self._defer()
+        # The closest neighbour with the winning label supplies the routing fields
+        template = max((doc for doc in docs if get_label(doc) == decision["label"]), key=lambda doc: scores[doc["_id"]])
+        with self._lock:
+            self._stats["decided"] += 1
+        return self._build_result(email_data, template, decision)
+
+    def _defer(self) -> None:
+        with self._lock:
+            self._stats["deferred"] += 1
+        return None
+
+    def _build_result(self, email_data: Dict[str, Any], template: Dict[str, Any], decision: Dict[str, Any]) -> Dict[str, Any]:
+        detail = (template.get("request_details") or [{}])[0]
+        keywords = get_keyword_matcher().matched_keywords(email_data)
+        confidence = int(round(decision["confidence"] * 100))
+        return {
+            "main_intent": template["main_intent"],
+            "request_details": [{
+                "intent": detail.get("intent", "N/A"),
+                "request_type": detail.get("request_type", "N/A"),
+                "sub_request_type": detail.get("sub_request_type", "N/A"),
+                # Email-specific fields are not inferred from other emails
+                "customer_name": "unavailable",
+                "email_address": email_data.get("sender", "unavailable"),
+                "account_user_id": "unavailable",
+                "urgency": detail.get("urgency", "unavailable"),
+                "detailed_description": email_data.get("subject", ""),
+                "impact": "unavailable",
+                "steps_taken": "N/A",
+                "attachments": [
+                    {"filename": attachment.get("name", "N/A"), "description": "mentioned"}
+                    for attachment in email_data.get("attachments") or []
+                ],
+                "keywords": {
+                    "request_type_keywords": {keyword: "mentioned" for keyword in keywords},
+                    "sub_request_type_keywords": {},
+                    "not_relevant_keywords": {}
+                },
+                "suggested_assignee": detail.get("suggested_assignee", "N/A"),
+                "assignment_justification": (
+                    f"Matched {decision['voters']} similar emails ({decision['confidence']:.0%} agreement)"
+                ),
+                "confidence": {
+                    "request_type_confidence": confidence,
+                    "sub_request_type_confidence": confidence,
+                    "assignment_confidence": confidence
+                }
+            }],
+            "classification_source": "knn"
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get how many emails were decided by kNN and how many went to the LLM."""
+        with self._lock:
+            stats = dict(self._stats)
+            total = stats["decided"] + stats["deferred"]
+            stats["llm_calls_saved"] = stats["decided"] / total if total else 0.0
+            return stats
+
+
+_shared_knn: Optional[KnnClassifier] = None
+_shared_knn_lock = threading.Lock()
+
+
+def get_knn_classifier() -> Optional[KnnClassifier]:
+    """
+    Get the process-wide kNN fast path.
+
+    Returns:
+        Optional[KnnClassifier]: Shared instance, or None when KNN_FAST_PATH_ENABLED is false
+    """
+    global _shared_knn
+    if os.getenv("KNN_FAST_PATH_ENABLED", "true").lower() == "false":
+        return None
+    if _shared_knn is None:
+        with _shared_knn_lock:
+            if _shared_knn is None:
+                _shared_knn = KnnClassifier()
+    return _shared_knn
@@ -3,11 +3,13 @@ Script to store email data in MongoDB with classification results and embeddings
 This script handles storing both input email data, its classification results, and embeddings.
 """
 
-from mongo_client import MongoDBClient
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Union
 from langchain.schema.runnable import RunnableLambda
 from datetime import datetime
-from email_embeddings import EmailEmbeddingGenerator
+from email_embeddings import get_embedding_generator
+from duplicate_index import get_duplicate_index
+from bulk_writer import get_bulk_writer
+from bson import ObjectId
 import os
 
 def prepare_email_data(
@@ -17,10 +19,10 @@ def prepare_email_data(
     body: str,
     attachments: List[Dict[str, str]],
     main_intent: str,
-    request_details: List[Dict[str, Any]]
+    request_details: List[Dict[str, Any]],
+    classification_source: str = "llm"
 ) -> Dict[str, Any]:
    
-    mongo_client = MongoDBClient()
     email_doc = {
         "subject": subject,
         "sender": sender,
@@ -29,6 +31,7 @@ def prepare_email_data(
         "attachments": attachments,
         "main_intent": main_intent,
         "request_details": request_details,
+        "classification_source": classification_source,
         "created_at": datetime.now(),
         "updated_at": datetime.now()
     }
@@ -36,7 +39,7 @@ def prepare_email_data(
     return email_doc
 
 def add_embedding_data(email_doc: Dict[str, Any]) -> Dict[str, Any]:
-    embedding_generator = EmailEmbeddingGenerator()
+    embedding_generator = get_embedding_generator()
     embedding_data = embedding_generator.get_embedding_data(
         subject=email_doc["subject"],
         sender=email_doc["sender"],
@@ -48,73 +51,75 @@ def add_embedding_data(email_doc: Dict[str, Any]) -> Dict[str, Any]:
     email_doc["embedding"] = embedding_data["embedding"] if embedding_data else None
     return email_doc
 
+def add_embedding_data_batch(email_docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Add embeddings to several email documents with a single batched encode.
+    An email whose embedding fails gets `embedding: None`, the same as add_embedding_data.
+    """
+    embedding_generator = get_embedding_generator()
+    embedding_data_list = embedding_generator.get_embedding_data_batch(
+        email_docs,
+        batch_size=int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+    )
+    for email_doc, embedding_data in zip(email_docs, embedding_data_list):
+        email_doc["embedding"] = embedding_data["embedding"] if embedding_data else None
+    return email_docs
+
 
 def perform_duplicate_check(email_doc: Dict[str, Any]) -> Dict[str, Any]:
     """
-    Check if an email with the same embedding already exists in the database.
+    Check if an email with a similar embedding already exists, using the duplicate index
+    backend selected by DUPLICATE_INDEX_BACKEND ("atlas" or "local").
     """
-    mongo_client = MongoDBClient()
     try:
-        if mongo_client.connect():
-            db = mongo_client.get_client().get_database('email-triage')
-            emails_collection = db.emails
-
-            if email_doc["embedding"]:
-                # Create search query using the embedding
-                search_query = [{
-                    "$vectorSearch": {
-                        "index": "email_embedding",
-                        "path": "embedding",
-                        "queryVector": email_doc["embedding"],
-                        "numCandidates": 5,  # Number of nearest neighbors to consider
-                        "limit": 3  # Return top 3 results
-                    }
-                }]
-
-                # Add fields to return
-                search_query.append({
-                    "$project": {
-                        "_id": 1,
-                        "subject": 1,
-                        "sender": 1,
-                        "body": 1,
-                        "score": {"$meta": "vectorSearchScore"}
-                    }
-                })
-
-                print("\nPerforming vector search for similar emails...")
-
-                # Execute search
-                similar_emails = list(emails_collection.aggregate(search_query))
-
-                #create a dict to return which will be used to update the email_docs
-                update_dict = {}
-                if similar_emails:
-                    for email in similar_emails:
-                        # is the score greater than the threshold?
-                        if email.get('score') > float(os.getenv('DUPLICATE_CHECK_THRESHOLD')):
-                            # update the email_doc with duplicate bool as true and the duplicate email id, score
-                            email_doc["duplicate"] = True
-                            email_doc["duplicate_email_id"] = email.get('_id')
-                            email_doc["duplicate_score"] = email.get('score')
-
-                else:
-                    print("No similar emails found")   
-                return email_doc
-        else:
-            print("Failed to connect to MongoDB")
+        if email_doc.get("embedding"):
+            top_k = int(os.getenv("DUPLICATE_CHECK_TOP_K", "3"))
+            threshold = float(os.getenv("DUPLICATE_CHECK_THRESHOLD", "0.95"))
+
+            print("\nPerforming vector search for similar emails...")
+
+            duplicate_index = get_duplicate_index()
+            similar_emails = duplicate_index.search(email_doc["embedding"], top_k=top_k)
+            if not duplicate_index.includes_pending:
+                # Emails still waiting in the bulk writer are not in the index yet
+                similar_emails += get_bulk_writer().search_pending(email_doc["embedding"], top_k=top_k)
+            similar_emails.sort(key=lambda email: email.get('score', 0), reverse=True)
+
+            if similar_emails:
+                for email in similar_emails:
+                    # is the score greater than the threshold?
+                    if email.get('score') > threshold:
+                        # update the email_doc with duplicate bool as true and the duplicate email id, score
+                        email_doc["duplicate"] = True
+                        email_doc["duplicate_email_id"] = _as_object_id(email.get('_id'))
+                        email_doc["duplicate_score"] = email.get('score')
+                        break
+            else:
+                print("No similar emails found")
     except Exception as e:
         print(f"Error performing duplicate check: {str(e)}")
+    return email_doc
+
+def _as_object_id(doc_id: Any) -> Any:
+    # The local index keeps ids as strings; store them as ObjectIds like Atlas results
+    if isinstance(doc_id, str) and ObjectId.is_valid(doc_id):
+        return ObjectId(doc_id)
+    return doc_id
 
 def store_email_data(email_doc: Dict[str, Any]) -> Dict[str, Any]:
-    mongo_client = MongoDBClient()
-    if mongo_client.connect():
-        db = mongo_client.get_client().get_database('email-triage')
-        emails_collection = db.emails
-        emails_collection.insert_one(email_doc)
+    """
+    Queue an email for a bulk insert. The document gets its `_id` right away and is
+    visible to duplicate checks before it is flushed to MongoDB.
+    """
+    try:
+        email_doc.setdefault("_id", ObjectId())
+        if email_doc.get("embedding"):
+            # Index first so a failed flush can take the entry back out
+            get_duplicate_index().add(email_doc["_id"], email_doc["embedding"])
+        get_bulk_writer().add(email_doc)
         return email_doc
-    else:
-        print("Failed to connect to MongoDB")
+    except Exception as e:
+        print(f"Failed to store email in MongoDB: {str(e)}")
         return email_doc
     
 def prepare_email_from_json(input_json: Dict[str, Any], output_json: Dict[str, Any]) -> bool:
@@ -139,6 +144,7 @@ def prepare_email_from_json(input_json: Dict[str, Any], output_json: Dict[str, A
         # Extract data from output JSON
         main_intent = output_json.get("main_intent", "")
         request_details = output_json.get("request_details", [])
+        classification_source = output_json.get("classification_source", "llm")
         
         # prepare the data
         email_doc = prepare_email_data(
@@ -149,6 +155,7 @@ def prepare_email_from_json(input_json: Dict[str, Any], output_json: Dict[str, A
             attachments=attachments,
             main_intent=main_intent,
             request_details=request_details,
+            classification_source=classification_source,
         )
         return email_doc
         
@@ -156,19 +163,41 @@ def prepare_email_from_json(input_json: Dict[str, Any], output_json: Dict[str, A
         print(f"Error processing JSON data: {str(e)}")
         return False
 
-def email_pipeline(email_doc: Dict[str, Any]) -> Dict[str, Any]:
-    add_embedding_runnable = RunnableLambda(add_embedding_data)
+def email_pipeline(email_doc: Union[Dict[str, Any], List[Dict[str, Any]]]) -> Union[Dict[str, Any], List[Dict[str, Any]]]:
+    """
+    Embed, duplicate-check and store one email document or a batch of them.
+    Batches of more than one document are embedded with a single encode call and then
+    checked and stored one by one, so a later email can be flagged as a duplicate of an
+    earlier one from the same batch.
+    """
     perform_duplicate_check_runnable = RunnableLambda(perform_duplicate_check)
     store_email_data_runnable = RunnableLambda(store_email_data)
 
+    if isinstance(email_doc, list):
+        if len(email_doc) == 1:
+            return [email_pipeline(email_doc[0])]
+
+        check_and_store_pipeline = perform_duplicate_check_runnable | store_email_data_runnable
+        email_docs = add_embedding_data_batch(email_doc)
+        stored_docs = []
+        for doc in email_docs:
+            try:
+                stored_docs.append(check_and_store_pipeline.invoke(doc))
+            except Exception as e:
+                print(f"Error storing email '{doc.get('subject', 'N/A')}': {str(e)}")
+                stored_docs.append(None)
+        return stored_docs
+
+    add_embedding_runnable = RunnableLambda(add_embedding_data)
+
     # Create a LangChain pipeline
-    email_pipeline = (
+    pipeline = (
         add_embedding_runnable
         | perform_duplicate_check_runnable
         | store_email_data_runnable
     )
 
-    return email_pipeline.invoke(email_doc)
+    return pipeline.invoke(email_doc)
 
 if __name__ == "__main__":
     input_data = {
@@ -242,6 +271,7 @@ if __name__ == "__main__":
     # Store the email data
     final_email_doc = prepare_email_from_json(input_data, output_data)
     final_email_doc = email_pipeline(final_email_doc)
+    get_bulk_writer().flush()
     if final_email_doc:
         print("Email data stored successfully")
     else:
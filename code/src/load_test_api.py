@@ -0,0 +1,63 @@
+"""
+Concurrent load test for the read API.
+
+Fires requests at an endpoint from a pool of client threads at increasing concurrency levels
+and reports throughput and latency percentiles. With async handlers, throughput should keep
+rising past the ~40 worker threads that capped the old sync handlers.
+
+Usage:
+    uvicorn api:app --port 8000
+    python load_test_api.py --url "http://127.0.0.1:8000/fetch_emails/?limit=50" --requests 500
+"""
+
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List
+
+import requests
+
+
+def run_level(url: str, concurrency: int, total_requests: int) -> Dict[str, Any]:
+    """Send `total_requests` requests with `concurrency` in flight at a time."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    def timed_get(_) -> float:
+        start = time.perf_counter()
+        response = session.get(url, timeout=60)
+        response.raise_for_status()
+        return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies: List[float] = sorted(executor.map(timed_get, range(total_requests)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "concurrency": concurrency,
+        "requests_per_second": round(total_requests / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies), 1),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 1),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1], 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000/fetch_emails/?limit=50")
+    parser.add_argument("--requests", type=int, default=400, help="Requests per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 40, 80, 160])
+    args = parser.parse_args()
+
+    # Warm up connections and the server's MongoDB pool
+    run_level(args.url, 1, 5)
+    for concurrency in args.concurrency:
+        print(run_level(args.url, concurrency, max(args.requests, concurrency)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Process-wide registry for embedding models.
+Each model is loaded once per process, shared across threads, and instrumented with
+load-time and encode-time metrics.
+"""
+
+import threading
+import time
+from typing import Dict, Any, Callable, Optional
+
+
+class ModelRegistry:
+    def __init__(self):
+        """Initialize an empty registry."""
+        self._models: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._encode_locks: Dict[str, threading.Lock] = {}
+        self._metrics: Dict[str, Dict[str, float]] = {}
+
+    def _named_lock(self, locks: Dict[str, threading.Lock], name: str) -> threading.Lock:
+        with self._lock:
+            if name not in locks:
+                locks[name] = threading.Lock()
+            return locks[name]
+
+    def get(self, name: str, loader: Callable[[], Any]) -> Any:
+        """
+        Return the model registered under `name`, loading it on first use.
+
+        Args:
+            name (str): Registry key for the model
+            loader (Callable[[], Any]): Called once to load the model if it is not registered yet
+
+        Returns:
+            Any: The shared model instance
+        """
+        model = self._models.get(name)
+        if model is not None:
+            return model
+
+        # Only one thread loads a given model; the others wait and reuse it
+        with self._named_lock(self._load_locks, name):
+            model = self._models.get(name)
+            if model is None:
+                start = time.perf_counter()
+                model = loader()
+                load_seconds = time.perf_counter() - start
+                with self._lock:
+                    self._models[name] = model
+                    self._metrics.setdefault(name, self._empty_metrics())["load_seconds"] = load_seconds
+                print(f"Loaded model '{name}' in {load_seconds:.2f}s")
+        return model
+
+    def encode_lock(self, name: str) -> threading.Lock:
+        """
+        Get the lock that serializes encode calls on a shared model.
+        Hugging Face fast tokenizers are not safe to call from several threads at once.
+
+        Args:
+            name (str): Registry key for the model
+
+        Returns:
+            threading.Lock: Lock to hold while encoding
+        """
+        return self._named_lock(self._encode_locks, name)
+
+    def record_encode(self, name: str, num_texts: int, seconds: float):
+        """
+        Record a completed encode call.
+
+        Args:
+            name (str): Registry key for the model
+            num_texts (int): Number of texts encoded
+            seconds (float): Wall-clock time spent encoding
+        """
+        with self._lock:
+            metrics = self._metrics.setdefault(name, self._empty_metrics())
+            metrics["encode_calls"] += 1
+            metrics["encoded_texts"] += num_texts
+            metrics["encode_seconds"] += seconds
+
+    def is_loaded(self, name: str) -> bool:
+        """Check whether a model is already loaded in this process."""
+        return name in self._models
+
+    def get_metrics(self, name: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Get load and encode metrics.
+
+        Args:
+            name (Optional[str]): Registry key to report on; all models if omitted
+
+        Returns:
+            Dict[str, Any]: Metrics per model, including average encode time per text
+        """
+        with self._lock:
+            names = [name] if name else list(self._metrics)
+            report = {}
+            for key in names:
+                metrics = dict(self._metrics.get(key, self._empty_metrics()))
+                metrics["avg_encode_seconds_per_text"] = (
+                    metrics["encode_seconds"] / metrics["encoded_texts"]
+                    if metrics["encoded_texts"] else 0.0
+                )
+                report[key] = metrics
+            return report
+
+    @staticmethod
+    def _empty_metrics() -> Dict[str, float]:
+        return {
+            "load_seconds": 0.0,
+            "encode_calls": 0,
+            "encoded_texts": 0,
+            "encode_seconds": 0.0
+        }
+
+
+# Shared registry for the whole process
+model_registry = ModelRegistry()
@@ -0,0 +1,233 @@
+"""
+Long-lived OCR service for image attachments.
+
+The service holds one backend for the life of the process. The Google Cloud Vision backend reads
+the credentials and builds its ImageAnnotatorClient once, and sends images through
+batch_annotate_images, up to 16 per request. Each image gets its own result, so one bad image
+does not fail its batch. OCR_BACKEND selects the backend: "vision" (default), "tesseract" for
+local OCR, or "stub" for offline tests and benchmarks.
+"""
+
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+
+NO_TEXT = "No text found in image."
+
+
+class OCRBackend(ABC):
+    """Interface of an OCR backend: recognize text in a batch of images."""
+
+    name = "base"
+    # Changes whenever the backend could return different text for the same image
+    version = "base"
+    # Most images and raw bytes the backend accepts in one call
+    max_batch_size = 16
+    max_batch_bytes = 7 * 1024 * 1024
+
+    @abstractmethod
+    def annotate(self, images: List[bytes]) -> List[str]:
+        """
+        Recognize the text of each image.
+
+        Args:
+            images (List[bytes]): Encoded images, at most max_batch_size of them
+
+        Returns:
+            List[str]: Text per image in the same order; NO_TEXT for an image without text,
+                or "OCR failed: <reason>" for an image that could not be read
+        """
+
+
+class VisionOCRBackend(OCRBackend):
+    name = "vision"
+    version = "vision-text-detection-1"
+
+    def __init__(self, credentials_path: Optional[str] = None):
+        """
+        Validate the credentials and create the Vision client.
+
+        Args:
+            credentials_path (Optional[str]): Service account JSON; defaults to CREDENTIALS_PATH
+        """
+        from google.cloud import vision
+
+        credentials_path = credentials_path or os.getenv("CREDENTIALS_PATH")
+        if not credentials_path or not os.path.exists(credentials_path):
+            raise FileNotFoundError("cloud-vision-api-key.json not found in project directory.")
+        # Check if file content is valid JSON
+        with open(credentials_path, "r") as f:
+            try:
+                json.load(f)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Invalid JSON in credentials file: {e}")
+
+        self.vision = vision
+        self.client = vision.ImageAnnotatorClient.from_service_account_file(credentials_path)
+        self.features = [vision.Feature(type_=vision.Feature.Type.TEXT_DETECTION)]
+
+    def annotate(self, images: List[bytes]) -> List[str]:
+        requests = [
+            self.vision.AnnotateImageRequest(image=self.vision.Image(content=content), features=self.features)
+            for content in images
+        ]
+        response = self.client.batch_annotate_images(requests=requests)
+        texts = []
+        for image_response in response.responses:
+            if image_response.error.message:
+                texts.append(f"OCR failed: Vision API Error: {image_response.error.message}")
+            elif image_response.text_annotations:
+                texts.append(image_response.text_annotations[0].description)
+            else:
+                texts.append(NO_TEXT)
+        return texts
+
+
+class TesseractOCRBackend(OCRBackend):
+    name = "tesseract"
+    # Local OCR has no request limits; images are still recognized one at a time
+    max_batch_size = 64
+    max_batch_bytes = 64 * 1024 * 1024
+
+    def __init__(self):
+        """Check that pytesseract and Pillow are installed and the tesseract binary is on the PATH."""
+        import pytesseract
+        from PIL import Image
+
+        self.pytesseract = pytesseract
+        self.image = Image
+        self.version = f"tesseract-{pytesseract.get_tesseract_version()}-1"
+
+    def annotate(self, images: List[bytes]) -> List[str]:
+        texts = []
+        for content in images:
+            try:
+                text = self.pytesseract.image_to_string(self.image.open(io.BytesIO(content))).strip()
+                texts.append(text or NO_TEXT)
+            except Exception as e:
+                texts.append(f"OCR failed: {e}")
+        return texts
+
+
+class StubOCRBackend(OCRBackend):
+    name = "stub"
+    version = "stub"
+
+    def __init__(self, texts: Optional[Dict[str, str]] = None, latency_seconds: Optional[float] = None):
+        """
+        Initialize a backend that returns canned text without any OCR.
+
+        Args:
+            texts (Optional[Dict[str, str]]): Text per SHA-256 hex digest of the image bytes; other images get NO_TEXT
+            latency_seconds (Optional[float]): Simulated round trip per call; defaults to OCR_STUB_LATENCY_SECONDS
+        """
+        self.texts = texts or {}
+        self.latency_seconds = latency_seconds if latency_seconds is not None else float(os.getenv("OCR_STUB_LATENCY_SECONDS", "0"))
+        self.calls = 0
+        self.images = 0
+
+    def annotate(self, images: List[bytes]) -> List[str]:
+        self.calls += 1
+        self.images += len(images)
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        return [self.texts.get(hashlib.sha256(content).hexdigest(), NO_TEXT) for content in images]
+
+
+OCR_BACKENDS = {
+    "vision": VisionOCRBackend,
+    "tesseract": TesseractOCRBackend,
+    "stub": StubOCRBackend
+}
+
+
+class OCRService:
+    def __init__(self, backend: Optional[OCRBackend] = None):
+        """
+        Initialize the service.
+
+        Args:
+            backend (Optional[OCRBackend]): Backend to use; defaults to the one named by OCR_BACKEND
+        """
+        self.backend = backend or OCR_BACKENDS[os.getenv("OCR_BACKEND", "vision").lower()]()
+
+    def batches(self, images: List[bytes]) -> List[List[int]]:
+        """
+        Group images into backend calls, in order, within the backend's count and size limits.
+
+        Args:
+            images (List[bytes]): Encoded images
+
+        Returns:
+            List[List[int]]: Indexes into `images`, one list per call
+        """
+        batches: List[List[int]] = []
+        size = 0
+        for i, content in enumerate(images):
+            if (not batches or len(batches[-1]) >= self.backend.max_batch_size
+                    or size + len(content) > self.backend.max_batch_bytes):
+                batches.append([])
+                size = 0
+            batches[-1].append(i)
+            size += len(content)
+        return batches
+
+    def annotate_batch(self, images: List[bytes]) -> List[str]:
+        """
+        Recognize one batch of images in a single backend call.
+
+        Args:
+            images (List[bytes]): Images grouped by batches()
+
+        Returns:
+            List[str]: Text per image; every image gets "OCR failed: <reason>" if the call itself failed
+        """
+        try:
+            texts = self.backend.annotate(images)
+        except Exception as e:
+            print(f"OCR Error: {e}")
+            return [f"OCR failed: {e}"] * len(images)
+        for text in texts:
+            if text.startswith("OCR failed: "):
+                print(f"OCR Error: {text[len('OCR failed: '):]}")
+        return texts
+
+    def ocr(self, images: List[bytes]) -> List[str]:
+        """
+        Recognize the text of any number of images, with as few backend calls as the limits allow.
+
+        Args:
+            images (List[bytes]): Encoded images
+
+        Returns:
+            List[str]: Text per image, in the order of `images`
+        """
+        texts = [""] * len(images)
+        for batch in self.batches(images):
+            for i, text in zip(batch, self.annotate_batch([images[i] for i in batch])):
+                texts[i] = text
+        return texts
+
+
+_shared_service: Optional[OCRService] = None
+_shared_service_lock = threading.Lock()
+
+
+def get_ocr_service() -> OCRService:
+    """
+    Get the process-wide OCR service, creating its backend on first use.
+
+    Returns:
+        OCRService: Shared service
+    """
+    global _shared_service
+    if _shared_service is None:
+        with _shared_service_lock:
+            if _shared_service is None:
+                _shared_service = OCRService()
+    return _shared_service
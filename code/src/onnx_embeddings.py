@@ -0,0 +1,144 @@
+"""
+ONNX Runtime backend for email embeddings on CPU-only workers.
+
+The sentence-transformer is exported to ONNX once, quantized with dynamic int8 weight
+quantization, and run with mean pooling and L2 normalization, matching all-MiniLM-L6-v2's
+SentenceTransformer pipeline. Vectors stay compatible with the PyTorch backend: each one has a
+cosine similarity of at least 1 - ONNX_COSINE_TOLERANCE with the PyTorch vector for the same
+text (see benchmark_embeddings.py).
+"""
+
+import os
+from typing import List, Optional, Union
+
+import numpy as np
+
+DEFAULT_ONNX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "onnx")
+ONNX_COSINE_TOLERANCE = 0.02
+# all-MiniLM-L6-v2 truncates inputs to 256 word pieces
+MAX_SEQ_LENGTH = 256
+
+
+def get_onnx_model_dir(model_name: str) -> str:
+    """Get the directory holding the exported model and tokenizer for `model_name`."""
+    return os.path.join(os.getenv("EMBEDDING_ONNX_DIR", DEFAULT_ONNX_DIR), model_name.replace("/", "__"))
+
+
+def export_onnx_model(model_name: str, output_dir: Optional[str] = None) -> str:
+    """
+    Export a Hugging Face sentence-transformer to ONNX and quantize it to int8.
+
+    Args:
+        model_name (str): Hugging Face model name
+        output_dir (Optional[str]): Where to write the model and tokenizer; defaults to get_onnx_model_dir
+
+    Returns:
+        str: Path of the quantized model
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    output_dir = output_dir or get_onnx_model_dir(model_name)
+    os.makedirs(output_dir, exist_ok=True)
+    fp32_path = os.path.join(output_dir, "model.onnx")
+    int8_path = os.path.join(output_dir, "model.int8.onnx")
+
+    hub_name = model_name if "/" in model_name else f"sentence-transformers/{model_name}"
+    tokenizer = AutoTokenizer.from_pretrained(hub_name)
+    model = AutoModel.from_pretrained(hub_name)
+    model.eval()
+    tokenizer.save_pretrained(output_dir)
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    input_names = list(sample.keys())
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=14
+        )
+
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    print(f"Exported {model_name} to {int8_path}")
+    return int8_path
+
+
+class OnnxSentenceEncoder:
+    def __init__(self, model_name: str, model_dir: Optional[str] = None, intra_op_threads: Optional[int] = None):
+        """
+        Load an int8 ONNX sentence-transformer, exporting it first if needed.
+
+        Args:
+            model_name (str): Hugging Face model name
+            model_dir (Optional[str]): Directory with the exported model; defaults to get_onnx_model_dir
+            intra_op_threads (Optional[int]): ONNX Runtime intra-op threads; defaults to EMBEDDING_ONNX_THREADS,
+                or the number of CPUs
+        """
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.model_name = model_name
+        self.model_dir = model_dir or get_onnx_model_dir(model_name)
+        model_path = os.path.join(self.model_dir, "model.int8.onnx")
+        if not os.path.exists(model_path):
+            model_path = export_onnx_model(model_name, self.model_dir)
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads or int(os.getenv("EMBEDDING_ONNX_THREADS", str(os.cpu_count() or 1)))
+        # One request at a time per session; parallelism comes from intra-op threads
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_dir)
+
+    def encode(self, sentences: Union[str, List[str]], batch_size: int = 32, **kwargs) -> np.ndarray:
+        """
+        Encode sentences the way SentenceTransformer.encode does with convert_to_numpy=True.
+
+        Args:
+            sentences (Union[str, List[str]]): One text or a list of texts
+            batch_size (int): Texts per ONNX Runtime call
+
+        Returns:
+            np.ndarray: Normalized float32 embeddings; 1-D for a single string, 2-D for a list
+        """
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        # Sorting by length keeps padding per batch small
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        embeddings = np.zeros((len(texts), 0), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            batch_indices = order[start:start + batch_size]
+            tokens = self.tokenizer(
+                [texts[i] for i in batch_indices],
+                padding=True,
+                truncation=True,
+                max_length=MAX_SEQ_LENGTH,
+                return_tensors="np"
+            )
+            feed = {name: tokens[name].astype(np.int64) for name in tokens if name in self.input_names}
+            hidden = self.session.run(["last_hidden_state"], feed)[0]
+
+            # Mean pooling over real tokens, then L2 normalization
+            mask = tokens["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+            if embeddings.shape[1] == 0:
+                embeddings = np.zeros((len(texts), pooled.shape[1]), dtype=np.float32)
+            embeddings[batch_indices] = pooled
+
+        return embeddings[0] if single else embeddings
@@ -1,12 +1,20 @@
 import os
-import re
 import json
+import asyncio
+import threading
+import time
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.exceptions import OutputParserException
 from pydantic import BaseModel, Field
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 from dotenv import load_dotenv
+from keyword_matcher import get_keyword_matcher
+from knn_classifier import get_knn_classifier
+from classification_cache import get_classification_cache, make_classification_key, make_prompt_version
+from prompt_builder import PromptBuilder
+from rate_limiter import LLMRateLimiter, get_llm_rate_limiter, backoff_delay
 
 # Load environment variables
 load_dotenv()
@@ -47,116 +55,282 @@ class EmailResponse(BaseModel):
     main_intent: str
     request_details: List[RequestDetail]
 
-class EmailRequestProcessor:
-    def __init__(self, email_data):
-        self.email_data = email_data
-        self.keywords_map = {
-            "Adjustment": ["adjustment", "correction", "modification"],
-            "AU Transfer": ["AU transfer", "asset utilization", "fund movement"],
-            "Closing Notice": ["closing notice", "reallocation fees", "amendment fees", "reallocation principal"],
-            "Commitment Change": ["commitment change", "cashless roll", "decrease", "increase"],
-            "Fee Payment": ["fee payment", "ongoing fee", "letter of credit fee"],
-            "Money Movement - Inbound": ["inbound payment", "principal received", "interest received"],
-            "Money Movement - Outbound": ["outbound payment", "foreign currency", "timebound transfer"]
-        }
-        
-        self.matched_keywords = self.find_keywords(email_data.get("body", ""))
-        
+HUMAN_MESSAGE_TEMPLATE = "Subject: {email_subject}\nFrom: {email_sender}\nBody: {email_body}\nAttachments: {email_attachments_json}\nDetected Keywords: {keywords}"
+
+
+def load_prompt_template(prompt_file_path: Optional[str] = None) -> str:
+    """
+    Read the system prompt, resolving a relative path against this directory if needed.
+
+    Args:
+        prompt_file_path (Optional[str]): Prompt file; defaults to PROMPT_FILE_PATH
+
+    Returns:
+        str: System prompt text
+    """
+    prompt_file_path = prompt_file_path or os.getenv("PROMPT_FILE_PATH")
+    try:
+        with open(prompt_file_path, "r") as f:
+            return f.read()
+    except FileNotFoundError:
+        print(f"FileNotFoundError: {prompt_file_path}")
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        prompt_path = os.path.join(script_dir, prompt_file_path)
+        with open(prompt_path, "r") as f:
+            return f.read()
+
+
+class EmailClassifier:
+    def __init__(self, model_name: Optional[str] = None, prompt_file_path: Optional[str] = None):
+        """
+        Build the prompt, LLM client, parser and chain once, for reuse across emails.
+
+        Args:
+            model_name (Optional[str]): Gemini model; defaults to MODEL_NAME
+            prompt_file_path (Optional[str]): System prompt file; defaults to PROMPT_FILE_PATH
+        """
+        self.keyword_matcher = get_keyword_matcher()
+        self.keywords_map = self.keyword_matcher.catalog
+
         # Initialize Langchain components
+        self.model_name = model_name or os.getenv("MODEL_NAME")
         self.llm = ChatGoogleGenerativeAI(
-            model=os.getenv("MODEL_NAME"),
+            model=self.model_name,
             google_api_key=os.getenv("GOOGLE_AI_API_KEY"),
             temperature=0
         )
         self.output_parser = JsonOutputParser(pydantic_model=EmailResponse)
+        self.prompt_template = load_prompt_template(prompt_file_path)
+        self.prompt = ChatPromptTemplate.from_messages([
+            ("system", self.prompt_template),
+            ("human", HUMAN_MESSAGE_TEMPLATE)
+        ])
+        self.chain = self.prompt | self.llm | self.output_parser
+        self.prompt_builder = PromptBuilder(self.prompt_template, matcher=self.keyword_matcher)
 
-        # Load the custom prompt
-        try:
-            prompt_file_path = os.getenv("PROMPT_FILE_PATH")
-            with open(prompt_file_path, "r") as f:
-                self.prompt_template = f.read()
-        except FileNotFoundError:
-            print(f"FileNotFoundError: {prompt_file_path}")
-            script_dir = os.path.dirname(os.path.abspath(__file__))
-            prompt_path = os.path.join(script_dir, os.getenv("PROMPT_FILE_PATH"))
-            with open(prompt_path, "r") as f:
-                self.prompt_template = f.read()
+        # Results are reused only for the same prompt text, budgets and model
+        self.prompt_version = make_prompt_version(
+            self.prompt_template, HUMAN_MESSAGE_TEMPLATE, json.dumps(self.prompt_builder.budgets, sort_keys=True)
+        )
+        self.cache = get_classification_cache()
+        if self.cache:
+            purged = self.cache.invalidate_other_versions(self.prompt_version)
+            if purged:
+                print(f"Dropped {purged} cached classifications from other prompt versions or past their TTL")
+        # Emails that look like many already-classified ones are decided by their neighbours
+        self.knn = get_knn_classifier()
 
     def find_keywords(self, text):
         """Find keywords in the text."""
-        matched_keywords = []
-        for category, keywords in self.keywords_map.items():
-            for keyword in keywords:
-                if re.search(r"\b" + re.escape(keyword) + r"\b", text.lower()):
-                    matched_keywords.append(keyword)
-                    break
-        return matched_keywords
+        return self.keyword_matcher.matched_keywords({"body": text})
 
-    def process_email(self):
-        # Prepare attachments for JSON serialization
-        attachments_json = []
-        for attachment in self.email_data.get("attachments", []):
-            attachments_json.append({
-                "filename": attachment.get("name", "N/A"),
-                "content": attachment.get("content", "N/A")
-            })
-
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", self.prompt_template),
-            ("human", "Subject: {email_subject}\nFrom: {email_sender}\nBody: {email_body}\nAttachments: {email_attachments_json}\nDetected Keywords: {keywords}")
-        ])
+    def build_inputs(self, email_data: Dict) -> Tuple[Dict[str, str], Dict[str, int]]:
+        """
+        Build the chain inputs for an email within the prompt token budgets.
 
+        Args:
+            email_data (Dict): Parsed email
 
-        # Create the chain
-        chain = prompt | self.llm | self.output_parser
+        Returns:
+            Tuple[Dict[str, str], Dict[str, int]]: Values for the human message template, and the token usage
+        """
+        return self.prompt_builder.build(email_data)
 
-        try:
-            # Invoke the chain
-            chain = prompt | self.llm | self.output_parser
-            result = chain.invoke({
-                "email_subject": self.email_data.get("subject", "N/A"),
-                "email_sender": self.email_data.get("sender", "N/A"),
-                "email_body": self.email_data.get("body", ""),
-                "email_attachments_json": json.dumps(attachments_json),
-                "keywords": ", ".join(self.matched_keywords) if self.matched_keywords else "None"                
-            })
-            
-            return result
+    def _log_usage(self, email_data: Dict, usage: Dict[str, int], started: float, outcome: str):
+        print(f"LLM {outcome} in {time.perf_counter() - started:.2f}s for '{email_data.get('subject', 'N/A')}': "
+              f"{usage['total_tokens']} prompt tokens (system {usage['system_tokens']}, "
+              f"subject {usage['subject_tokens']}/{usage['subject_original_tokens']}, "
+              f"attachments {usage['attachments_tokens']}/{usage['attachments_original_tokens']}, "
+              f"body {usage['body_tokens']}/{usage['body_original_tokens']})")
+
+    def lookup_cached(self, email_data: Dict):
+        """
+        Look up an earlier classification of the same content with the current prompt and model.
+
+        Args:
+            email_data (Dict): Parsed email
+
+        Returns:
+            Tuple of the cache key (None when caching is disabled) and the cached result, if any
+        """
+        if not self.cache:
+            return None, None
+        key = make_classification_key(email_data, self.prompt_version, self.model_name)
+        return key, self.cache.get(key)
 
+    def _remember(self, key: Optional[str], result: Dict):
+        if key:
+            self.cache.put(key, result, self.prompt_version, self.model_name)
+
+    def classify(self, email_data: Dict) -> Dict:
+        """
+        Classify an email: cached result first, then the kNN fast path, then the LLM.
+
+        Args:
+            email_data (Dict): Parsed email
+
+        Returns:
+            Dict: Classification result, or the error response if the call failed
+        """
+        key, cached = self.lookup_cached(email_data)
+        if cached is not None:
+            return cached
+        knn_result = self.knn.predict(email_data) if self.knn else None
+        if knn_result is not None:
+            return knn_result
+        inputs, usage = self.build_inputs(email_data)
+        started = time.perf_counter()
+        try:
+            result = self.chain.invoke(inputs)
         except Exception as e:
+            self._log_usage(email_data, usage, started, "failed")
             print(f"Error processing email: {e}")
             # Return a default response matching the structure
-            return EmailResponse(
-                main_intent="ERROR",
-                request_details=[
-                    RequestDetail(
-                        intent="N/A",
-                        request_type="N/A",
-                        sub_request_type="N/A",
-                        customer_name="N/A",
-                        email_address="N/A",
-                        account_user_id="unavailable",
-                        urgency="unavailable",
-                        detailed_description="Error processing email",
-                        impact="unavailable",
-                        steps_taken="N/A",
-                        attachments=[],
-                        keywords=Keywords(
-                            request_type_keywords={},
-                            sub_request_type_keywords={},
-                            not_relevant_keywords={}
-                        ),
-                        suggested_assignee="N/A",
-                        assignment_justification="Error occurred during processing",
-                        confidence=Confidence(
-                            request_type_confidence=0,
-                            sub_request_type_confidence=0,
-                            assignment_confidence=0
-                        )
-                    )
-                ]
-            ).model_dump()
-        
+            return error_response()
+        self._log_usage(email_data, usage, started, "call")
+        self._remember(key, result)
+        return result
+
+    async def aclassify(self, email_data: Dict, rate_limiter: Optional[LLMRateLimiter] = None) -> Dict:
+        """
+        Classify an email without blocking the event loop, within the LLM rate limits.
+        Failed calls are retried with jittered exponential backoff, up to LLM_MAX_RETRIES times.
+
+        Args:
+            email_data (Dict): Parsed email
+            rate_limiter (Optional[LLMRateLimiter]): Limiter to wait on; defaults to the shared one
+
+        Returns:
+            Dict: Classification result, or the error response if every attempt failed
+        """
+        key, cached = self.lookup_cached(email_data)
+        if cached is not None:
+            return cached
+        # The vote encodes the email and queries MongoDB, so keep it off the event loop
+        knn_result = await asyncio.to_thread(self.knn.predict, email_data) if self.knn else None
+        if knn_result is not None:
+            return knn_result
+        rate_limiter = rate_limiter or get_llm_rate_limiter()
+        inputs, usage = self.build_inputs(email_data)
+        tokens = usage["total_tokens"] + int(os.getenv("LLM_EXPECTED_OUTPUT_TOKENS", "1500"))
+        max_retries = int(os.getenv("LLM_MAX_RETRIES", "3"))
+
+        for attempt in range(max_retries + 1):
+            await rate_limiter.acquire(tokens)
+            started = time.perf_counter()
+            try:
+                result = await self.chain.ainvoke(inputs)
+                self._log_usage(email_data, usage, started, "call")
+                self._remember(key, result)
+                return result
+            except OutputParserException as e:
+                # The model answered, but not in the expected shape; asking again at temperature 0 won't help
+                print(f"Error processing email: {e}")
+                break
+            except Exception as e:
+                if attempt == max_retries:
+                    print(f"Error processing email after {attempt + 1} attempts: {e}")
+                    break
+                delay = backoff_delay(attempt)
+                print(f"LLM call failed ({e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+        return error_response()
+
+
+_shared_classifier: Optional[EmailClassifier] = None
+_shared_classifier_lock = threading.Lock()
+
+
+def get_classifier() -> EmailClassifier:
+    """
+    Get the process-wide email classifier, creating it on first use.
+
+    Returns:
+        EmailClassifier: Shared classifier
+    """
+    global _shared_classifier
+    if _shared_classifier is None:
+        with _shared_classifier_lock:
+            if _shared_classifier is None:
+                _shared_classifier = EmailClassifier()
+    return _shared_classifier
+
+
+class EmailRequestProcessor:
+    """Per-email wrapper around the shared EmailClassifier, kept for existing callers."""
+
+    def __init__(self, email_data):
+        self.email_data = email_data
+        self.classifier = get_classifier()
+        self.keywords_map = self.classifier.keywords_map
+        self.matched_keywords = self.classifier.find_keywords(email_data.get("body", ""))
+
+    def find_keywords(self, text):
+        """Find keywords in the text."""
+        return self.classifier.find_keywords(text)
+
+    def process_email(self):
+        return self.classifier.classify(self.email_data)
+
+    async def aprocess_email(self, rate_limiter: Optional[LLMRateLimiter] = None):
+        """Classify the email asynchronously; see EmailClassifier.aclassify."""
+        return await self.classifier.aclassify(self.email_data, rate_limiter)
+
+
+def error_response():
+    """Build the default response returned when an email could not be classified."""
+    return EmailResponse(
+        main_intent="ERROR",
+        request_details=[
+            RequestDetail(
+                intent="N/A",
+                request_type="N/A",
+                sub_request_type="N/A",
+                customer_name="N/A",
+                email_address="N/A",
+                account_user_id="unavailable",
+                urgency="unavailable",
+                detailed_description="Error processing email",
+                impact="unavailable",
+                steps_taken="N/A",
+                attachments=[],
+                keywords=Keywords(
+                    request_type_keywords={},
+                    sub_request_type_keywords={},
+                    not_relevant_keywords={}
+                ),
+                suggested_assignee="N/A",
+                assignment_justification="Error occurred during processing",
+                confidence=Confidence(
+                    request_type_confidence=0,
+                    sub_request_type_confidence=0,
+                    assignment_confidence=0
+                )
+            )
+        ]
+    ).model_dump()
+
+
+async def classify_emails(emails: List[Dict], max_concurrency: Optional[int] = None) -> List[Dict]:
+    """
+    Classify a batch of emails concurrently.
+
+    Args:
+        emails (List[Dict]): Parsed emails
+        max_concurrency (Optional[int]): Most LLM calls in flight; defaults to LLM_MAX_CONCURRENCY
+
+    Returns:
+        List[Dict]: Classification results, in the order of `emails`
+    """
+    classifier = get_classifier()
+    semaphore = asyncio.Semaphore(max_concurrency or int(os.getenv("LLM_MAX_CONCURRENCY", "8")))
+
+    async def classify(email_data):
+        async with semaphore:
+            return await classifier.aclassify(email_data)
+
+    return await asyncio.gather(*(classify(email_data) for email_data in emails))
+
 if __name__ == "__main__":
     email_data = {
         "subject": "Travel Insurance Claim - Delayed Baggage",
@@ -0,0 +1,23 @@
+"""
+Code run inside the PDF extraction pool's worker processes.
+
+Workers import only this module and PyMuPDF, so a worker costs what a PDF parse needs no matter
+what the parent process has loaded.
+"""
+
+import io
+import os
+
+import fitz  # PyMuPDF
+
+
+def parse_pdf_text(file_data):
+    """Extract the text of a PDF with PyMuPDF, uncached; raises if the PDF cannot be read."""
+    with io.BytesIO(file_data) as pdf_buffer:
+        doc = fitz.open(stream=pdf_buffer, filetype="pdf")
+        return "\n".join([page.get_text("text") for page in doc]).strip()
+
+
+def report_pid(pids):
+    """Pool initializer: tell the parent this worker's process id, so a hung worker can be killed."""
+    pids.put(os.getpid())
@@ -1,4 +1,4 @@
-from fetch_emails_process import fetch_last_emails
+from email_monitor import fetch_last_emails
 from langchain_utils import store_email_from_json
 from parse_intent import EmailRequestProcessor
 def main():
@@ -0,0 +1,177 @@
+"""
+Token-budgeted assembly of the classification prompt.
+
+The email's sections are fitted into PROMPT_MAX_EMAIL_TOKENS in the priority order prompt.md
+gives: subject, then attachments, then body, each also capped by its own budget. Attachments share
+their budget fairly, so one 40-page PDF cannot crowd out a short form. An oversized section keeps
+its opening and then the passages around catalog keywords, in document order, so the same email
+always produces the same prompt. Token counts use the same four-characters-per-token estimate as
+the rate limiter; an exact count would cost a Gemini API call per email.
+"""
+
+import json
+import os
+from typing import Dict, Any, List, Optional, Tuple
+
+from keyword_matcher import KeywordMatcher, get_keyword_matcher
+from rate_limiter import estimate_tokens
+
+CHARS_PER_TOKEN = 4
+OMISSION_MARKER = "\n[...]\n"
+
+
+def get_prompt_budgets() -> Dict[str, int]:
+    """
+    Read the prompt budgets, in estimated tokens.
+
+    Returns:
+        Dict[str, int]: `total`, `subject`, `attachments` (shared by all attachments), `body`
+            and `excerpt_context` (characters kept on each side of a keyword in an excerpt)
+    """
+    return {
+        "total": int(os.getenv("PROMPT_MAX_EMAIL_TOKENS", "12000")),
+        "subject": int(os.getenv("PROMPT_SUBJECT_TOKENS", "200")),
+        "attachments": int(os.getenv("PROMPT_ATTACHMENT_TOKENS", "6000")),
+        "body": int(os.getenv("PROMPT_BODY_TOKENS", "6000")),
+        "excerpt_context": int(os.getenv("PROMPT_EXCERPT_CONTEXT_CHARS", "300"))
+    }
+
+
+def share_budget(needs: List[int], budget: int) -> List[int]:
+    """
+    Split a budget so that small items get everything they need and large ones share the rest equally.
+
+    Args:
+        needs (List[int]): Tokens each item would use untruncated
+        budget (int): Tokens available to all items
+
+    Returns:
+        List[int]: Tokens allowed per item, in the order of `needs`
+    """
+    allowed = [0] * len(needs)
+    remaining = budget
+    for position, i in enumerate(sorted(range(len(needs)), key=lambda i: (needs[i], i))):
+        allowed[i] = min(needs[i], remaining // (len(needs) - position))
+        remaining -= allowed[i]
+    return allowed
+
+
+def _cut(text: str, max_chars: int) -> str:
+    # End on a word boundary where one is near
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind(" ", max_chars // 2, max_chars)
+    return text[:cut if cut > 0 else max_chars]
+
+
+def excerpt(text: str, max_tokens: int, matcher: KeywordMatcher, context_chars: int = 300) -> str:
+    """
+    Shorten a text to about `max_tokens` tokens.
+
+    The first half of the budget keeps the opening of the text; the rest keeps the passages around
+    keyword matches after it, in document order, with OMISSION_MARKER wherever text was dropped.
+
+    Args:
+        text (str): Text to shorten
+        max_tokens (int): Token budget
+        matcher (KeywordMatcher): Finds the passages worth keeping
+        context_chars (int): Characters kept on each side of a keyword
+
+    Returns:
+        str: The text itself if it fits, otherwise the excerpt
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    max_chars = max(0, max_tokens * CHARS_PER_TOKEN - len(OMISSION_MARKER))
+    head = _cut(text, max_chars // 2)
+    remaining = max_chars - len(head)
+
+    # Merge overlapping windows around the keywords that follow the head
+    windows: List[List[int]] = []
+    for match in matcher.scan(text):
+        if match["start"] < len(head):
+            continue
+        start, end = max(len(head), match["start"] - context_chars), match["end"] + context_chars
+        if windows and start <= windows[-1][1]:
+            windows[-1][1] = max(windows[-1][1], end)
+        else:
+            windows.append([start, end])
+
+    parts = [head]
+    for start, end in windows:
+        remaining -= len(OMISSION_MARKER)
+        if remaining <= 0:
+            break
+        passage = _cut(text[start:end], remaining)
+        parts.append(passage)
+        remaining -= len(passage)
+    return OMISSION_MARKER.join(parts) + OMISSION_MARKER
+
+
+class PromptBuilder:
+    def __init__(self, system_prompt: str, budgets: Optional[Dict[str, int]] = None, matcher: Optional[KeywordMatcher] = None):
+        """
+        Initialize the builder.
+
+        Args:
+            system_prompt (str): System prompt text, counted towards every request's usage
+            budgets (Optional[Dict[str, int]]): Budgets as returned by get_prompt_budgets(); defaults to the configured ones
+            matcher (Optional[KeywordMatcher]): Keyword matcher; defaults to the shared one
+        """
+        self.budgets = budgets or get_prompt_budgets()
+        self.matcher = matcher or get_keyword_matcher()
+        self.system_tokens = estimate_tokens(system_prompt)
+
+    def build(self, email_data: Dict[str, Any]) -> Tuple[Dict[str, str], Dict[str, int]]:
+        """
+        Build the human message inputs for an email within the budgets.
+
+        Args:
+            email_data (Dict[str, Any]): Parsed email
+
+        Returns:
+            Tuple[Dict[str, str], Dict[str, int]]: Values for the human message template, and the token
+                usage: `<section>_tokens` as sent, `<section>_original_tokens`, `system_tokens` and `total_tokens`
+        """
+        budgets = self.budgets
+        remaining = budgets["total"]
+        usage: Dict[str, int] = {"system_tokens": self.system_tokens}
+
+        subject = email_data.get("subject", "N/A")
+        subject_budget = min(budgets["subject"], remaining)
+        sent_subject = _cut(subject, subject_budget * CHARS_PER_TOKEN)
+        usage["subject_original_tokens"] = estimate_tokens(subject)
+        usage["subject_tokens"] = estimate_tokens(sent_subject)
+        remaining -= usage["subject_tokens"]
+
+        attachments = email_data.get("attachments", [])
+        contents = [attachment.get("content", "N/A") for attachment in attachments]
+        needs = [estimate_tokens(content) for content in contents]
+        allowed = share_budget(needs, min(budgets["attachments"], remaining))
+        attachments_json = []
+        for attachment, content, tokens in zip(attachments, contents, allowed):
+            attachments_json.append({
+                "filename": attachment.get("name", "N/A"),
+                "content": excerpt(content, tokens, self.matcher, budgets["excerpt_context"])
+            })
+        sent_attachments = json.dumps(attachments_json)
+        usage["attachments_original_tokens"] = sum(needs)
+        usage["attachments_tokens"] = estimate_tokens(sent_attachments)
+        remaining -= usage["attachments_tokens"]
+
+        body = email_data.get("body", "")
+        sent_body = excerpt(body, max(0, min(budgets["body"], remaining)), self.matcher, budgets["excerpt_context"])
+        usage["body_original_tokens"] = estimate_tokens(body)
+        usage["body_tokens"] = estimate_tokens(sent_body)
+
+        # Keywords are detected on the full email, so excerpts do not hide them
+        matched_keywords = self.matcher.matched_keywords(email_data)
+        inputs = {
+            "email_subject": sent_subject,
+            "email_sender": email_data.get("sender", "N/A"),
+            "email_body": sent_body,
+            "email_attachments_json": sent_attachments,
+            "keywords": ", ".join(matched_keywords) if matched_keywords else "None"
+        }
+        usage["total_tokens"] = self.system_tokens + estimate_tokens("".join(inputs.values()))
+        return inputs, usage
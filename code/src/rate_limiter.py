@@ -0,0 +1,128 @@
+"""
+Client-side rate limiting for LLM calls.
+
+Two token buckets, one for requests and one for tokens per minute, keep concurrent classification
+under the provider's quotas. Buckets hold no asyncio primitives, so one shared limiter can be used
+from successive event loops.
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+from typing import Optional
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for quota accounting: about four characters per token."""
+    return len(text or "") // 4 + 1
+
+
+def backoff_delay(attempt: int, base: Optional[float] = None, cap: Optional[float] = None) -> float:
+    """
+    Get a full-jitter exponential backoff delay.
+
+    Args:
+        attempt (int): Zero-based retry number
+        base (Optional[float]): Delay scale in seconds; defaults to LLM_RETRY_BASE_SECONDS
+        cap (Optional[float]): Largest delay in seconds; defaults to LLM_RETRY_MAX_SECONDS
+
+    Returns:
+        float: Seconds to wait, uniformly drawn from [0, min(cap, base * 2 ** attempt)]
+    """
+    base = base or float(os.getenv("LLM_RETRY_BASE_SECONDS", "1"))
+    cap = cap or float(os.getenv("LLM_RETRY_MAX_SECONDS", "30"))
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        """
+        Initialize a bucket that starts full.
+
+        Args:
+            rate_per_minute (float): Refill rate
+            capacity (Optional[float]): Largest burst; defaults to one minute's worth
+        """
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def wait_time(self, amount: float) -> float:
+        """
+        Get how long until `amount` tokens are available.
+
+        Args:
+            amount (float): Tokens wanted; capped at the capacity so oversized requests can still proceed
+
+        Returns:
+            float: Seconds to wait, 0 if the tokens are available now
+        """
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate_per_second)
+        self._updated = now
+        amount = min(amount, self.capacity)
+        return 0.0 if self._tokens >= amount else (amount - self._tokens) / self.rate_per_second
+
+    def take(self, amount: float):
+        """Remove tokens; call after wait_time() returned 0."""
+        self._tokens -= min(amount, self.capacity)
+
+
+class LLMRateLimiter:
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None):
+        """
+        Initialize the limiter.
+
+        Args:
+            requests_per_minute (Optional[float]): Defaults to LLM_REQUESTS_PER_MINUTE
+            tokens_per_minute (Optional[float]): Defaults to LLM_TOKENS_PER_MINUTE
+        """
+        self.requests = TokenBucket(requests_per_minute or float(os.getenv("LLM_REQUESTS_PER_MINUTE", "60")))
+        self.tokens = TokenBucket(tokens_per_minute or float(os.getenv("LLM_TOKENS_PER_MINUTE", "1000000")))
+        self._lock = threading.Lock()
+        self.waited_seconds = 0.0
+
+    def _try_acquire(self, tokens: int) -> float:
+        with self._lock:
+            # Only take from either bucket once both can pay, so waiting never wastes capacity
+            wait = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+            if wait == 0:
+                self.requests.take(1)
+                self.tokens.take(tokens)
+            return wait
+
+    async def acquire(self, tokens: int):
+        """
+        Wait until one request of about `tokens` tokens fits within both quotas.
+
+        Args:
+            tokens (int): Estimated prompt plus completion tokens
+        """
+        while True:
+            wait = self._try_acquire(tokens)
+            if wait <= 0:
+                return
+            self.waited_seconds += wait
+            await asyncio.sleep(wait)
+
+
+_shared_limiter: Optional[LLMRateLimiter] = None
+_shared_limiter_lock = threading.Lock()
+
+
+def get_llm_rate_limiter() -> LLMRateLimiter:
+    """
+    Get the process-wide LLM rate limiter.
+
+    Returns:
+        LLMRateLimiter: Shared limiter
+    """
+    global _shared_limiter
+    if _shared_limiter is None:
+        with _shared_limiter_lock:
+            if _shared_limiter is None:
+                _shared_limiter = LLMRateLimiter()
+    return _shared_limiter
@@ -0,0 +1,80 @@
+"""
+In-process cache of serialized API pages, keyed by the emails version they were built from.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+
+def make_etag(version: str, key: str) -> str:
+    """
+    Build the ETag for a page.
+
+    Args:
+        version (str): Emails version the page reflects
+        key (str): Normalized request parameters
+
+    Returns:
+        str: Quoted ETag
+    """
+    return '"' + hashlib.sha1(f"{version}|{key}".encode("utf-8")).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header against an ETag, ignoring weak validator prefixes."""
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or etag in [candidate[2:] if candidate.startswith("W/") else candidate for candidate in candidates]
+
+
+class PageCache:
+    def __init__(self, max_entries: Optional[int] = None):
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries (Optional[int]): Pages kept per version; defaults to RESPONSE_CACHE_MAX_ENTRIES
+        """
+        self.max_entries = max_entries or int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "256"))
+        self._pages: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "not_modified": 0, "invalidations": 0}
+
+    def get(self, version: str, key: str) -> Optional[str]:
+        """Get the serialized page for `key` built at `version`, if cached."""
+        with self._lock:
+            body = self._pages.get((version, key))
+            if body is None:
+                self._stats["misses"] += 1
+                return None
+            self._pages.move_to_end((version, key))
+            self._stats["hits"] += 1
+            return body
+
+    def put(self, version: str, key: str, body: str):
+        """Cache a serialized page."""
+        with self._lock:
+            self._pages[(version, key)] = body
+            self._pages.move_to_end((version, key))
+            while len(self._pages) > self.max_entries:
+                self._pages.popitem(last=False)
+
+    def invalidate(self, *_):
+        """Drop every cached page; used as the change feed listener."""
+        with self._lock:
+            self._pages.clear()
+            self._stats["invalidations"] += 1
+
+    def record_not_modified(self):
+        """Count a request answered with 304."""
+        with self._lock:
+            self._stats["not_modified"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get hit, miss, 304 and invalidation counters."""
+        with self._lock:
+            return dict(self._stats, entries=len(self._pages))
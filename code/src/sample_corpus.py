@@ -0,0 +1,73 @@
+"""
+Loader for the sample emails and attachments in code/test, used by the benchmark scripts.
+"""
+
+import email
+import os
+from email import policy
+from typing import Dict, Any, List, Optional
+
+from extraction_utils import extract_text_from_pdf, extract_text_from_html
+
+SAMPLE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test")
+
+
+def parse_eml(raw_email: bytes) -> Dict[str, Any]:
+    """
+    Parse a raw email into the same shape EmailMonitor produces.
+    Image attachments are skipped so the corpus can be built without OCR credentials.
+
+    Args:
+        raw_email (bytes): RFC 822 message
+
+    Returns:
+        Dict[str, Any]: Email with subject, sender, recipients, body and attachments
+    """
+    msg = email.message_from_bytes(raw_email, policy=policy.compat32)
+    body = ""
+    attachments = []
+    for part in msg.walk() if msg.is_multipart() else [msg]:
+        content_type = part.get_content_type()
+        filename = part.get_filename()
+        if filename and filename.lower().endswith(".pdf"):
+            attachments.append({"name": filename, "content": extract_text_from_pdf(part.get_payload(decode=True))})
+        elif content_type == "text/plain" and not filename:
+            body = (part.get_payload(decode=True) or b"").decode(errors="ignore")
+        elif content_type == "text/html" and not filename and not body:
+            body = extract_text_from_html((part.get_payload(decode=True) or b"").decode(errors="ignore"))
+    return {
+        "subject": msg.get("Subject", "N/A"),
+        "sender": msg.get("From", "N/A"),
+        "recipients": [address.strip() for address in msg.get("To", "").split(",") if address.strip()],
+        "body": body.strip(),
+        "attachments": attachments
+    }
+
+
+def load_sample_emails(sample_dir: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Load every .eml file in the sample directory, plus each standalone PDF as a one-attachment email.
+
+    Args:
+        sample_dir (Optional[str]): Directory to read; defaults to code/test
+
+    Returns:
+        List[Dict[str, Any]]: Parsed emails, sorted by file name
+    """
+    sample_dir = sample_dir or SAMPLE_DIR
+    emails = []
+    for filename in sorted(os.listdir(sample_dir)):
+        path = os.path.join(sample_dir, filename)
+        if filename.lower().endswith(".eml"):
+            with open(path, "rb") as f:
+                emails.append(parse_eml(f.read()))
+        elif filename.lower().endswith(".pdf"):
+            with open(path, "rb") as f:
+                emails.append({
+                    "subject": filename,
+                    "sender": "N/A",
+                    "recipients": [],
+                    "body": "",
+                    "attachments": [{"name": filename, "content": extract_text_from_pdf(f.read())}]
+                })
+    return emails